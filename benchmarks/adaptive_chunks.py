@@ -0,0 +1,83 @@
+"""
+Загрузка диапазонами адаптивного размера (AdaptiveChunkHttpFD) против
+штатной загрузки одним запросом на локальном сервере, который замедляет
+длинное чтение (standins.ThrottlingHandler). Содержимое обоих файлов
+сверяется по хешу с исходными данными.
+
+Запуск: python benchmarks/adaptive_chunks.py [--size МБ] [--fast-mb МБ] [--slow-rate МБ/С]
+Завершается с кодом 1, если файл повреждён или загрузка диапазонами не быстрее.
+"""
+
+import argparse
+import hashlib
+import os
+import sys
+import time
+from typing import Any, Dict, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import standins
+
+WORKDIR = standins.prepare()
+
+import video
+
+SERVICE = 'Benchmark'
+
+
+def download(url: str, name: str, adaptive: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    filename = os.path.join(WORKDIR, name)
+    params: Dict[str, Any] = {'quiet': True, 'noprogress': True, 'continuedl': False}
+    if adaptive is not None:
+        params['adaptive_chunks'] = adaptive
+    info = {'id': name, 'url': url, 'ext': 'mp4', 'protocol': 'http', 'http_headers': {}}
+    started = time.monotonic()
+    with video.VideoDownloaderYDL(params) as ydl:
+        success, _ = ydl.dl(filename, info)
+    elapsed = time.monotonic() - started
+    return {'success': success, 'seconds': elapsed, 'sha256': standins.sha256(filename) if success else None,
+            'rate': os.path.getsize(filename) / elapsed if success else 0.0}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', type=float, default=12, help='размер файла, МБ')
+    parser.add_argument('--fast-mb', type=float, default=2, help='сколько МБ ответа сервер отдаёт быстро')
+    parser.add_argument('--slow-rate', type=float, default=1.5, help='скорость после замедления, МБ/с')
+    args = parser.parse_args()
+
+    data = standins.payload(int(args.size * 1024 * 1024))
+    expected = hashlib.sha256(data).hexdigest()
+    _, base_url = standins.serve(standins.ThrottlingHandler, data=data,
+                                 fast_bytes=int(args.fast_mb * 1024 * 1024),
+                                 slow_rate=args.slow_rate * 1024 * 1024)
+    url = f'{base_url}/clip.mp4'
+
+    results = {
+        'plain': download(url, 'plain.mp4', None),
+        'adaptive': download(url, 'adaptive.mp4', {'service': SERVICE}),
+    }
+    failures = []
+    for name, result in results.items():
+        intact = result['success'] and result['sha256'] == expected
+        if not intact:
+            failures.append(f'файл {name} не совпадает с исходным')
+        standins.report(f'Загрузка ({name})', {
+            'время, с': f"{result['seconds']:.2f}",
+            'скорость': f"{video.format_bytes(result['rate'])}/с",
+            'хеш': 'совпадает' if intact else 'НЕ совпадает',
+        })
+    print(f'Подобранный размер диапазона {SERVICE}: {video.format_bytes(video.chunk_sizes.get(SERVICE))}')
+
+    plain, adaptive = results['plain'], results['adaptive']
+    if adaptive['seconds'] >= plain['seconds']:
+        failures.append('загрузка диапазонами не быстрее штатной')
+    for failure in failures:
+        print(f'Ошибка: {failure}')
+    if not failures:
+        print(f"Загрузка диапазонами: {plain['seconds'] / adaptive['seconds']:.2f}x быстрее")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
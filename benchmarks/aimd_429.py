@@ -0,0 +1,131 @@
+"""
+Подбор числа одновременных загрузок (ConcurrencyController) против локального
+сервера, который отвечает 429 Too Many Requests сверх max_active одновременных
+запросов (standins.RateLimitHandler). Загрузки запускаются так же, как в
+DownloadManager: пока заняты не все слоты сервиса; раз в интервал контроллер
+получает общее число байт, ошибки загрузок — через on_finished.
+
+Запуск: python benchmarks/aimd_429.py [--duration СЕКУНД] [--max-active N] [--interval СЕКУНД]
+Завершается с кодом 1, если предел не дорос до max_active, не уменьшился
+после ответов 429 или превысил максимум контроллера.
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import standins
+
+WORKDIR = standins.prepare()
+
+import video
+
+SERVICE = 'Benchmark'
+
+
+class Workload:
+    """Загрузки с сервера-заменителя и общий счётчик полученных байт."""
+
+    def __init__(self, url: str, controller: video.ConcurrencyController) -> None:
+        self.url = url
+        self.controller = controller
+        self.lock = threading.Lock()
+        self.active = 0
+        self.started = 0
+        self.completed = 0
+        self.throttled = 0
+        self.total_bytes = 0
+
+    def _count(self, status: Dict[str, Any], seen: Dict[str, int]) -> None:
+        downloaded = status.get('downloaded_bytes') or 0
+        with self.lock:
+            self.total_bytes += max(downloaded - seen.get('bytes', 0), 0)
+        seen['bytes'] = downloaded
+
+    def _download(self, number: int) -> None:
+        seen: Dict[str, int] = {}
+        params = {'quiet': True, 'noprogress': True, 'continuedl': False, 'retries': 0,
+                  'progress_hooks': [lambda status: self._count(status, seen)]}
+        info = {'id': str(number), 'url': f'{self.url}/{number}.mp4', 'ext': 'mp4',
+                'protocol': 'http', 'http_headers': {}}
+        success, message = False, ""
+        try:
+            with video.VideoDownloaderYDL(params) as ydl:
+                success, _ = ydl.dl(os.path.join(WORKDIR, f'{number}.mp4'), info)
+        except Exception as e:
+            message = str(e)
+        with self.lock:
+            self.active -= 1
+            if success:
+                self.completed += 1
+            elif video.classify_failure(message) == 'throttle':
+                self.throttled += 1
+        self.controller.on_finished(SERVICE, success, message)
+
+    def fill(self) -> None:
+        """Запускает загрузки, пока заняты не все слоты сервиса."""
+        while True:
+            with self.lock:
+                if self.active >= self.controller.limit(SERVICE):
+                    return
+                self.active += 1
+                self.started += 1
+                number = self.started
+            threading.Thread(target=self._download, args=(number,), daemon=True).start()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--max-active', type=int, default=4, help='одновременных запросов без 429')
+    parser.add_argument('--interval', type=float, default=1.0, help='интервал пересчёта предела, с')
+    parser.add_argument('--size', type=float, default=3, help='размер файла, МБ')
+    args = parser.parse_args()
+
+    maximum = args.max_active + 2
+    server, base_url = standins.serve(standins.RateLimitHandler, data=standins.payload(int(args.size * 1024 * 1024)),
+                                      max_active=args.max_active)
+    controller = video.ConcurrencyController(initial=2, minimum=1, maximum=maximum, interval=args.interval)
+    workload = Workload(base_url, controller)
+
+    timeline: List[int] = [controller.limit(SERVICE)]
+    decreased_after_429 = False
+    started = next_tick = time.monotonic()
+    while time.monotonic() - started < args.duration:
+        workload.fill()
+        now = time.monotonic()
+        if now >= next_tick:
+            with workload.lock:
+                total_bytes, active, throttled = workload.total_bytes, workload.active, workload.throttled
+            controller.tick(SERVICE, total_bytes, active)
+            limit = controller.limit(SERVICE)
+            decreased_after_429 |= throttled > 0 and limit < max(timeline)
+            timeline.append(limit)
+            next_tick = now + args.interval
+        time.sleep(0.05)
+    elapsed = time.monotonic() - started
+
+    standins.report('Подбор числа одновременных загрузок', {
+        'предел по интервалам': ' '.join(map(str, timeline)),
+        'загрузок завершено': workload.completed,
+        'ответов 429': server.RequestHandlerClass.rejected,
+        'средняя скорость': f"{video.format_bytes(workload.total_bytes / elapsed)}/с",
+    })
+    failures = []
+    if max(timeline) < args.max_active:
+        failures.append(f'предел не дорос до {args.max_active}')
+    if not decreased_after_429:
+        failures.append('предел не уменьшился после ответов 429')
+    if max(timeline) > maximum:
+        failures.append(f'предел превысил максимум {maximum}')
+    for failure in failures:
+        print(f'Ошибка: {failure}')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
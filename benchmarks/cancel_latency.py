@@ -0,0 +1,112 @@
+"""
+Задержка отмены загрузки (от cancel() до завершения потока загрузки) на
+локальных серверах-заменителях, в трёх фазах:
+
+- extract  — сервер не отвечает на запрос метаданных;
+- download — сервер отдал начало файла и перестал отвечать;
+- process  — выполняется дочерний процесс (вместо ffmpeg — спящий python).
+
+Запуск: python benchmarks/cancel_latency.py [--runs N] [--limit СЕКУНД]
+Завершается с кодом 1, если отмена в какой-либо фазе дольше limit.
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from typing import Callable, List
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import standins
+
+WORKDIR = standins.prepare()
+
+import video
+from PyQt6.QtCore import Qt
+
+
+def cancel_runnable(url: str, ready: Callable[[video.DownloadRunnable], bool], timeout: float = 20.0) -> float:
+    """
+    Запускает DownloadRunnable в потоке, ждёт ready(runnable), отменяет загрузку
+    и возвращает время от отмены до сигнала finished и завершения потока.
+    """
+    output_dir = os.path.join(WORKDIR, 'downloads')
+    runnable = video.DownloadRunnable(url, 'audio', None, output_dir)
+    finished = threading.Event()
+    runnable.signals.finished.connect(lambda *args: finished.set(), Qt.ConnectionType.DirectConnection)
+    thread = threading.Thread(target=runnable.run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + timeout
+    while not ready(runnable):
+        if time.monotonic() > deadline or not thread.is_alive():
+            raise RuntimeError(f'Загрузка {url} не дошла до нужной фазы')
+        time.sleep(0.05)
+    started = time.monotonic()
+    runnable.cancel()
+    finished.wait(timeout)
+    thread.join(timeout)
+    if thread.is_alive():
+        return float('inf')
+    return time.monotonic() - started
+
+
+def cancel_extract(base_url: str) -> float:
+    # Фаза извлечения: соединение с сервером открыто, заголовков ответа нет
+    return cancel_runnable(f'{base_url}/extract.mp4', lambda runnable: bool(runnable.cancel_scope._sockets))
+
+
+def cancel_download(base_url: str) -> float:
+    return cancel_runnable(f'{base_url}/download.mp4', lambda runnable: runnable.bytes_transferred > 0)
+
+
+def cancel_process() -> float:
+    scope = video.CancelScope()
+    done = threading.Event()
+
+    def run() -> None:
+        with scope.bind():
+            video.YDLPopen.run([sys.executable, '-c', 'import time; time.sleep(60)'])
+        done.set()
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    while not scope._processes:
+        time.sleep(0.05)
+    started = time.monotonic()
+    scope.cancel()
+    done.wait(20)
+    return time.monotonic() - started if done.is_set() else float('inf')
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--limit', type=float, default=2.0, help='допустимая задержка отмены, с')
+    args = parser.parse_args()
+
+    data = standins.payload(8 * 1024 * 1024)
+    _, stalled_body = standins.serve(standins.StallingHandler, data=data)
+    _, stalled_headers = standins.serve(standins.StallingHandler, data=data, stall_headers=True)
+    phases = {
+        'extract': lambda: cancel_extract(stalled_headers),
+        'download': lambda: cancel_download(stalled_body),
+        'process': cancel_process,
+    }
+
+    failed = False
+    for phase, measure in phases.items():
+        latencies: List[float] = [measure() for _ in range(args.runs)]
+        worst = max(latencies)
+        failed |= worst > args.limit
+        standins.report(f'Отмена в фазе {phase}', {
+            'медиана, с': f'{statistics.median(latencies):.3f}',
+            'максимум, с': f'{worst:.3f}',
+            'результат': 'OK' if worst <= args.limit else f'дольше {args.limit} с',
+        })
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,142 @@
+"""
+Пул исходящих адресов (EgressPool) на локальных прокси-заменителях: один
+прокси исправен, второй отвечает 429 Too Many Requests (standins.ProxyHandler).
+Проверяются:
+
+- least_loaded — одновременные загрузки распределяются по адресам поровну;
+- sticky — каждый сервис всё время получает один и тот же адрес;
+- исключение — адрес, ответивший 429, исключается на EGRESS_EXCLUDE_SECONDS и
+  больше не выдаётся; когда исключены все адреса, загрузка идёт напрямую.
+
+Запуск: python benchmarks/egress_pool.py
+Завершается с кодом 1, если какая-либо проверка не пройдена.
+"""
+
+import hashlib
+import os
+import sys
+import time
+from collections import Counter
+from typing import List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import standins
+
+standins.prepare()
+
+import config
+import video
+
+# Проверки доступности в фоне не нужны: исключение проверяется по ответам 429
+config.EGRESS_HEALTH_INTERVAL = 0
+
+
+class Bench:
+    def __init__(self) -> None:
+        self.data = standins.payload(256 * 1024)
+        self.expected = hashlib.sha256(self.data).hexdigest()
+        _, self.origin = standins.serve(standins.RangeFileHandler, data=self.data)
+        config.EGRESS_HEALTH_URL = f'{self.origin}/health'
+        self.healthy_server, self.healthy = standins.serve(standins.ProxyHandler)
+        self.throttled_server, self.throttled = standins.serve(standins.ProxyHandler, status=429)
+        self.failures: List[str] = []
+
+    def expect(self, condition: bool, failure: str) -> None:
+        if not condition:
+            self.failures.append(failure)
+
+    def pool(self, policy: str) -> video.EgressPool:
+        return video.EgressPool([self.healthy, self.throttled], policy)
+
+    def proxy_requests(self) -> Tuple[int, int]:
+        return (self.healthy_server.RequestHandlerClass.requests,
+                self.throttled_server.RequestHandlerClass.requests)
+
+    def download(self, address: Optional[str]) -> str:
+        """Загружает файл через address (None — напрямую); возвращает сообщение об ошибке или ""."""
+        params = {'quiet': True, 'no_warnings': True, 'socket_timeout': 10, **video.EgressPool.ydl_options(address)}
+        try:
+            with video.VideoDownloaderYDL(params) as ydl:
+                body = ydl.urlopen(f'{self.origin}/clip.mp4').read()
+        except Exception as e:
+            return str(e)
+        return "" if hashlib.sha256(body).hexdigest() == self.expected else "содержимое не совпадает"
+
+    def least_loaded(self) -> None:
+        pool = self.pool('least_loaded')
+        addresses = [pool.acquire('YouTube') for _ in range(6)]
+        counts = Counter(addresses)
+        for address in addresses:
+            pool.release(address)
+        standins.report('least_loaded: 6 одновременных загрузок', {
+            'исправный прокси': counts[self.healthy], 'прокси с 429': counts[self.throttled]})
+        self.expect(counts[self.healthy] == counts[self.throttled] == 3, 'least_loaded: загрузки распределены неравномерно')
+
+    def sticky(self) -> None:
+        pool = self.pool('sticky')
+        assigned = {'YouTube': set(), 'VK': set()}
+        for _ in range(5):
+            held = {service: pool.acquire(service) for service in assigned}
+            for service, address in held.items():
+                assigned[service].add(address)
+                pool.release(address)
+        standins.report('sticky: 5 загрузок на сервис', {
+            service: ', '.join(sorted(addresses)) for service, addresses in assigned.items()})
+        self.expect(all(len(addresses) == 1 for addresses in assigned.values()),
+                    'sticky: сервис получал разные адреса')
+        self.expect(assigned['YouTube'] != assigned['VK'], 'sticky: сервисы не распределены по адресам')
+
+    def exclusion(self) -> None:
+        pool = self.pool('least_loaded')
+        # Две одновременные загрузки: по одной на каждый адрес
+        held = [pool.acquire('YouTube'), pool.acquire('YouTube')]
+        errors = {address: self.download(address) for address in held}
+        for address, error in errors.items():
+            pool.release(address, error)
+        excluded_for = pool._endpoints[self.throttled]['excluded_until'] - time.time()
+        self.expect(not errors[self.healthy], f'загрузка через исправный прокси не удалась: {errors[self.healthy]}')
+        self.expect(video.classify_failure(errors[self.throttled]) == 'throttle',
+                    f'ответ прокси с 429 не распознан как ограничение: {errors[self.throttled]}')
+        self.expect(abs(excluded_for - config.EGRESS_EXCLUDE_SECONDS) < 5,
+                    f'прокси с 429 исключён на {excluded_for:.0f} с вместо {config.EGRESS_EXCLUDE_SECONDS}')
+
+        throttled_before = self.proxy_requests()[1]
+        later = [pool.acquire('YouTube') for _ in range(4)]
+        for address in later:
+            pool.release(address, self.download(address))
+        self.expect(set(later) == {self.healthy}, 'исключённый адрес выдан снова')
+        self.expect(self.proxy_requests()[1] == throttled_before, 'запросы шли через исключённый прокси')
+        self.expect(pool.check(self.healthy), 'проверка доступности исправного прокси не пройдена')
+        self.expect(not pool.check(self.throttled), 'проверка доступности прокси с 429 пройдена')
+
+        # Исправный прокси тоже упирается в ограничение — остаётся прямое подключение
+        self.healthy_server.RequestHandlerClass.status = 429
+        address = pool.acquire('YouTube')
+        pool.release(address, self.download(address))
+        requests_before = self.proxy_requests()
+        direct = pool.acquire('YouTube')
+        direct_error = self.download(direct)
+        pool.release(direct, direct_error)
+        standins.report('Исключение адресов', {
+            'прокси с 429 исключён на, с': f'{excluded_for:.0f}',
+            'адреса после исключения': ', '.join(sorted(set(later))),
+            'адрес, когда исключены все': direct or 'прямое подключение',
+            'прямая загрузка': direct_error or 'OK',
+        })
+        self.expect(direct is None, 'при исключённых адресах выдан адрес пула')
+        self.expect(not direct_error, f'прямая загрузка не удалась: {direct_error}')
+        self.expect(self.proxy_requests() == requests_before, 'прямая загрузка прошла через прокси')
+
+
+def main() -> int:
+    bench = Bench()
+    bench.least_loaded()
+    bench.sticky()
+    bench.exclusion()
+    for failure in bench.failures:
+        print(f'Ошибка: {failure}')
+    return 1 if bench.failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,171 @@
+"""
+Время запроса форматов (ResolutionWorker.extract_formats): быстрый запрос по
+профилю сервиса против полного извлечения. Ответы сервиса воспроизводятся из
+записи (fixtures/probe_youtube.json) с задержкой rtt на каждый запрос, поэтому
+замер не зависит от сети; число запросов и найденные разрешения сравниваются.
+
+Запуск: python benchmarks/probe_latency.py [--runs N] [--rtt СЕКУНД] [--fixture ФАЙЛ]
+Запись новых ответов (нужен доступ в интернет):
+        python benchmarks/probe_latency.py --record URL --fixture ФАЙЛ
+Завершается с кодом 1, если быстрый запрос не быстрее полного или находит
+другие разрешения.
+"""
+
+import argparse
+import io
+import json
+import os
+import statistics
+import sys
+import time
+from typing import Any, Dict, List, Tuple
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import standins
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_FIXTURE = os.path.join(HERE, 'fixtures', 'probe_youtube.json')
+
+standins.prepare()
+
+import video
+from yt_dlp.networking import Response
+from yt_dlp.networking.exceptions import HTTPError
+
+
+def request_url(request: Any) -> str:
+    return request if isinstance(request, str) else request.url
+
+
+class Replay:
+    """
+    Подставляет записанные ответы вместо сетевых запросов YoutubeDL. Ответы
+    одного адреса отдаются по порядку (последний повторяется); адрес без
+    точного совпадения сравнивается без строки запроса; остальные — 404.
+    """
+
+    def __init__(self, responses: List[Dict[str, Any]], rtt: float) -> None:
+        self.rtt = rtt
+        self.requests: List[str] = []
+        self._exact: Dict[str, List[Dict[str, Any]]] = {}
+        self._by_path: Dict[str, List[Dict[str, Any]]] = {}
+        for response in responses:
+            self._exact.setdefault(response['url'], []).append(response)
+            self._by_path.setdefault(self._path(response['url']), []).append(response)
+        self._served: Dict[str, int] = {}
+
+    @staticmethod
+    def _path(url: str) -> str:
+        parts = urlsplit(url)
+        return f'{parts.netloc}{parts.path}'
+
+    def _find(self, url: str) -> Tuple[str, List[Dict[str, Any]]]:
+        if url in self._exact:
+            return url, self._exact[url]
+        path = self._path(url)
+        return path, self._by_path.get(path, [])
+
+    def urlopen(self, ydl: Any, request: Any) -> Response:
+        url = request_url(request)
+        self.requests.append(url)
+        time.sleep(self.rtt)
+        key, candidates = self._find(url)
+        if not candidates:
+            raise HTTPError(Response(io.BytesIO(b''), url, {}, status=404))
+        index = self._served.get(key, 0)
+        self._served[key] = index + 1
+        recorded = candidates[min(index, len(candidates) - 1)]
+        response = Response(io.BytesIO(recorded['body'].encode('utf-8')), url,
+                            recorded.get('headers') or {}, status=recorded['status'])
+        if recorded['status'] >= 400:
+            raise HTTPError(response)
+        return response
+
+    def install(self) -> None:
+        replay = self
+        video.VideoDownloaderYDL.urlopen = lambda ydl, request: replay.urlopen(ydl, request)
+
+
+def record(url: str, path: str) -> None:
+    """Выполняет быстрый и полный запрос к сервису и сохраняет все ответы."""
+    responses: List[Dict[str, Any]] = []
+    urlopen = video.VideoDownloaderYDL.urlopen
+
+    def recording_urlopen(ydl: Any, request: Any) -> Response:
+        try:
+            response = urlopen(ydl, request)
+        except HTTPError as e:
+            responses.append({'url': request_url(request), 'status': e.status, 'headers': {}, 'body': ''})
+            raise
+        body = response.read()
+        responses.append({'url': request_url(request), 'status': response.status,
+                          'headers': {'Content-Type': response.headers.get('Content-Type', '')},
+                          'body': body.decode('utf-8', errors='replace')})
+        return Response(io.BytesIO(body), response.url, response.headers, status=response.status)
+
+    video.VideoDownloaderYDL.urlopen = recording_urlopen
+    worker = video.ResolutionWorker(url)
+    for fast in (True, False):
+        worker.extract_formats(fast)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'description': f'Запись ответов для {url}', 'url': url, 'responses': responses},
+                  f, ensure_ascii=False, indent=1)
+    print(f'Записано ответов: {len(responses)} -> {path}')
+
+
+def measure(fixture: Dict[str, Any], fast: bool, runs: int, rtt: float) -> Dict[str, Any]:
+    worker = video.ResolutionWorker(fixture['url'])
+    latencies: List[float] = []
+    requests = 0
+    heights: List[int] = []
+    for _ in range(runs):
+        replay = Replay(fixture['responses'], rtt)
+        replay.install()
+        started = time.monotonic()
+        formats = worker.extract_formats(fast)
+        latencies.append(time.monotonic() - started)
+        requests = len(replay.requests)
+        heights = sorted({fmt['height'] for fmt in formats if fmt.get('height')})
+    return {'median': statistics.median(latencies), 'requests': requests, 'heights': heights}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--rtt', type=float, default=0.1, help='задержка одного запроса, с')
+    parser.add_argument('--fixture', default=DEFAULT_FIXTURE)
+    parser.add_argument('--record', metavar='URL', help='записать ответы сервиса для URL в --fixture')
+    args = parser.parse_args()
+
+    if args.record:
+        record(args.record, args.fixture)
+        return 0
+
+    with open(args.fixture, 'r', encoding='utf-8') as f:
+        fixture = json.load(f)
+    results = {name: measure(fixture, fast, args.runs, args.rtt)
+               for name, fast in (('fast', True), ('full', False))}
+    for name, result in results.items():
+        standins.report(f'Запрос форматов ({name})', {
+            'медиана, с': f"{result['median']:.3f}",
+            'запросов': result['requests'],
+            'разрешения': result['heights'],
+        })
+
+    fast, full = results['fast'], results['full']
+    failures = []
+    if fast['median'] >= full['median']:
+        failures.append('быстрый запрос не быстрее полного')
+    if fast['heights'] != full['heights']:
+        failures.append('быстрый запрос нашёл другие разрешения')
+    for failure in failures:
+        print(f'Ошибка: {failure}')
+    if not failures:
+        print(f"Быстрый запрос: {full['median'] / fast['median']:.2f}x быстрее, "
+              f"запросов меньше на {full['requests'] - fast['requests']}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
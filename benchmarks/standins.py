@@ -0,0 +1,274 @@
+"""
+Локальные серверы-заменители для замеров из каталога benchmarks.
+
+Каждый сервер отдаёт детерминированные данные (payload), поэтому результат
+загрузки можно сверить по размеру и хешу. Серверы запускаются в фоновом
+потоке функцией serve и не требуют доступа в интернет.
+"""
+
+import hashlib
+import http.client
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def prepare() -> str:
+    """
+    Подготавливает импорт video: добавляет корень репозитория в sys.path и
+    переходит во временный каталог, чтобы логи, настройки и загрузки замера
+    не попадали в репозиторий. Возвращает путь к этому каталогу.
+    """
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    workdir = tempfile.mkdtemp(prefix='vd_bench_')
+    os.chdir(workdir)
+    return workdir
+
+
+def payload(size: int) -> bytes:
+    """Детерминированные данные заданного размера."""
+    block = hashlib.sha256(b'video_dloader').digest() * 2048
+    return (block * (size // len(block) + 1))[:size]
+
+
+def sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class RangeFileHandler(BaseHTTPRequestHandler):
+    """
+    Отдаёт один файл (атрибут data) по любому пути, с поддержкой Range.
+    Скорость одного ответа ограничивается в send_body; подклассы меняют её
+    через rate_at.
+    """
+
+    protocol_version = 'HTTP/1.1'
+    data = b''
+    content_type = 'video/mp4'
+    BLOCK_SIZE = 64 * 1024
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _range(self) -> Optional[Tuple[int, int]]:
+        match = re.match(r'bytes=(\d+)-(\d*)$', self.headers.get('Range', ''))
+        if not match:
+            return None
+        start = int(match.group(1))
+        end = int(match.group(2)) if match.group(2) else len(self.data) - 1
+        return start, min(end, len(self.data) - 1)
+
+    def _send_headers(self) -> Tuple[int, int]:
+        byte_range = self._range()
+        start, end = byte_range or (0, len(self.data) - 1)
+        if byte_range and start >= len(self.data):
+            self.send_response(416)
+            self.send_header('Content-Range', f'bytes */{len(self.data)}')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return 0, -1
+        self.send_response(206 if byte_range else 200)
+        self.send_header('Content-Type', self.content_type)
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(end - start + 1))
+        if byte_range:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(self.data)}')
+        self.end_headers()
+        return start, end
+
+    def do_HEAD(self) -> None:
+        self._send_headers()
+
+    def do_GET(self) -> None:
+        start, end = self._send_headers()
+        if end >= start:
+            self.send_body(start, end)
+
+    def rate_at(self, sent: int) -> Optional[float]:
+        """Скорость (байт/с) после sent байт ответа; None — без ограничения."""
+        return None
+
+    def send_body(self, start: int, end: int) -> None:
+        sent, began = 0, time.monotonic()
+        position = start
+        try:
+            while position <= end:
+                block = self.data[position:min(position + self.BLOCK_SIZE, end + 1)]
+                self.wfile.write(block)
+                position += len(block)
+                sent += len(block)
+                rate = self.rate_at(sent)
+                if rate:
+                    # Выравниваем среднюю скорость ответа по заданной
+                    delay = sent / rate - (time.monotonic() - began)
+                    if delay > 0:
+                        time.sleep(delay)
+                    else:
+                        began = time.monotonic() - sent / rate
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+class ThrottlingHandler(RangeFileHandler):
+    """
+    Сервер, замедляющий длинное чтение: первые fast_bytes каждого ответа
+    отдаются без ограничения, дальше — со скоростью slow_rate.
+    """
+
+    fast_bytes = 2 * 1024 * 1024
+    slow_rate = 1.5 * 1024 * 1024
+
+    def rate_at(self, sent: int) -> Optional[float]:
+        return None if sent < self.fast_bytes else self.slow_rate
+
+
+class RateLimitHandler(RangeFileHandler):
+    """
+    Сервер с ограничением одновременных запросов: сверх max_active отвечает
+    429 Too Many Requests. Скорость одного ответа ограничена per_connection_rate,
+    поэтому общая скорость растёт с числом загрузок до max_active.
+    """
+
+    max_active = 4
+    per_connection_rate = 1024 * 1024
+    lock = threading.Lock()
+    active = 0
+    rejected = 0
+
+    def rate_at(self, sent: int) -> Optional[float]:
+        return self.per_connection_rate
+
+    def do_GET(self) -> None:
+        cls = type(self)
+        with cls.lock:
+            allowed = cls.active < cls.max_active
+            if allowed:
+                cls.active += 1
+            else:
+                cls.rejected += 1
+        if not allowed:
+            self.send_response(429)
+            self.send_header('Retry-After', '1')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        try:
+            super().do_GET()
+        finally:
+            with cls.lock:
+                cls.active -= 1
+
+
+class StallingHandler(RangeFileHandler):
+    """
+    Сервер, который отдаёт заголовки и начало файла (stall_after байт), а затем
+    перестаёт отвечать, не закрывая соединение. С stall_headers молчит сразу,
+    до заголовков ответа. Для замера отмены загрузки.
+    """
+
+    stall_after = 256 * 1024
+    stall_headers = False
+    stall_seconds = 60.0
+
+    def _send_headers(self) -> Tuple[int, int]:
+        if self.stall_headers:
+            time.sleep(self.stall_seconds)
+        return super()._send_headers()
+
+    def send_body(self, start: int, end: int) -> None:
+        try:
+            self.wfile.write(self.data[start:min(start + self.stall_after, end + 1)])
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            return
+        time.sleep(self.stall_seconds)
+
+
+class ProxyHandler(BaseHTTPRequestHandler):
+    """
+    HTTP-прокси (запросы с полным адресом, без CONNECT): пересылает GET и HEAD
+    на исходный сервер и передаёт ответ клиенту. С status отвечает этим кодом
+    сам, не обращаясь к серверу (status = 429 — прокси, упёршийся в ограничение
+    скорости). Счётчик requests — число полученных запросов.
+    """
+
+    protocol_version = 'HTTP/1.1'
+    status: Optional[int] = None
+    lock = threading.Lock()
+    requests = 0
+    FORWARD_HEADERS = ('Range', 'User-Agent', 'Accept', 'Accept-Encoding')
+    RETURN_HEADERS = ('Content-Type', 'Content-Length', 'Content-Range', 'Accept-Ranges')
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _forward(self, method: str) -> None:
+        cls = type(self)
+        with cls.lock:
+            cls.requests += 1
+        if cls.status is not None:
+            self.send_response(cls.status)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        target = urlsplit(self.path)
+        connection = http.client.HTTPConnection(target.hostname, target.port or 80, timeout=30)
+        try:
+            headers = {name: self.headers[name] for name in self.FORWARD_HEADERS if self.headers.get(name)}
+            connection.request(method, target.path + (f'?{target.query}' if target.query else ''), headers=headers)
+            response = connection.getresponse()
+            self.send_response(response.status)
+            for name in self.RETURN_HEADERS:
+                if response.getheader(name) is not None:
+                    self.send_header(name, response.getheader(name))
+            self.end_headers()
+            for block in iter(lambda: response.read(64 * 1024), b''):
+                self.wfile.write(block)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            connection.close()
+
+    def do_GET(self) -> None:
+        self._forward('GET')
+
+    def do_HEAD(self) -> None:
+        self._forward('HEAD')
+
+
+def serve(handler: type, **attributes: Any) -> Tuple[ThreadingHTTPServer, str]:
+    """
+    Запускает сервер с подклассом handler (атрибуты attributes задают данные и
+    параметры). Возвращает сервер и его базовый адрес.
+    """
+    handler_class = type(handler.__name__, (handler,), dict(attributes))
+    # Счётчики — свои у каждого сервера
+    if issubclass(handler_class, RateLimitHandler):
+        handler_class.lock = threading.Lock()
+        handler_class.active = handler_class.rejected = 0
+    if issubclass(handler_class, ProxyHandler):
+        handler_class.lock = threading.Lock()
+        handler_class.requests = 0
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler_class)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+def report(title: str, results: Dict[str, Any]) -> None:
+    print(title)
+    for name, value in results.items():
+        print(f'  {name}: {value}')
@@ -1,9 +1,167 @@
-from typing import Dict
+from typing import Dict, List
 
 APP_VERSION = "1.07"
 DEFAULT_RESOLUTION = "720p"
 OUTPUT_DIR = "downloads"
 
+# Папки для загрузок (например, на разных дисках) и выбор папки для каждой загрузки:
+# 'most_free' — где больше свободного места, 'round_robin' — по очереди,
+# 'service' — по OUTPUT_DIR_BY_SERVICE (для остальных сервисов — most_free)
+OUTPUT_DIRS = [OUTPUT_DIR]
+OUTPUT_PLACEMENT = 'most_free'
+OUTPUT_DIR_BY_SERVICE: Dict[str, str] = {}
+# Перед запуском загрузки резервируется место: оценённый размер плюс запас на
+# объединение/конвертацию (доля размера). Не поместившиеся загрузки откладываются
+MERGE_HEADROOM = 1.0
+UNKNOWN_SIZE_RESERVE = 512 * 1024 * 1024   # если размер заранее неизвестен
+MIN_FREE_SPACE = 256 * 1024 * 1024         # всегда оставлять свободным
+SPACE_RETRY_INTERVAL = 60                   # секунд между проверками места для отложенных
+
+# Параллельные загрузки и предварительное получение метаданных
+MAX_CONCURRENT_DOWNLOADS = 2
+PREFETCH_DEPTH = 5          # сколько следующих элементов очереди разбирать заранее
+PREFETCH_WORKERS = 2        # одновременных запросов метаданных
+METADATA_TTL = 1800         # секунд; ссылки на потоки в метаданных со временем истекают
+
+# Подбор числа одновременных загрузок для каждого сервиса (AIMD): MAX_CONCURRENT_DOWNLOADS —
+# начальный предел; раз в AIMD_INTERVAL секунд предел растёт на 1, если все слоты сервиса
+# заняты и ошибок не было, и умножается на AIMD_DECREASE при ошибках ограничения скорости
+# или сети либо падении скорости сервиса ниже AIMD_COLLAPSE_RATIO от средней
+AIMD_ENABLED = True
+AIMD_MIN_CONCURRENCY = 1
+AIMD_MAX_CONCURRENCY = 6        # на сервис; max_concurrent профиля ограничивает сильнее
+AIMD_MAX_TOTAL = 8              # всего одновременных загрузок
+AIMD_INTERVAL = 15
+AIMD_DECREASE = 0.5
+AIMD_COLLAPSE_RATIO = 0.5
+
+# Пул исходящих адресов: прокси ("socks5://127.0.0.1:1080", "http://host:3128") и/или
+# локальные адреса сетевых интерфейсов ("source:192.168.1.10"). Пустой список — прямое
+# подключение. 'least_loaded' — адрес с наименьшим числом загрузок, 'sticky' — один
+# адрес на сервис. Адрес, получивший ответ об ограничении скорости, исключается на
+# EGRESS_EXCLUDE_SECONDS; недоступные по проверке исключаются до следующей проверки
+EGRESS_POOL: List[str] = []
+EGRESS_POLICY = 'least_loaded'
+EGRESS_HEALTH_URL = 'https://www.google.com/generate_204'
+EGRESS_HEALTH_INTERVAL = 300    # секунд; 0 — без проверок
+EGRESS_EXCLUDE_SECONDS = 900
+EGRESS_THROTTLE_MARKERS = ['HTTP Error 429', '(429)', 'Too Many Requests', 'rate-limit', 'rate limit',
+                           "confirm you're not a bot", 'confirm you’re not a bot']
+
+# Проверка загруженных файлов (ffprobe/ffmpeg): длительность, дорожки, ошибки чтения.
+# Если повреждена одна дорожка объединённого видео, перезагружается только она,
+# иначе файл загружается заново (не больше VERIFY_MAX_REDOWNLOADS раз)
+VERIFY_DOWNLOADS = True
+VERIFY_WORKERS = 2
+VERIFY_FULL_DECODE = False          # полное декодирование вместо разбора пакетов (медленно)
+VERIFY_DURATION_TOLERANCE = 2.0     # секунд (или 2% длительности, если больше)
+VERIFY_MAX_REDOWNLOADS = 1
+VERIFY_TIMEOUT = 900                # секунд на один запуск ffprobe/ffmpeg
+
+# Выполнять загрузки в дочерних процессах (меню "Настройки"), чтобы извлечение
+# не замедляло интерфейс; аварийно завершившиеся процессы перезапускаются
+PROCESS_ISOLATION = False
+
+# Мониторинг отзывчивости интерфейса: задержка цикла событий и стек потока GUI
+# при зависании записываются в лог
+EVENT_LOOP_MONITOR = True
+EVENT_LOOP_INTERVAL_MS = 100
+EVENT_LOOP_STALL_MS = 500
+EVENT_LOOP_REPORT_INTERVAL = 300    # секунд между записями гистограммы в лог
+
+# Профилирование (--profile): сколько строк в сводных отчётах logs/profiles/report_*.txt
+PROFILE_TOP_N = 30
+
+# Итоги запусков очереди: записи по загрузкам в logs/runs/run_*.jsonl (хранится
+# RUN_HISTORY_KEEP последних файлов), строк на странице окна сводки
+RUN_HISTORY_KEEP = 20
+SUMMARY_PAGE_SIZE = 50
+
+# Превью (название и обложка) элементов очереди: фоновые запросы, кэш в памяти и на диске
+PREVIEW_WORKERS = 2
+PREVIEW_SIZE = (96, 54)
+PREVIEW_MEMORY_ITEMS = 300
+PREVIEW_DISK_ITEMS = 5000
+PREVIEW_CACHE_DIR = 'preview_cache'
+PREVIEW_LOOKAHEAD = 20              # строк ниже видимой части, для которых превью запрашиваются заранее
+
+# Запрос доступных разрешений при вводе URL
+PROBE_DEBOUNCE_MS = 500     # пауза после последнего изменения URL
+MAX_CONCURRENT_PROBES = 2
+RESOLUTION_CACHE_TTL = 3600
+# Быстрый запрос разрешений: только сведения о форматах, без лишних запросов.
+# Параметры yt-dlp для каждого сервиса; если профиль не дал ни одного видеоформата,
+# выполняется полное извлечение
+PROBE_FAST = True
+PROBE_PROFILES = {
+    # Без HLS/DASH-манифестов (адаптивные форматы есть в ответе плеера) и без JS плеера:
+    # ссылки для загрузки не нужны, достаточно списка форматов
+    'YouTube': {'extractor_args': {'youtube': {'skip': ['hls', 'dash', 'translated_subs'],
+                                               'player_skip': ['js']}}},
+    # Форматы RuTube есть только в HLS-манифесте
+    'RuTube': {},
+    'VK': {},
+    'Одноклассники': {},
+    'Mail.ru': {},
+}
+
+# Профили производительности сервисов. 'default' задаёт все параметры, профиль
+# сервиса переопределяет часть из них:
+#   socket_timeout, retries, fragment_retries, retry_sleep — сеть и повторы
+#   concurrent_fragments — одновременно загружаемых фрагментов HLS/DASH
+#   http_chunk_size — размер запроса при загрузке файла частями (None — одним запросом)
+#   adaptive_chunks — загрузка файла диапазонами, размер которых подбирается по скорости
+#       (против замедления длинных запросов); подобранный размер сохраняется для сервиса
+#   max_concurrent — одновременных загрузок с сервиса (None — без ограничения)
+#   segmented — загрузка прогрессивных файлов: 'off' — штатный загрузчик yt-dlp,
+#       'native' — несколько соединений по диапазонам, 'aria2c' — внешний aria2c,
+#       если он установлен (иначе 'native'); segment_connections, segment_min_size —
+#       число соединений и размер, начиная с которого файл делится на диапазоны
+#   postprocess — 'convert': видео в mp4, аудио в mp3; 'keep': без перекодирования
+#   streaming_merge — видео и аудио сразу объединяются одним процессом ffmpeg без
+#       промежуточных файлов (при ошибке — обычная загрузка с объединением файлов);
+#       загрузка идёт средствами ffmpeg, поэтому прогресс виден только по завершении
+# Профили можно менять во время работы в файле SERVICE_PROFILES_FILE (та же
+# структура, указываются только изменённые параметры): файл перечитывается
+# при изменении и действует для новых загрузок
+SERVICE_PROFILES = {
+    'default': {
+        'socket_timeout': 30,
+        'retries': 10,
+        'fragment_retries': 10,
+        'retry_sleep': 3,
+        'concurrent_fragments': 1,
+        'http_chunk_size': None,
+        'max_concurrent': None,
+        'segmented': 'off',
+        'segment_connections': 4,
+        'segment_min_size': 8 * 1024 * 1024,
+        'postprocess': 'convert',
+        'adaptive_chunks': False,
+        'streaming_merge': True,
+    },
+    # Длинное чтение одним запросом YouTube замедляет: потоки загружаются диапазонами
+    'YouTube': {'concurrent_fragments': 4, 'adaptive_chunks': True, 'streaming_merge': False},
+    'VK': {'concurrent_fragments': 4},
+    'RuTube': {'concurrent_fragments': 4},
+    'Одноклассники': {'segmented': 'native'},
+    'Mail.ru': {'segmented': 'native'},
+}
+SERVICE_PROFILES_FILE = 'service_profiles.json'
+SERVICE_PROFILES_CHECK_INTERVAL = 1.0   # секунд между проверками времени изменения файла
+
+# Загрузка диапазонами адаптивного размера (adaptive_chunks): начальный размер,
+# если для сервиса ещё ничего не подобрано, границы и доля лучшей скорости, ниже
+# которой соединение переоткрывается посреди диапазона
+ADAPTIVE_CHUNK_INITIAL = 1024 * 1024
+ADAPTIVE_CHUNK_MIN = 256 * 1024
+ADAPTIVE_CHUNK_MAX = 64 * 1024 * 1024
+ADAPTIVE_CHUNK_COLLAPSE_RATIO = 0.25
+CHUNK_SIZES_FILE = 'chunk_sizes.json'
+
+# Изменения settings.json записываются не чаще, чем раз в столько миллисекунд
+SETTINGS_SAVE_DELAY_MS = 1000
+
 SUPPORTED_SERVICES = {
     'YouTube': ['youtube.com', 'youtu.be'],
     'VK': ['vk.com', 'vkvideo.ru'],
@@ -0,0 +1,787 @@
+"""
+Общее хранилище заданий для распределённой загрузки.
+
+Сервер заданий владеет очередью (SQLite), а любое количество фоновых
+обработчиков — на этом же или на других компьютерах — арендует задания,
+продлевает аренду, сообщает прогресс и возвращает результат. Если обработчик
+перестал продлевать аренду, по её истечении задание возвращается в очередь.
+
+Модуль использует только стандартную библиотеку (и config), чтобы его можно
+было импортировать без PyQt и yt-dlp.
+"""
+import json
+import logging
+import os
+import queue
+import shutil
+import socket
+import sqlite3
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import config
+
+logger = logging.getLogger('VideoDownloader')
+
+DEFAULT_DB_PATH = "jobs.sqlite3"
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_LEASE_SECONDS = 60.0
+MAX_ATTEMPTS = 3
+
+STATUS_QUEUED = "queued"
+STATUS_LEASED = "leased"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+STATUS_CANCELLED = "cancelled"
+FINAL_STATUSES = (STATUS_DONE, STATUS_FAILED, STATUS_CANCELLED)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    url TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    resolution TEXT,
+    service TEXT,
+    priority INTEGER NOT NULL DEFAULT 1,
+    status TEXT NOT NULL DEFAULT 'queued',
+    worker_id TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    progress REAL NOT NULL DEFAULT 0,
+    status_text TEXT,
+    filename TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    clip_start REAL,
+    clip_end REAL,
+    exact_cut INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (status, priority DESC, id);
+"""
+
+# Столбцы, добавленные после первой версии схемы (для существующих баз)
+_ADDED_COLUMNS = {
+    'clip_start': "REAL",
+    'clip_end': "REAL",
+    'exact_cut': "INTEGER NOT NULL DEFAULT 0",
+}
+
+
+def parse_timestamp(text: str) -> float:
+    """Разбирает время вида "SS", "MM:SS" или "HH:MM:SS" (секунды могут быть дробными)."""
+    parts = text.strip().split(':')
+    if not 1 <= len(parts) <= 3:
+        raise ValueError(f"Некорректное время: {text}")
+    try:
+        values = [float(part) for part in parts]
+    except ValueError:
+        raise ValueError(f"Некорректное время: {text}") from None
+    if any(value < 0 for value in values):
+        raise ValueError(f"Некорректное время: {text}")
+    seconds = 0.0
+    for value in values:
+        seconds = seconds * 60 + value
+    return seconds
+
+
+def parse_clip_range(start: Optional[str], end: Optional[str]) -> Optional[Tuple[Optional[float], Optional[float]]]:
+    """
+    Возвращает фрагмент (начало, конец) в секундах или None, если оба поля пусты.
+    Пустое начало означает начало видео, пустой конец — до конца видео.
+    """
+    start_time = parse_timestamp(start) if start and start.strip() else None
+    end_time = parse_timestamp(end) if end and end.strip() else None
+    if start_time is None and end_time is None:
+        return None
+    if start_time is not None and end_time is not None and end_time <= start_time:
+        raise ValueError("Конец фрагмента должен быть позже начала")
+    return start_time, end_time
+
+
+def parse_clip_token(token: str) -> Optional[Tuple[Optional[float], Optional[float]]]:
+    """
+    Разбирает фрагмент вида "НАЧАЛО-КОНЕЦ" (например 1:00:00-1:05:00, одна из
+    границ может быть пустой). Возвращает None, если token не похож на фрагмент;
+    ValueError — если границы заданы в неверном порядке.
+    """
+    if token.count('-') != 1:
+        return None
+    start, end = token.split('-')
+    try:
+        for side in (start, end):
+            if side:
+                parse_timestamp(side)
+    except ValueError:
+        return None
+    return parse_clip_range(start, end)
+
+
+class JobStoreError(Exception):
+    """Ошибка обращения к хранилищу заданий"""
+    pass
+
+
+class EventBroker:
+    """Рассылает события об изменении заданий подписчикам (например, потокам SSE)."""
+
+    def __init__(self, max_pending: int = 1000) -> None:
+        self.max_pending = max_pending
+        self._subscribers: List[queue.Queue] = []
+        self._lock = threading.Lock()
+
+    def subscribe(self) -> queue.Queue:
+        subscription: queue.Queue = queue.Queue(self.max_pending)
+        with self._lock:
+            self._subscribers.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: queue.Queue) -> None:
+        with self._lock:
+            if subscription in self._subscribers:
+                self._subscribers.remove(subscription)
+
+    def publish(self, event_type: str, job: Optional[Dict[str, Any]]) -> None:
+        if job is None:
+            return
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            try:
+                subscription.put_nowait({'type': event_type, 'job': job})
+            except queue.Full:
+                # Медленный подписчик пропускает события, а не тормозит обработчиков
+                pass
+
+
+class JobStore:
+    """
+    Хранилище заданий в SQLite.
+
+    Каждый поток получает собственное соединение; режим WAL позволяет
+    нескольким процессам на одном компьютере работать с одной базой.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, max_attempts: int = MAX_ATTEMPTS) -> None:
+        self.db_path = db_path
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+        self.events = EventBroker()
+        with self._connection() as conn:
+            conn.executescript(_SCHEMA)
+            existing = {row['name'] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column, definition in _ADDED_COLUMNS.items():
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {definition}")
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self):
+        conn = self._connection()
+        return _Transaction(conn)
+
+    def submit(self, url: str, mode: str, resolution: Optional[str] = None,
+               service: str = "", priority: int = 1, clip_start: Optional[float] = None,
+               clip_end: Optional[float] = None, exact_cut: bool = False) -> int:
+        """
+        Добавляет задание и возвращает его идентификатор. Для видео без
+        разрешения используется config.DEFAULT_RESOLUTION.
+        """
+        if mode == 'video' and not resolution:
+            resolution = config.DEFAULT_RESOLUTION
+        now = time.time()
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "INSERT INTO jobs (url, mode, resolution, service, priority, clip_start, clip_end, exact_cut, "
+                "created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (url, mode, resolution, service, priority, clip_start, clip_end, int(exact_cut), now, now)
+            )
+            job_id = cursor.lastrowid
+        logger.info(f"Задание {job_id} добавлено в хранилище: {url}")
+        self.events.publish('submitted', self.get(job_id))
+        return job_id
+
+    def requeue_expired(self) -> int:
+        """Возвращает в очередь задания с истёкшей арендой."""
+        with self._transaction() as conn:
+            return self._requeue_expired(conn, time.time())
+
+    def _requeue_expired(self, conn: sqlite3.Connection, now: float) -> int:
+        expired = conn.execute(
+            "SELECT id, worker_id, attempts FROM jobs WHERE status = ? AND lease_expires < ?",
+            (STATUS_LEASED, now)
+        ).fetchall()
+        for row in expired:
+            if row['attempts'] >= self.max_attempts:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, error = ?, worker_id = NULL, updated_at = ? WHERE id = ?",
+                    (STATUS_FAILED, "Превышено число попыток: обработчик не отвечает", now, row['id'])
+                )
+                logger.warning(f"Задание {row['id']} снято после {row['attempts']} попыток")
+            else:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, worker_id = NULL, lease_expires = NULL, "
+                    "progress = 0, updated_at = ? WHERE id = ?",
+                    (STATUS_QUEUED, now, row['id'])
+                )
+                logger.warning(f"Аренда задания {row['id']} истекла ({row['worker_id']}), задание возвращено в очередь")
+        return len(expired)
+
+    def lease(self, worker_id: str, lease_seconds: float = DEFAULT_LEASE_SECONDS) -> Optional[Dict[str, Any]]:
+        """Арендует следующее задание для обработчика или возвращает None."""
+        now = time.time()
+        with self._transaction() as conn:
+            self._requeue_expired(conn, now)
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE status = ? ORDER BY priority DESC, id LIMIT 1",
+                (STATUS_QUEUED,)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = ?, worker_id = ?, lease_expires = ?, "
+                "attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                (STATUS_LEASED, worker_id, now + lease_seconds, now, row['id'])
+            )
+            job = self._get(conn, row['id'])
+        logger.info(f"Задание {job['id']} арендовано обработчиком {worker_id}")
+        self.events.publish('leased', job)
+        return job
+
+    def heartbeat(self, job_id: int, worker_id: str, progress: float = 0.0,
+                  status_text: str = "", lease_seconds: float = DEFAULT_LEASE_SECONDS) -> bool:
+        """Продлевает аренду. False означает, что задание больше не принадлежит обработчику."""
+        now = time.time()
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET lease_expires = ?, progress = ?, status_text = ?, updated_at = ? "
+                "WHERE id = ? AND worker_id = ? AND status = ?",
+                (now + lease_seconds, progress, status_text, now, job_id, worker_id, STATUS_LEASED)
+            )
+            alive = cursor.rowcount == 1
+        if alive:
+            self.events.publish('progress', self.get(job_id))
+        return alive
+
+    def complete(self, job_id: int, worker_id: str, filename: str = "") -> bool:
+        return self._finish(job_id, worker_id, STATUS_DONE, filename=filename)
+
+    def fail(self, job_id: int, worker_id: str, error: str = "") -> bool:
+        return self._finish(job_id, worker_id, STATUS_FAILED, error=error)
+
+    def _finish(self, job_id: int, worker_id: str, status: str,
+                filename: str = "", error: str = "") -> bool:
+        now = time.time()
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, filename = ?, error = ?, lease_expires = NULL, "
+                "progress = CASE WHEN ? = 'done' THEN 100 ELSE progress END, updated_at = ? "
+                "WHERE id = ? AND worker_id = ? AND status = ?",
+                (status, filename, error, status, now, job_id, worker_id, STATUS_LEASED)
+            )
+            finished = cursor.rowcount == 1
+        if finished:
+            logger.info(f"Задание {job_id} завершено обработчиком {worker_id}: {status}")
+            self.events.publish(status, self.get(job_id))
+        else:
+            logger.warning(f"Результат задания {job_id} от {worker_id} отклонён: аренда потеряна или задание отменено")
+        return finished
+
+    def cancel(self, job_id: int) -> bool:
+        """
+        Отменяет задание. Обработчик, выполняющий его, узнаёт об отмене
+        при следующем продлении аренды и прерывает загрузку.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, lease_expires = NULL, updated_at = ? "
+                "WHERE id = ? AND status IN (?, ?)",
+                (STATUS_CANCELLED, now, job_id, STATUS_QUEUED, STATUS_LEASED)
+            )
+            cancelled = cursor.rowcount == 1
+        if cancelled:
+            logger.info(f"Задание {job_id} отменено")
+            self.events.publish(STATUS_CANCELLED, self.get(job_id))
+        return cancelled
+
+    def get(self, job_id: int) -> Optional[Dict[str, Any]]:
+        return self._get(self._connection(), job_id)
+
+    @staticmethod
+    def _get(conn: sqlite3.Connection, job_id: int) -> Optional[Dict[str, Any]]:
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def list_jobs(self, status: Optional[str] = None, ids: Optional[List[int]] = None,
+                  limit: int = 1000) -> List[Dict[str, Any]]:
+        query = "SELECT * FROM jobs"
+        clauses: List[str] = []
+        params: List[Any] = []
+        if status:
+            clauses.append("status = ?")
+            params.append(status)
+        if ids:
+            clauses.append(f"id IN ({','.join('?' * len(ids))})")
+            params.extend(ids)
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY id LIMIT ?"
+        params.append(limit)
+        return [dict(row) for row in self._connection().execute(query, params).fetchall()]
+
+
+class _Transaction:
+    """Транзакция BEGIN IMMEDIATE: аренда не может достаться двум обработчикам."""
+
+    def __init__(self, conn: sqlite3.Connection) -> None:
+        self.conn = conn
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.conn.execute("COMMIT")
+        else:
+            self.conn.execute("ROLLBACK")
+
+
+class RemoteJobStore:
+    """Клиент сервера заданий с тем же интерфейсом, что и JobStore."""
+
+    def __init__(self, base_url: str, token: Optional[str] = None, timeout: float = 15.0) -> None:
+        self.base_url = base_url.rstrip('/')
+        self.token = token
+        self.timeout = timeout
+
+    def _request(self, method: str, path: str, payload: Optional[Dict[str, Any]] = None) -> Any:
+        data = json.dumps(payload).encode('utf-8') if payload is not None else None
+        request = urllib.request.Request(self.base_url + path, data=data, method=method)
+        request.add_header('Content-Type', 'application/json')
+        if self.token:
+            request.add_header('X-Auth-Token', self.token)
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                body = response.read()
+                return json.loads(body) if body else None
+        except urllib.error.HTTPError as e:
+            if e.code == 404:
+                return None
+            raise JobStoreError(f"Сервер заданий вернул {e.code} для {method} {path}") from e
+        except (urllib.error.URLError, socket.timeout, ConnectionError) as e:
+            raise JobStoreError(f"Сервер заданий недоступен: {e}") from e
+
+    def submit(self, url: str, mode: str, resolution: Optional[str] = None,
+               service: str = "", priority: int = 1, clip_start: Optional[float] = None,
+               clip_end: Optional[float] = None, exact_cut: bool = False) -> int:
+        result = self._request('POST', '/jobs', {
+            'url': url, 'mode': mode, 'resolution': resolution,
+            'service': service, 'priority': priority,
+            'clip_start': clip_start, 'clip_end': clip_end, 'exact_cut': exact_cut
+        })
+        return result['id']
+
+    def lease(self, worker_id: str, lease_seconds: float = DEFAULT_LEASE_SECONDS) -> Optional[Dict[str, Any]]:
+        return self._request('POST', '/lease', {'worker_id': worker_id, 'lease_seconds': lease_seconds})
+
+    def heartbeat(self, job_id: int, worker_id: str, progress: float = 0.0,
+                  status_text: str = "", lease_seconds: float = DEFAULT_LEASE_SECONDS) -> bool:
+        result = self._request('POST', f'/jobs/{job_id}/heartbeat', {
+            'worker_id': worker_id, 'progress': progress,
+            'status_text': status_text, 'lease_seconds': lease_seconds
+        })
+        return bool(result and result.get('ok'))
+
+    def complete(self, job_id: int, worker_id: str, filename: str = "") -> bool:
+        result = self._request('POST', f'/jobs/{job_id}/complete', {'worker_id': worker_id, 'filename': filename})
+        return bool(result and result.get('ok'))
+
+    def fail(self, job_id: int, worker_id: str, error: str = "") -> bool:
+        result = self._request('POST', f'/jobs/{job_id}/fail', {'worker_id': worker_id, 'error': error})
+        return bool(result and result.get('ok'))
+
+    def cancel(self, job_id: int) -> bool:
+        result = self._request('POST', f'/jobs/{job_id}/cancel', {})
+        return bool(result and result.get('ok'))
+
+    def get(self, job_id: int) -> Optional[Dict[str, Any]]:
+        return self._request('GET', f'/jobs/{job_id}')
+
+    def list_jobs(self, status: Optional[str] = None, ids: Optional[List[int]] = None,
+                  limit: int = 1000) -> List[Dict[str, Any]]:
+        query = f"?limit={limit}"
+        if status:
+            query += f"&status={status}"
+        if ids:
+            query += "&ids=" + ",".join(str(job_id) for job_id in ids)
+        return self._request('GET', '/jobs' + query) or []
+
+
+def open_job_store(location: str, token: Optional[str] = None):
+    """Открывает хранилище по адресу сервера (http://...) или по пути к базе SQLite."""
+    if location.startswith(('http://', 'https://')):
+        return RemoteJobStore(location, token)
+    return JobStore(location)
+
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    """HTTP API хранилища заданий (JSON)."""
+
+    server_version = "VideoDownloaderJobs/1.0"
+
+    def log_message(self, format: str, *args) -> None:
+        logger.debug(f"{self.address_string()} {format % args}")
+
+    @property
+    def store(self) -> JobStore:
+        return self.server.store
+
+    def _send_json(self, status: int, payload: Any = None) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8') if payload is not None else b""
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self) -> Dict[str, Any]:
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return {}
+        return json.loads(self.rfile.read(length).decode('utf-8'))
+
+    def _authorized(self) -> bool:
+        token = self.server.token
+        if token and self.headers.get('X-Auth-Token') != token:
+            self._send_json(401, {'error': 'unauthorized'})
+            return False
+        return True
+
+    def _route(self) -> Tuple[List[str], Dict[str, List[str]]]:
+        parsed = urlparse(self.path)
+        return [part for part in parsed.path.split('/') if part], parse_qs(parsed.query)
+
+    def do_GET(self) -> None:
+        if not self._authorized():
+            return
+        parts, query = self._route()
+        if parts == ['events']:
+            job_filter = query.get('job', [None])[0]
+            try:
+                job_id = int(job_filter) if job_filter else None
+            except ValueError:
+                self._send_json(400, {'error': 'job must be an integer id'})
+                return
+            self._stream_events(job_id)
+        elif parts == ['jobs']:
+            try:
+                ids = [int(job_id) for job_id in query.get('ids', [''])[0].split(',') if job_id]
+                limit = int(query.get('limit', ['1000'])[0])
+            except ValueError:
+                self._send_json(400, {'error': 'ids and limit must be integers'})
+                return
+            jobs = self.store.list_jobs(
+                status=query.get('status', [None])[0],
+                ids=ids or None,
+                limit=limit
+            )
+            self._send_json(200, jobs)
+        elif len(parts) == 2 and parts[0] == 'jobs' and parts[1].isdigit():
+            job = self.store.get(int(parts[1]))
+            self._send_json(200 if job else 404, job or {'error': 'not found'})
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def _stream_events(self, job_id: Optional[int]) -> None:
+        """Поток событий заданий в формате Server-Sent Events."""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream; charset=utf-8')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        subscription = self.store.events.subscribe()
+        try:
+            while True:
+                try:
+                    event = subscription.get(timeout=15)
+                except queue.Empty:
+                    self.wfile.write(b": keepalive\n\n")
+                    self.wfile.flush()
+                    continue
+                if job_id is not None and event['job']['id'] != job_id:
+                    continue
+                data = json.dumps(event['job'], ensure_ascii=False)
+                self.wfile.write(f"event: {event['type']}\ndata: {data}\n\n".encode('utf-8'))
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError, ConnectionAbortedError):
+            pass
+        finally:
+            self.store.events.unsubscribe(subscription)
+
+    def do_DELETE(self) -> None:
+        if not self._authorized():
+            return
+        parts, _ = self._route()
+        if len(parts) == 2 and parts[0] == 'jobs' and parts[1].isdigit():
+            self._send_json(200, {'ok': self.store.cancel(int(parts[1]))})
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self) -> None:
+        if not self._authorized():
+            return
+        parts, _ = self._route()
+        try:
+            payload = self._read_json()
+        except ValueError:
+            self._send_json(400, {'error': 'invalid json'})
+            return
+        if not isinstance(payload, dict):
+            self._send_json(400, {'error': 'json object expected'})
+            return
+
+        if parts == ['jobs']:
+            if not payload.get('url') or payload.get('mode') not in ('video', 'audio'):
+                self._send_json(400, {'error': 'url and mode (video|audio) are required'})
+                return
+            if not isinstance(payload.get('resolution') or '', str):
+                self._send_json(400, {'error': 'resolution must be a string such as "720p"'})
+                return
+            clip = [payload.get('clip_start'), payload.get('clip_end')]
+            try:
+                clip = [float(value) if value is not None else None for value in clip]
+            except (TypeError, ValueError):
+                self._send_json(400, {'error': 'clip_start and clip_end must be numbers of seconds'})
+                return
+            try:
+                priority = int(payload.get('priority', 1))
+            except (TypeError, ValueError):
+                self._send_json(400, {'error': 'priority must be an integer'})
+                return
+            job_id = self.store.submit(
+                payload['url'], payload['mode'], payload.get('resolution'),
+                payload.get('service', ''), priority,
+                clip[0], clip[1], bool(payload.get('exact_cut'))
+            )
+            self._send_json(201, {'id': job_id})
+        elif parts == ['lease']:
+            try:
+                lease_seconds = float(payload.get('lease_seconds', DEFAULT_LEASE_SECONDS))
+            except (TypeError, ValueError):
+                self._send_json(400, {'error': 'lease_seconds must be a number'})
+                return
+            job = self.store.lease(payload.get('worker_id', ''), lease_seconds)
+            if job:
+                self._send_json(200, job)
+            else:
+                self._send_json(204)
+        elif len(parts) == 3 and parts[0] == 'jobs' and parts[1].isdigit():
+            job_id, action, worker_id = int(parts[1]), parts[2], payload.get('worker_id', '')
+            if action == 'heartbeat':
+                try:
+                    progress = float(payload.get('progress', 0))
+                    lease_seconds = float(payload.get('lease_seconds', DEFAULT_LEASE_SECONDS))
+                except (TypeError, ValueError):
+                    self._send_json(400, {'error': 'progress and lease_seconds must be numbers'})
+                    return
+                ok = self.store.heartbeat(job_id, worker_id, progress, payload.get('status_text', ''),
+                                          lease_seconds)
+            elif action == 'complete':
+                ok = self.store.complete(job_id, worker_id, payload.get('filename', ''))
+            elif action == 'fail':
+                ok = self.store.fail(job_id, worker_id, payload.get('error', ''))
+            elif action == 'cancel':
+                ok = self.store.cancel(job_id)
+            else:
+                self._send_json(404, {'error': 'not found'})
+                return
+            self._send_json(200, {'ok': ok})
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+
+class JobServer(ThreadingHTTPServer):
+    """HTTP-сервер заданий поверх JobStore."""
+
+    daemon_threads = True
+
+    def __init__(self, store: JobStore, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+                 token: Optional[str] = None, handler=JobRequestHandler) -> None:
+        super().__init__((host, port), handler)
+        self.store = store
+        self.token = token
+
+    def serve(self, reaper_interval: float = 10.0) -> None:
+        """Обслуживает запросы и периодически возвращает в очередь просроченные задания."""
+        stop = threading.Event()
+
+        def reap() -> None:
+            while not stop.wait(reaper_interval):
+                try:
+                    self.store.requeue_expired()
+                except Exception:
+                    logger.exception("Ошибка при проверке истёкших аренд")
+
+        threading.Thread(target=reap, name="lease-reaper", daemon=True).start()
+        host, port = self.server_address[:2]
+        logger.info(f"Сервер заданий запущен на http://{host}:{port}")
+        try:
+            self.serve_forever()
+        finally:
+            stop.set()
+
+
+# execute(job, report, cancel_event) -> (успех, сообщение, имя файла)
+JobExecutor = Callable[[Dict[str, Any], Callable[[str, float], None], threading.Event], Tuple[bool, str, str]]
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def run_worker(store, execute: JobExecutor, worker_id: Optional[str] = None,
+               lease_seconds: float = DEFAULT_LEASE_SECONDS, poll_interval: float = 2.0,
+               stop_event: Optional[threading.Event] = None,
+               heartbeat_interval: Optional[float] = None) -> None:
+    """
+    Цикл фонового обработчика: арендует задание, выполняет его и продлевает
+    аренду, пока задание выполняется. Потеря аренды (или отмена задания)
+    прерывает выполнение.
+    """
+    worker_id = worker_id or default_worker_id()
+    # Частота продления определяет и задержку реакции на отмену
+    heartbeat_interval = heartbeat_interval or min(lease_seconds / 3, 5.0)
+    stop_event = stop_event or threading.Event()
+    logger.info(f"Обработчик {worker_id} запущен")
+
+    while not stop_event.is_set():
+        try:
+            job = store.lease(worker_id, lease_seconds)
+        except JobStoreError as e:
+            logger.warning(f"Не удалось получить задание: {e}")
+            stop_event.wait(poll_interval)
+            continue
+        if job is None:
+            stop_event.wait(poll_interval)
+            continue
+
+        cancel_event = threading.Event()
+        done = threading.Event()
+        progress_state = {'percent': 0.0, 'text': ""}
+
+        def report(status_text: str, percent: float) -> None:
+            progress_state['text'] = status_text
+            if percent >= 0:
+                progress_state['percent'] = percent
+
+        def keep_alive(job_id: int = job['id']) -> None:
+            while not done.wait(heartbeat_interval):
+                try:
+                    if not store.heartbeat(job_id, worker_id, progress_state['percent'],
+                                           progress_state['text'], lease_seconds):
+                        logger.warning(f"Аренда задания {job_id} потеряна, выполнение отменяется")
+                        cancel_event.set()
+                        return
+                except JobStoreError as e:
+                    logger.warning(f"Не удалось продлить аренду задания {job_id}: {e}")
+
+        heartbeat_thread = threading.Thread(target=keep_alive, name=f"heartbeat-{job['id']}", daemon=True)
+        heartbeat_thread.start()
+        try:
+            success, message, filename = execute(job, report, cancel_event)
+        except Exception as e:
+            logger.exception(f"Ошибка выполнения задания {job['id']}")
+            success, message, filename = False, str(e), ""
+        finally:
+            done.set()
+            heartbeat_thread.join()
+
+        try:
+            if success:
+                store.complete(job['id'], worker_id, filename)
+            else:
+                store.fail(job['id'], worker_id, message)
+        except JobStoreError as e:
+            # Аренда истечёт, и задание будет выполнено повторно
+            logger.error(f"Не удалось сообщить результат задания {job['id']}: {e}")
+
+    logger.info(f"Обработчик {worker_id} остановлен")
+
+
+def watch_drop_folder(store, folder: str, stop_event: threading.Event, interval: float = 2.0,
+                      validate: Optional[Callable[[str], bool]] = None) -> None:
+    """
+    Следит за папкой и добавляет задания из появляющихся файлов .txt.
+
+    Каждая строка файла: "URL [video|audio] [разрешение] [начало-конец]"; пустые строки и
+    строки, начинающиеся с #, пропускаются. Обработанный файл переносится
+    в подпапку processed.
+    """
+    processed_dir = os.path.join(folder, 'processed')
+    os.makedirs(processed_dir, exist_ok=True)
+    logger.info(f"Отслеживается папка заданий: {folder}")
+
+    while not stop_event.wait(interval):
+        try:
+            names = sorted(name for name in os.listdir(folder) if name.lower().endswith('.txt'))
+        except OSError as e:
+            logger.error(f"Папка заданий недоступна: {e}")
+            continue
+        for name in names:
+            path = os.path.join(folder, name)
+            try:
+                with open(path, 'r', encoding='utf-8-sig') as f:
+                    lines = f.read().splitlines()
+            except OSError as e:
+                # Файл может ещё записываться — попробуем в следующий раз
+                logger.debug(f"Не удалось прочитать {path}: {e}")
+                continue
+            submitted = 0
+            for line in lines:
+                fields = line.split()
+                if not fields or fields[0].startswith('#'):
+                    continue
+                url = fields[0]
+                if validate is not None and not validate(url):
+                    logger.warning(f"Пропущена строка из {name}: некорректный URL {url}")
+                    continue
+                # После URL: необязательный режим, затем разрешение и фрагмент "НАЧАЛО-КОНЕЦ" в любом порядке
+                rest = fields[1:]
+                mode = rest.pop(0) if rest and rest[0] in ('video', 'audio') else 'video'
+                resolution, clip, unknown = None, None, []
+                try:
+                    for field in rest:
+                        field_clip = parse_clip_token(field) if clip is None else None
+                        if field_clip is not None:
+                            clip = field_clip
+                        elif mode == 'video' and resolution is None:
+                            resolution = field
+                        else:
+                            unknown.append(field)
+                except ValueError as e:
+                    logger.warning(f"Пропущена строка из {name}: {e}")
+                    continue
+                if unknown:
+                    logger.warning(f"Строка из {name}: не распознаны поля {' '.join(unknown)}")
+                if mode == 'video' and resolution is None:
+                    resolution = config.DEFAULT_RESOLUTION
+                store.submit(url, mode, resolution, clip_start=clip[0] if clip else None,
+                             clip_end=clip[1] if clip else None)
+                submitted += 1
+            shutil.move(path, os.path.join(processed_dir, f"{int(time.time())}_{name}"))
+            logger.info(f"Из файла {name} добавлено заданий: {submitted}")
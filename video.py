@@ -4,25 +4,63 @@ import json
 import re
 import logging
 from datetime import datetime
-from typing import Tuple, List, Dict, Any, Optional, Set
+from typing import Tuple, List, Dict, Any, Optional, Set, Callable
 import subprocess
 import shutil
 import threading
+import multiprocessing
+from multiprocessing.connection import wait as wait_connections
+import socket
+import ssl
+import glob
+import weakref
+import contextlib
 from enum import Enum
-import asyncio
-from concurrent.futures import ThreadPoolExecutor
-from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
+from functools import lru_cache, wraps
 import time
+import heapq
+import itertools
+import math
+import copy
+import pickle
+import bisect
+import traceback
+import cProfile
+import pstats
+import io
+import tracemalloc
+import hashlib
+from collections import Counter, OrderedDict, defaultdict
+import argparse
+import csv
 from abc import ABC, abstractmethod
 from logging.handlers import RotatingFileHandler
 
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
                              QHBoxLayout, QLabel, QLineEdit, QPushButton,
                              QComboBox, QProgressBar, QListWidget, QFrame,
-                             QRadioButton, QButtonGroup, QMessageBox, QStyle)
-from PyQt6.QtCore import Qt, QThread, pyqtSignal, QObject, QRunnable, QThreadPool
-from PyQt6.QtGui import QIcon, QFont, QKeySequence, QShortcut, QPixmap, QCursor
+                             QRadioButton, QButtonGroup, QMessageBox, QStyle,
+                             QListWidgetItem, QAbstractItemView, QCheckBox, QDialog,
+                             QTableWidget, QTableWidgetItem, QHeaderView, QFileDialog)
+from PyQt6.QtCore import Qt, QThread, pyqtSignal, QObject, QRunnable, QThreadPool, QTimer, QSize, QPoint
+from PyQt6.QtGui import (QIcon, QFont, QKeySequence, QShortcut, QPixmap, QImage, QCursor, QAction,
+                         QActionGroup)
 import yt_dlp
+import config
+from yt_dlp.cookies import YoutubeDLCookieJar, extract_cookies_from_browser, SUPPORTED_BROWSERS
+from yt_dlp.downloader.http import HttpFD
+from yt_dlp.downloader.external import Aria2cFD, FFmpegFD
+from yt_dlp.networking import Request as YDLRequest
+from yt_dlp.networking.exceptions import TransportError, HTTPError as YDLHTTPError
+from yt_dlp.postprocessor import FFmpegMergerPP
+from yt_dlp.utils import (determine_protocol, parse_http_range, prepend_extension, download_range_func,
+                          Popen as YDLPopen, DownloadError as YDLDownloadError, PostProcessingError)
+from yt_dlp.utils.networking import HTTPHeaderDict
+
+from jobs import (JobStore, JobServer, JobStoreError, open_job_store, run_worker, watch_drop_folder,
+                  default_worker_id, parse_clip_range, DEFAULT_DB_PATH, DEFAULT_HOST, DEFAULT_PORT,
+                  FINAL_STATUSES, STATUS_DONE)
 
 # Настройка логирования
 log_dir: str = "logs"
@@ -104,17 +142,10 @@ class VideoURL:
                     return service
                     
         # Проверка по доменам, если точное совпадение не найдено
-        if 'youtube.com' in url or 'youtu.be' in url:
-            return 'YouTube'
-        elif 'vk.com' in url or 'vkvideo.ru' in url:
-            return 'VK'
-        elif 'rutube.ru' in url:
-            return 'RuTube'
-        elif 'ok.ru' in url:
-            return 'Одноклассники'
-        elif 'mail.ru' in url:
-            return 'Mail.ru'
-            
+        for service, domains in config.SUPPORTED_SERVICES.items():
+            if any(domain in url for domain in domains):
+                return service
+
         return 'Неизвестный сервис'
 
     @classmethod
@@ -130,55 +161,1882 @@ class VideoURL:
             if not url.startswith(('http://', 'https://')):
                 raise URLValidationError("URL должен начинаться с http:// или https://")
 
-            for service, patterns in cls.URL_PATTERNS.items():
-                for pattern in patterns:
-                    if re.match(pattern, url):
-                        logger.info(f"URL валиден для сервиса {service}: {url}")
-                        return True, ""
+            for service, patterns in cls.URL_PATTERNS.items():
+                for pattern in patterns:
+                    if re.match(pattern, url):
+                        logger.info(f"URL валиден для сервиса {service}: {url}")
+                        return True, ""
+
+            # Если URL содержит домен известного сервиса, но не соответствует паттерну
+            service = cls.get_service_name(url)
+            if service != 'Неизвестный сервис':
+                raise URLValidationError(f"Неверный формат URL для {service}. Проверьте правильность ссылки.")
+
+            return False, "Неподдерживаемый видеосервис или неверный формат URL"
+        except URLValidationError as e:
+            return False, str(e)
+
+def _number_check(minimum: float, integer: bool = False, optional: bool = False):
+    """Проверка числового параметра профиля: тип, нижняя граница, допустимость None."""
+    def check(value: Any) -> bool:
+        if value is None:
+            return optional
+        if isinstance(value, bool) or not isinstance(value, int if integer else (int, float)):
+            return False
+        return value >= minimum
+    return check
+
+class ServiceProfiles:
+    """
+    Профили производительности сервисов: config.SERVICE_PROFILES, поверх которых
+    накладывается файл config.SERVICE_PROFILES_FILE. Файл перечитывается при
+    изменении (время изменения проверяется не чаще раза в
+    SERVICE_PROFILES_CHECK_INTERVAL секунд); новые значения действуют для
+    следующих загрузок. Файл с ошибками
+    отклоняется целиком, продолжают действовать прежние профили.
+    """
+
+    FIELDS = {
+        'socket_timeout': (_number_check(0.1), "число секунд больше 0"),
+        'retries': (_number_check(0, integer=True), "целое число от 0"),
+        'fragment_retries': (_number_check(0, integer=True), "целое число от 0"),
+        'retry_sleep': (_number_check(0), "число секунд от 0"),
+        'concurrent_fragments': (_number_check(1, integer=True), "целое число от 1"),
+        'http_chunk_size': (_number_check(1, integer=True, optional=True), "целое число байт или null"),
+        'max_concurrent': (_number_check(1, integer=True, optional=True), "целое число от 1 или null"),
+        'segmented': (lambda value: value in ('off', 'native', 'aria2c'), "'off', 'native' или 'aria2c'"),
+        'segment_connections': (_number_check(1, integer=True), "целое число от 1"),
+        'segment_min_size': (_number_check(0, integer=True), "целое число байт"),
+        'postprocess': (lambda value: value in ('convert', 'keep'), "'convert' или 'keep'"),
+        'adaptive_chunks': (lambda value: isinstance(value, bool), "true или false"),
+        'streaming_merge': (lambda value: isinstance(value, bool), "true или false"),
+    }
+
+    def __init__(self, base: Dict[str, Dict[str, Any]], path: Optional[str] = None) -> None:
+        self.validate(base, complete_default=True)
+        self.base = base
+        self.path = path
+        self._lock = threading.Lock()
+        self._mtime: Optional[float] = None
+        self._checked_at = float('-inf')
+        self._profiles = self._resolve({})
+
+    @classmethod
+    def validate(cls, profiles: Any, complete_default: bool = False) -> None:
+        """Проверяет структуру профилей; при ошибке вызывает ValueError с описанием."""
+        if not isinstance(profiles, dict):
+            raise ValueError("профили должны быть объектом {сервис: {параметр: значение}}")
+        for service, profile in profiles.items():
+            if service != 'default' and service not in config.SUPPORTED_SERVICES:
+                raise ValueError(f"неизвестный сервис '{service}'")
+            if not isinstance(profile, dict):
+                raise ValueError(f"профиль '{service}' должен быть объектом")
+            for key, value in profile.items():
+                if key not in cls.FIELDS:
+                    raise ValueError(f"{service}: неизвестный параметр '{key}'")
+                check, expected = cls.FIELDS[key]
+                if not check(value):
+                    raise ValueError(f"{service}.{key}: ожидается {expected}, получено {value!r}")
+        if complete_default:
+            missing = set(cls.FIELDS) - set(profiles.get('default', {}))
+            if missing:
+                raise ValueError(f"в профиле 'default' не заданы: {', '.join(sorted(missing))}")
+
+    def _resolve(self, overrides: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        default = {**self.base['default'], **overrides.get('default', {})}
+        return {service: {**default, **self.base.get(service, {}), **overrides.get(service, {})}
+                for service in ['default', *config.SUPPORTED_SERVICES]}
+
+    def _reload(self) -> None:
+        now = time.monotonic()
+        if now - self._checked_at < config.SERVICE_PROFILES_CHECK_INTERVAL:
+            return
+        self._checked_at = now
+        try:
+            mtime = os.stat(self.path).st_mtime if self.path else None
+        except OSError:
+            mtime = None
+        if mtime == self._mtime:
+            return
+        self._mtime = mtime
+        if mtime is None:
+            logger.info("Файл профилей сервисов не найден, используются профили из config.py")
+            self._profiles = self._resolve({})
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                overrides = json.load(f)
+            self.validate(overrides)
+        except (OSError, ValueError) as e:
+            logger.error(f"Файл профилей {self.path} отклонён, действуют прежние профили: {e}")
+            return
+        self._profiles = self._resolve(overrides)
+        logger.info(f"Профили сервисов загружены из {self.path}")
+
+    def get(self, service: str) -> Dict[str, Any]:
+        """Действующий профиль сервиса (для неизвестных сервисов — 'default')."""
+        with self._lock:
+            self._reload()
+            return dict(self._profiles.get(service, self._profiles['default']))
+
+    @staticmethod
+    def ydl_options(service: str, profile: Dict[str, Any]) -> Dict[str, Any]:
+        """Параметры yt-dlp из профиля сервиса."""
+        options: Dict[str, Any] = {
+            'socket_timeout': profile['socket_timeout'],
+            'retries': profile['retries'],
+            'fragment_retries': profile['fragment_retries'],
+            'retry_sleep': profile['retry_sleep'],
+            'concurrent_fragment_downloads': profile['concurrent_fragments'],
+            'streaming_merge': profile['streaming_merge'],
+        }
+        if profile['adaptive_chunks']:
+            options['adaptive_chunks'] = {'service': service}
+            # Для загрузок не через AdaptiveChunkHttpFD — подобранный для сервиса размер
+            options['http_chunk_size'] = (chunk_sizes.get(service) or profile['http_chunk_size']
+                                          or config.ADAPTIVE_CHUNK_INITIAL)
+        elif profile['http_chunk_size']:
+            options['http_chunk_size'] = profile['http_chunk_size']
+        if profile['segmented'] != 'off':
+            options['segmented_download'] = {
+                'backend': profile['segmented'],
+                'connections': profile['segment_connections'],
+                'min_size': profile['segment_min_size'],
+            }
+        return options
+
+service_profiles = ServiceProfiles(config.SERVICE_PROFILES, config.SERVICE_PROFILES_FILE)
+
+class DownloadMode(Enum):
+    VIDEO = "video"
+    AUDIO = "audio"
+
+class DownloadPriority(Enum):
+    HIGH = 2
+    NORMAL = 1
+    LOW = 0
+
+    @property
+    def label(self) -> str:
+        return {2: "Высокий", 1: "Обычный", 0: "Низкий"}[self.value]
+
+class QueuePolicy(Enum):
+    FIFO = "fifo"
+    SHORTEST_FIRST = "sjf"
+
+def _format_size(fmt: Dict[str, Any]) -> Optional[int]:
+    """Возвращает точный или приблизительный размер формата в байтах."""
+    size = fmt.get('filesize') or fmt.get('filesize_approx')
+    return int(size) if size else None
+
+def estimate_download_size(formats: List[Dict[str, Any]], mode: str,
+                           resolution: Optional[str] = None) -> Optional[int]:
+    """
+    Оценивает объём загрузки по списку форматов из метаданных yt-dlp.
+
+    Для видео берётся лучший видеопоток не выше запрошенного разрешения плюс
+    лучший аудиопоток, для аудио — только лучший аудиопоток.
+    Возвращает None, если размеры в метаданных отсутствуют.
+    """
+    audio_sizes = [_format_size(f) for f in formats
+                   if f.get('vcodec') == 'none' and f.get('acodec') not in (None, 'none')]
+    audio_sizes = [size for size in audio_sizes if size]
+    best_audio: int = max(audio_sizes) if audio_sizes else 0
+    if mode == DownloadMode.AUDIO.value:
+        return best_audio or None
+
+    max_height = int(resolution.replace('p', '')) if resolution else None
+    video_formats = [f for f in formats
+                     if f.get('height') and f.get('vcodec') != 'none'
+                     and (max_height is None or f['height'] <= max_height)]
+    if not video_formats:
+        return None
+    top_height = max(f['height'] for f in video_formats)
+    video_sizes = [_format_size(f) for f in video_formats if f['height'] == top_height]
+    video_sizes = [size for size in video_sizes if size]
+    if not video_sizes:
+        return None
+    best_video = max(video_sizes)
+    # Если формат уже содержит звук, отдельный аудиопоток не нужен
+    has_muxed_audio = any(f.get('acodec') not in (None, 'none') for f in video_formats
+                          if f['height'] == top_height and _format_size(f) == best_video)
+    return best_video + (0 if has_muxed_audio else best_audio)
+
+def format_clip(clip: Tuple[Optional[float], Optional[float]], separator: str = "–") -> str:
+    """Фрагмент (начало, конец) в виде "Ч:ММ:СС–Ч:ММ:СС"; пустые границы — начало и конец видео."""
+    def timestamp(seconds: float) -> str:
+        minutes, secs = divmod(int(seconds), 60)
+        return f"{minutes // 60}:{minutes % 60:02d}:{secs:02d}"
+    start, end = clip
+    return (f"{timestamp(start or 0)}{separator}"
+            f"{timestamp(end) if end is not None else ('конец' if separator == '–' else 'end')}")
+
+class DownloadQueue:
+    """
+    Очередь загрузок с приоритетами на основе двоичных куч (по куче на сервис).
+
+    Элементы упорядочены по приоритету, затем по ключу политики: порядку
+    добавления (FIFO) или оценке размера (сначала короткие). Вставка и извлечение
+    выполняются за O(log n); pop() сравнивает только вершины куч сервисов и может
+    пропустить сервисы, у которых заняты все слоты. Удаление и изменение
+    приоритета помечают старую запись кучи как недействительную и добавляют
+    новую. Отложенные элементы
+    (не хватило места на диске) хранятся вне кучи и не просматриваются при
+    извлечении, пока их не вернут методом restore_deferred().
+    """
+
+    def __init__(self, policy: QueuePolicy = QueuePolicy.FIFO) -> None:
+        self.policy = policy
+        # Сервис -> куча его записей; число действительных записей по сервисам
+        self._heaps: Dict[str, List[list]] = {}
+        self._ready: Counter = Counter()
+        self._stale = 0
+        self._entries: Dict[int, list] = {}
+        # Отложенные элементы: id -> запись (в куче их нет)
+        self._deferred: Dict[int, list] = {}
+        self._ids = itertools.count(1)
+        # Уникальный номер записи: недействительная и новая запись одного
+        # элемента не должны сравниваться по самому элементу
+        self._entry_counter = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self):
+        return iter(self.items())
+
+    def _rank(self, item: Dict[str, Any]) -> float:
+        if item.get('manual_rank') is not None:
+            return item['manual_rank']
+        if self.policy == QueuePolicy.SHORTEST_FIRST:
+            size = item.get('estimated_size')
+            # Элементы с неизвестным размером идут после всех оценённых
+            return float(size) if size else math.inf
+        return float(item['seq'])
+
+    def _make_entry(self, item: Dict[str, Any]) -> list:
+        entry = [-item['priority'], self._rank(item), item['order'], next(self._entry_counter), item]
+        self._entries[item['id']] = entry
+        return entry
+
+    def _push_entry(self, item: Dict[str, Any]) -> None:
+        self._push_heap(self._make_entry(item))
+
+    def _push_heap(self, entry: list) -> None:
+        service = entry[-1].get('service', '')
+        heapq.heappush(self._heaps.setdefault(service, []), entry)
+        self._ready[service] += 1
+
+    def _head(self, service: str) -> Optional[list]:
+        """Вершина кучи сервиса без недействительных записей."""
+        heap = self._heaps[service]
+        while heap and heap[0][-1] is None:
+            heapq.heappop(heap)
+            self._stale -= 1
+        return heap[0] if heap else None
+
+    def _invalidate(self, item_id: int) -> Optional[Dict[str, Any]]:
+        entry = self._entries.pop(item_id, None)
+        if entry is None:
+            return None
+        if self._deferred.pop(item_id, None) is not None:
+            return entry[-1]
+        item = entry[-1]
+        entry[-1] = None
+        service = item.get('service', '')
+        self._ready[service] -= 1
+        if not self._ready[service]:
+            del self._ready[service]
+        self._stale += 1
+        # Не даём кучам разрастаться из-за недействительных записей
+        if self._stale > len(self._entries) - len(self._deferred) + 64:
+            for heap in self._heaps.values():
+                heap[:] = [e for e in heap if e[-1] is not None]
+                heapq.heapify(heap)
+            self._stale = 0
+        return item
+
+    def push(self, item: Dict[str, Any]) -> int:
+        """Добавляет элемент в очередь и возвращает его идентификатор."""
+        item_id = next(self._ids)
+        item['id'] = item_id
+        item['seq'] = item_id
+        item['order'] = float(item_id)
+        item.setdefault('priority', DownloadPriority.NORMAL.value)
+        item.setdefault('manual_rank', None)
+        self._push_entry(item)
+        return item_id
+
+    def pop(self, exclude: Set[str] = frozenset()) -> Optional[Dict[str, Any]]:
+        """
+        Извлекает элемент с наивысшим приоритетом (кроме отложенных и
+        элементов сервисов из exclude).
+        """
+        best, best_service = None, None
+        for service in self._ready:
+            if service in exclude:
+                continue
+            head = self._head(service)
+            if head is not None and (best is None or head < best):
+                best, best_service = head, service
+        if best is None:
+            return None
+        heapq.heappop(self._heaps[best_service])
+        item = best[-1]
+        del self._entries[item['id']]
+        self._ready[best_service] -= 1
+        if not self._ready[best_service]:
+            del self._ready[best_service]
+        return item
+
+    def peek(self, count: int = 1) -> List[Dict[str, Any]]:
+        """Возвращает следующие count элементов без извлечения."""
+        return [entry[-1] for entry in heapq.nsmallest(count, self._entries.values())]
+
+    def get(self, item_id: int) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(item_id)
+        return entry[-1] if entry else None
+
+    def items(self) -> List[Dict[str, Any]]:
+        """Возвращает элементы в порядке обработки."""
+        return [entry[-1] for entry in sorted(self._entries.values())]
+
+    def remove(self, item_id: int) -> bool:
+        return self._invalidate(item_id) is not None
+
+    def _reset(self) -> None:
+        self._heaps.clear()
+        self._ready.clear()
+        self._stale = 0
+        self._entries.clear()
+        self._deferred.clear()
+
+    def clear(self) -> None:
+        self._reset()
+
+    def defer(self, item: Dict[str, Any]) -> None:
+        """Возвращает извлечённый элемент в очередь отложенным: pop() его не выдаёт."""
+        item['deferred'] = True
+        self._deferred[item['id']] = self._make_entry(item)
+
+    def restore_deferred(self) -> int:
+        """Возвращает отложенные элементы в кучу на прежние места."""
+        restored = len(self._deferred)
+        for entry in self._deferred.values():
+            self._push_heap(entry)
+        self._deferred.clear()
+        return restored
+
+    def deferred_count(self) -> int:
+        return len(self._deferred)
+
+    def ready_count(self) -> int:
+        """Число элементов, которые может выдать pop()."""
+        return len(self._entries) - len(self._deferred)
+
+    def services(self) -> Set[str]:
+        """Сервисы, у которых есть неотложенные элементы."""
+        return set(self._ready)
+
+    def set_priority(self, item_id: int, priority: int) -> None:
+        item = self._invalidate(item_id)
+        if item is not None:
+            item['priority'] = priority
+            item['manual_rank'] = None
+            self._push_entry(item)
+
+    def update_estimate(self, item_id: int, estimated_size: Optional[int]) -> None:
+        """Обновляет оценку размера; в режиме SJF элемент занимает новое место."""
+        item = self._invalidate(item_id)
+        if item is not None:
+            item['estimated_size'] = estimated_size
+            self._push_entry(item)
+
+    def move(self, item_id: int, new_index: int) -> None:
+        """
+        Перемещает элемент на позицию new_index (ручное перетаскивание).
+        Элемент получает приоритет и ключ соседей, поэтому порядок сохраняется
+        при последующих вставках.
+        """
+        item = self._invalidate(item_id)
+        if item is None:
+            return
+        ordered = sorted(self._entries.values())
+        new_index = max(0, min(new_index, len(ordered)))
+        prev_entry = ordered[new_index - 1] if new_index > 0 else None
+        next_entry = ordered[new_index] if new_index < len(ordered) else None
+
+        if prev_entry is None and next_entry is None:
+            pass
+        elif prev_entry is None:
+            item['priority'] = -next_entry[0]
+            item['manual_rank'] = next_entry[1]
+            item['order'] = next_entry[2] - 1
+        elif next_entry is not None and prev_entry[:2] == next_entry[:2]:
+            item['priority'] = -prev_entry[0]
+            item['manual_rank'] = prev_entry[1]
+            item['order'] = (prev_entry[2] + next_entry[2]) / 2
+        else:
+            item['priority'] = -prev_entry[0]
+            item['manual_rank'] = prev_entry[1]
+            item['order'] = prev_entry[2] + 1
+        self._push_entry(item)
+
+    def set_policy(self, policy: QueuePolicy) -> None:
+        """Меняет политику; ручные перестановки сбрасываются, так как ключи несовместимы."""
+        if policy == self.policy:
+            return
+        self.policy = policy
+        items = [entry[-1] for entry in self._entries.values()]
+        self._reset()
+        for item in items:
+            item['manual_rank'] = None
+            item['order'] = float(item['seq'])
+            self._push_entry(item)
+
+class CookieJarCache:
+    """
+    Кэш cookies браузера на сеанс.
+
+    Расшифровка базы cookies браузера выполняется один раз (и повторно — по
+    истечении TTL или после ответа 403), а не для каждого экземпляра YoutubeDL.
+    Каждая загрузка получает собственную копию эталонного набора, поэтому
+    cookies, установленные сервером во время одной загрузки, не влияют на другие.
+    """
+
+    def __init__(self, ttl: float = 1800.0) -> None:
+        self.ttl = ttl
+        self.browser: Optional[str] = None
+        self.cookie_file: Optional[str] = None
+        self.persist_path: Optional[str] = None
+        self._jar: Optional[YoutubeDLCookieJar] = None
+        self._loaded_at: float = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.browser or self.cookie_file)
+
+    def configure(self, browser: Optional[str] = None, cookie_file: Optional[str] = None,
+                  persist_path: Optional[str] = None) -> None:
+        """
+        Задаёт источник cookies: браузер (например "chrome" или "chrome:Profile 1")
+        и/или файл cookies в формате Netscape. persist_path — необязательный файл,
+        в который сохраняются расшифрованные cookies, чтобы не извлекать их при запуске.
+        """
+        with self._lock:
+            if browser and browser.split(':', 1)[0] not in SUPPORTED_BROWSERS:
+                logger.warning(f"Неподдерживаемый браузер для cookies: {browser}")
+                browser = None
+            self.browser = browser or None
+            self.cookie_file = cookie_file or None
+            self.persist_path = persist_path or None
+            self._jar = None
+            self._loaded_at = 0.0
+        logger.info(f"Источник cookies: браузер={self.browser}, файл={self.cookie_file}")
+
+    def invalidate(self) -> None:
+        """Сбрасывает кэш, например после ответа 403."""
+        with self._lock:
+            if self._jar is not None:
+                logger.info("Кэш cookies сброшен, при следующей загрузке cookies будут извлечены заново")
+            self._jar = None
+            self._loaded_at = 0.0
+            if self.persist_path and os.path.exists(self.persist_path):
+                os.remove(self.persist_path)
+
+    def get_jar(self) -> Optional[YoutubeDLCookieJar]:
+        """Возвращает копию набора cookies для одной загрузки или None, если cookies не настроены."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            if self._jar is None or time.time() - self._loaded_at > self.ttl:
+                self._jar = self._load()
+                self._loaded_at = time.time()
+            master = self._jar
+        jar = YoutubeDLCookieJar()
+        for cookie in master:
+            jar.set_cookie(copy.copy(cookie))
+        return jar
+
+    def _load(self) -> YoutubeDLCookieJar:
+        started = time.monotonic()
+        jar = YoutubeDLCookieJar()
+        try:
+            if self.persist_path and os.path.exists(self.persist_path) \
+                    and time.time() - os.path.getmtime(self.persist_path) < self.ttl:
+                jar = YoutubeDLCookieJar(self.persist_path)
+                jar.load()
+                logger.info(f"Cookies загружены из кэша {self.persist_path}: {len(jar)} шт.")
+                return jar
+            if self.browser:
+                browser_name, _, profile = self.browser.partition(':')
+                jar = extract_cookies_from_browser(browser_name, profile or None)
+            if self.cookie_file and os.path.exists(self.cookie_file):
+                file_jar = YoutubeDLCookieJar(self.cookie_file)
+                file_jar.load()
+                for cookie in file_jar:
+                    jar.set_cookie(cookie)
+            if self.persist_path and self.browser:
+                jar.save(self.persist_path)
+            logger.info(f"Cookies извлечены ({len(jar)} шт.) за {time.monotonic() - started:.2f} с")
+        except Exception:
+            # Загрузка продолжается без cookies; повторная попытка — по истечении TTL
+            logger.exception("Не удалось получить cookies, загрузка продолжится без них")
+        return jar
+
+# Общий кэш cookies для всех загрузок и запросов разрешений
+cookie_cache = CookieJarCache()
+
+class CancelScope:
+    """
+    Сетевые соединения и дочерние процессы (ffmpeg, aria2c) одной загрузки.
+    Отмена закрывает сокеты и завершает процессы, поэтому прерывает любую фазу:
+    извлечение метаданных, загрузку и обработку в ffmpeg.
+    """
+
+    _local = threading.local()
+
+    def __init__(self) -> None:
+        self.event = threading.Event()
+        self._lock = threading.Lock()
+        self._sockets: "weakref.WeakSet[socket.socket]" = weakref.WeakSet()
+        self._processes: List[subprocess.Popen] = []
+
+    @classmethod
+    def current(cls) -> Optional['CancelScope']:
+        """Область отмены, привязанная к текущему потоку."""
+        return getattr(cls._local, 'scope', None)
+
+    @contextlib.contextmanager
+    def bind(self):
+        """
+        Привязывает область к текущему потоку на время блока with. Пока привязана
+        хотя бы одна область, действуют перехватчики cancel_hooks.
+        """
+        previous = self.current()
+        self._local.scope = self
+        cancel_hooks.acquire()
+        try:
+            yield self
+        finally:
+            cancel_hooks.release()
+            self._local.scope = previous
+
+    def wrap(self, func):
+        """Оборачивает func для выполнения в другом потоке внутри этой области."""
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with self.bind():
+                return func(*args, **kwargs)
+        return wrapper
+
+    def add_socket(self, sock: socket.socket) -> None:
+        with self._lock:
+            self._sockets.add(sock)
+        if self.event.is_set():
+            self._shutdown(sock)
+
+    def add_process(self, process: subprocess.Popen) -> None:
+        with self._lock:
+            self._processes = [p for p in self._processes if p.poll() is None]
+            self._processes.append(process)
+        if self.event.is_set():
+            self._terminate(process)
+
+    def cancel(self) -> None:
+        self.event.set()
+        with self._lock:
+            sockets = list(self._sockets)
+            processes = list(self._processes)
+        for sock in sockets:
+            self._shutdown(sock)
+        for process in processes:
+            self._terminate(process)
+
+    @staticmethod
+    def _shutdown(sock: socket.socket) -> None:
+        # shutdown, в отличие от close, прерывает чтение, заблокированное в другом потоке
+        try:
+            if sock.fileno() != -1:
+                sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    @staticmethod
+    def _terminate(process: subprocess.Popen) -> None:
+        if process.poll() is None:
+            logger.info(f"Завершение дочернего процесса {process.pid} при отмене загрузки")
+            try:
+                process.terminate()
+            except OSError:
+                pass
+
+class CancelHooks:
+    """
+    Перехватчики, которые регистрируют сокеты и процессы, создаваемые yt-dlp в
+    потоке загрузки, в его области отмены (CancelScope). Устанавливаются при
+    привязке первой области и снимаются, когда не остаётся ни одной, поэтому
+    вне загрузок соединения и процессы не затрагиваются. Сокеты перехватываются
+    через внутренний модуль yt-dlp; если его нет, отмена прерывает соединения
+    только по таймауту, о чём пишется предупреждение.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._users = 0
+        self._restore: List[Callable[[], None]] = []
+
+    def acquire(self) -> None:
+        with self._lock:
+            self._users += 1
+            if self._users == 1:
+                self._restore = self._install()
+
+    def release(self) -> None:
+        with self._lock:
+            self._users -= 1
+            if self._users == 0:
+                for restore in reversed(self._restore):
+                    restore()
+                self._restore = []
+
+    @staticmethod
+    def _patch(owner: Any, name: str, replacement: Any) -> Callable[[], None]:
+        """Заменяет owner.name; возвращает функцию, которая вернёт прежнее значение."""
+        original = getattr(owner, name)
+        setattr(owner, name, replacement)
+
+        def restore() -> None:
+            # Не затираем замену, сделанную после нас кем-то другим
+            if getattr(owner, name, None) is replacement:
+                setattr(owner, name, original)
+        return restore
+
+    def _install(self) -> List[Callable[[], None]]:
+        restore: List[Callable[[], None]] = []
+        try:
+            from yt_dlp.networking import _helper
+            create_connection = _helper.create_connection
+        except (ImportError, AttributeError) as e:
+            logger.warning(f"Отмена не сможет прерывать соединения yt-dlp (нет create_connection: {e})")
+        else:
+            def tracked_create_connection(*args, **kwargs):
+                sock = create_connection(*args, **kwargs)
+                scope = CancelScope.current()
+                if scope is not None:
+                    scope.add_socket(sock)
+                return sock
+
+            # Обработчики запросов импортируют функцию по имени — заменяем и у них
+            restore.append(self._patch(_helper, 'create_connection', tracked_create_connection))
+            for module_name in ('_urllib', '_requests', '_websockets'):
+                module = sys.modules.get(f'yt_dlp.networking.{module_name}')
+                if module is not None and getattr(module, 'create_connection', None) is create_connection:
+                    restore.append(self._patch(module, 'create_connection', tracked_create_connection))
+
+        # TLS-сокет забирает дескриптор у исходного, поэтому регистрируем и его
+        wrap_socket = ssl.SSLContext.wrap_socket
+
+        def tracked_wrap_socket(context, sock, *args, **kwargs):
+            ssl_sock = wrap_socket(context, sock, *args, **kwargs)
+            scope = CancelScope.current()
+            if scope is not None:
+                scope.add_socket(ssl_sock)
+            return ssl_sock
+
+        restore.append(self._patch(ssl.SSLContext, 'wrap_socket', tracked_wrap_socket))
+
+        popen_init = YDLPopen.__init__
+
+        def tracked_popen_init(process, *args, **kwargs):
+            popen_init(process, *args, **kwargs)
+            scope = CancelScope.current()
+            if scope is not None:
+                scope.add_process(process)
+
+        restore.append(self._patch(YDLPopen, '__init__', tracked_popen_init))
+        return restore
+
+cancel_hooks = CancelHooks()
+
+class PhaseTimer:
+    """Время, проведённое задачей в каждой фазе (извлечение, загрузка, объединение, конвертация)."""
+
+    def __init__(self, phase: str) -> None:
+        self.current: Optional[str] = phase
+        self.started = time.perf_counter()
+        self.durations: Dict[str, float] = defaultdict(float)
+
+    def mark(self, phase: Optional[str]) -> None:
+        """Переключает текущую фазу; вызывается из хуков yt-dlp."""
+        if phase == self.current:
+            return
+        now = time.perf_counter()
+        if self.current is not None:
+            self.durations[self.current] += now - self.started
+        self.current, self.started = phase, now
+
+    def stop(self) -> Dict[str, float]:
+        self.mark(None)
+        return dict(self.durations)
+
+class JobProfiler:
+    """
+    Режим профилирования (--profile или меню "Настройки"): для каждой задачи
+    сохраняет профиль cProfile в .prof, измеряет фазы и выделения памяти
+    (tracemalloc) и обновляет сводный отчёт top-N по сервису в папке логов.
+    """
+
+    def __init__(self, directory: str, top_n: int = 30) -> None:
+        self.directory = directory
+        self.top_n = top_n
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._active = 0
+        self._stats: Dict[str, pstats.Stats] = {}
+        self._phases: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        self._memory: Dict[str, Counter] = defaultdict(Counter)
+        self._jobs: Counter = Counter()
+
+    def set_enabled(self, enabled: bool) -> None:
+        with self._lock:
+            if enabled == self.enabled:
+                return
+            self.enabled = enabled
+            if enabled:
+                os.makedirs(self.directory, exist_ok=True)
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start(1)
+            elif not self._active and tracemalloc.is_tracing():
+                tracemalloc.stop()
+        logger.info(f"Профилирование {'включено' if enabled else 'выключено'}: {self.directory}")
+
+    @contextlib.contextmanager
+    def profile(self, kind: str, url: str, phase: str = 'extract'):
+        """Профилирует блок with; возвращает PhaseTimer (фазы считаются и без профилирования)."""
+        timer = PhaseTimer(phase)
+        if not self.enabled:
+            yield timer
+            return
+        with self._lock:
+            self._active += 1
+        cpu_profile: Optional[cProfile.Profile] = cProfile.Profile()
+        try:
+            cpu_profile.enable()
+        except ValueError:
+            # Начиная с Python 3.12 профилировщик один на процесс: одновременно
+            # профилируется только одна задача, у остальных измеряются фазы и память
+            cpu_profile = None
+        memory_before = tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
+        try:
+            yield timer
+        finally:
+            if cpu_profile is not None:
+                cpu_profile.disable()
+            memory_after = tracemalloc.take_snapshot() if memory_before is not None else None
+            self._record(kind, url, timer.stop(), cpu_profile, memory_before, memory_after)
+            with self._lock:
+                self._active -= 1
+
+    def _record(self, kind: str, url: str, phases: Dict[str, float], cpu_profile: Optional[cProfile.Profile],
+                memory_before, memory_after) -> None:
+        service = VideoURL.get_service_name(url)
+        # Имена файлов дочерних процессов загрузки не должны совпадать с основным
+        suffix = f"_{os.getpid()}" if multiprocessing.parent_process() is not None else ""
+        slug = re.sub(r'\W+', '_', service).strip('_') or 'unknown'
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+        memory_top: List[Tuple[str, int]] = []
+        if memory_after is not None:
+            # Выделения самого tracemalloc в отчёт не попадают
+            own = [tracemalloc.Filter(False, tracemalloc.__file__)]
+            diff = memory_after.filter_traces(own).compare_to(memory_before.filter_traces(own), 'lineno')
+            memory_top = [(str(stat.traceback[0]), stat.size_diff) for stat in diff[:self.top_n] if stat.size_diff > 0]
+        try:
+            if cpu_profile is not None:
+                cpu_profile.dump_stats(os.path.join(self.directory, f"{stamp}_{slug}_{kind}{suffix}.prof"))
+            with self._lock:
+                self._jobs[service] += 1
+                for phase, seconds in phases.items():
+                    self._phases[service][phase] += seconds
+                self._memory[service].update(dict(memory_top))
+                if cpu_profile is not None:
+                    if service in self._stats:
+                        self._stats[service].add(cpu_profile)
+                    else:
+                        self._stats[service] = pstats.Stats(cpu_profile)
+                self._write_report(service, os.path.join(self.directory, f"report_{slug}{suffix}.txt"))
+        except OSError as e:
+            logger.error(f"Не удалось сохранить профиль: {e}")
+        phases_text = ", ".join(f"{phase} {seconds:.2f} с" for phase, seconds in phases.items())
+        logger.info(f"Профиль {kind} ({service}): {phases_text}; {url}")
+
+    def _write_report(self, service: str, path: str) -> None:
+        """Перезаписывает сводный отчёт по сервису. Вызывается под self._lock."""
+        jobs = self._jobs[service]
+        lines = [f"Сервис: {service}", f"Задач: {jobs}", "", "Фазы (всего / в среднем на задачу):"]
+        for phase, seconds in sorted(self._phases[service].items(), key=lambda item: -item[1]):
+            lines.append(f"  {phase:<12} {seconds:10.2f} с {seconds / jobs:10.2f} с")
+        lines += ["", f"Память: top-{self.top_n} мест выделения (прирост за задачи):"]
+        for location, size in self._memory[service].most_common(self.top_n):
+            lines.append(f"  {size / 1024:10.1f} КБ  {location}")
+        if service in self._stats:
+            stream = io.StringIO()
+            stats = self._stats[service]
+            stats.stream = stream
+            stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.top_n)
+            lines += ["", f"CPU: top-{self.top_n} функций по накопленному времени:", stream.getvalue()]
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write("\n".join(lines))
+
+job_profiler = JobProfiler(os.path.join(log_dir, 'profiles'), config.PROFILE_TOP_N)
+
+class RangeHttpFD(HttpFD):
+    """Общая часть загрузчиков по диапазонам байтов."""
+
+    def _probe_size(self, url: str, headers: HTTPHeaderDict) -> Optional[int]:
+        """Проверяет поддержку Range и возвращает полный размер файла."""
+        request = YDLRequest(url, headers={**headers, 'Range': 'bytes=0-0'})
+        try:
+            with self.ydl.urlopen(request) as response:
+                if response.status != 206:
+                    return None
+                _, _, total = parse_http_range(response.headers.get('Content-Range'))
+                return total
+        except (TransportError, YDLHTTPError) as e:
+            logger.warning(f"Не удалось определить размер файла: {e}")
+            return None
+
+class SegmentedHttpFD(RangeHttpFD):
+    """
+    Многопоточная загрузка прогрессивного файла по диапазонам байтов.
+
+    Файл заранее создаётся нужного размера, каждый сегмент загружается по своему
+    соединению и пишется на своё место (os.pwrite, где доступно). Состояние
+    сегментов сохраняется рядом с временным файлом, поэтому прерванная загрузка
+    продолжается с места остановки. Если сервер не поддерживает Range или размер
+    неизвестен, используется обычный HttpFD.
+    """
+
+    BLOCK_SIZE = 256 * 1024
+    STATE_SAVE_INTERVAL = 2.0
+    PROGRESS_INTERVAL = 0.5
+
+    def real_download(self, filename: str, info_dict: Dict[str, Any]) -> bool:
+        options: Dict[str, Any] = self.params.get('segmented_download') or {}
+        connections: int = max(1, int(options.get('connections', 4)))
+        min_size: int = int(options.get('min_size', 8 * 1024 * 1024))
+        headers = HTTPHeaderDict({'Accept-Encoding': 'identity'}, info_dict.get('http_headers'))
+
+        total = self._probe_size(info_dict['url'], headers)
+        if not total or total < min_size or connections == 1:
+            logger.info(f"Сегментированная загрузка недоступна (размер: {total}), используется HttpFD")
+            return super().real_download(filename, info_dict)
+
+        tmpfilename = self.temp_name(filename)
+        state_path = tmpfilename + '.segments'
+        segments = self._load_state(state_path, tmpfilename, total)
+        if segments is None:
+            segment_size = -(-total // connections)
+            segments = [[start, min(start + segment_size, total) - 1, 0]
+                        for start in range(0, total, segment_size)]
+            # Предварительное выделение файла под весь размер
+            with open(tmpfilename, 'wb') as f:
+                f.truncate(total)
+        else:
+            logger.info(f"Продолжение сегментированной загрузки: {tmpfilename}")
+
+        self.report_destination(filename)
+        logger.info(f"Сегментированная загрузка: {total} байт, сегментов: {len(segments)}")
+        state = {
+            'lock': threading.Lock(),
+            'stop': threading.Event(),
+            'downloaded': sum(segment[2] for segment in segments),
+            'started': time.time(),
+            'last_progress': 0.0,
+            'last_save': time.time(),
+        }
+        use_pwrite = hasattr(os, 'pwrite')
+        shared_fd = os.open(tmpfilename, os.O_RDWR | getattr(os, 'O_BINARY', 0)) if use_pwrite else None
+        try:
+            # Сегменты выполняются в других потоках — передаём им область отмены загрузки
+            scope = CancelScope.current()
+            download_segment = scope.wrap(self._download_segment) if scope is not None else self._download_segment
+            with ThreadPoolExecutor(max_workers=len(segments), thread_name_prefix='segment') as executor:
+                futures = [executor.submit(download_segment, info_dict, headers, tmpfilename,
+                                           shared_fd, segment, segments, state, state_path, total)
+                           for segment in segments if segment[0] + segment[2] <= segment[1]]
+                # Первая ошибка (или отмена в хуке прогресса) останавливает остальные сегменты
+                done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+                failed = [future for future in done if future.exception() is not None]
+                if failed:
+                    state['stop'].set()
+                    raise failed[0].exception()
+        finally:
+            if shared_fd is not None:
+                os.close(shared_fd)
+            with state['lock']:
+                self._save_state(state_path, total, segments)
+
+        os.remove(state_path)
+        self.try_rename(tmpfilename, filename)
+        self._hook_progress({
+            'downloaded_bytes': total,
+            'total_bytes': total,
+            'filename': filename,
+            'status': 'finished',
+            'elapsed': time.time() - state['started'],
+        }, info_dict)
+        return True
+
+    def _download_segment(self, info_dict: Dict[str, Any], headers: HTTPHeaderDict, tmpfilename: str,
+                          shared_fd: Optional[int], segment: List[int], segments: List[List[int]],
+                          state: Dict[str, Any], state_path: str, total: int) -> None:
+        retries = int(self.params.get('retries', 10))
+        handle = None if shared_fd is not None else open(tmpfilename, 'r+b')
+        attempt = 0
+        try:
+            while segment[0] + segment[2] <= segment[1]:
+                if state['stop'].is_set():
+                    return
+                start = segment[0] + segment[2]
+                request = YDLRequest(info_dict['url'], headers={**headers, 'Range': f'bytes={start}-{segment[1]}'})
+                try:
+                    with self.ydl.urlopen(request) as response:
+                        if response.status != 206:
+                            raise DownloadError(f"Сервер перестал поддерживать Range (HTTP {response.status})")
+                        while not state['stop'].is_set():
+                            to_read = min(self.BLOCK_SIZE, segment[1] - (segment[0] + segment[2]) + 1)
+                            if to_read <= 0:
+                                break
+                            block = response.read(to_read)
+                            if not block:
+                                raise TransportError("Соединение закрыто до окончания сегмента")
+                            offset = segment[0] + segment[2]
+                            if shared_fd is not None:
+                                os.pwrite(shared_fd, block, offset)
+                            else:
+                                handle.seek(offset)
+                                handle.write(block)
+                            self._on_block(len(block), segment, segments, state, state_path, total, tmpfilename,
+                                           info_dict)
+                    attempt = 0
+                except (TransportError, YDLHTTPError) as e:
+                    attempt += 1
+                    if attempt > retries:
+                        raise
+                    logger.warning(f"Ошибка сегмента {segment[0]}-{segment[1]}: {e}. "
+                                   f"Повтор {attempt}/{retries}")
+                    state['stop'].wait(min(2 ** attempt, 10))
+        finally:
+            if handle is not None:
+                handle.close()
+
+    def _on_block(self, size: int, segment: List[int], segments: List[List[int]], state: Dict[str, Any],
+                  state_path: str, total: int, tmpfilename: str, info_dict: Dict[str, Any]) -> None:
+        now = time.time()
+        with state['lock']:
+            segment[2] += size
+            state['downloaded'] += size
+            if now - state['last_save'] >= self.STATE_SAVE_INTERVAL:
+                state['last_save'] = now
+                self._save_state(state_path, total, segments)
+            if now - state['last_progress'] < self.PROGRESS_INTERVAL:
+                return
+            state['last_progress'] = now
+            downloaded = state['downloaded']
+        elapsed = now - state['started']
+        speed = downloaded / elapsed if elapsed > 0 else None
+        # Хуки прогресса вызываются из потоков сегментов; исключение (например,
+        # отмена пользователем) останавливает все сегменты
+        self._hook_progress({
+            'status': 'downloading',
+            'downloaded_bytes': downloaded,
+            'total_bytes': total,
+            'tmpfilename': tmpfilename,
+            'filename': self.undo_temp_name(tmpfilename),
+            'elapsed': elapsed,
+            'speed': speed,
+            'eta': (total - downloaded) / speed if speed else None,
+        }, info_dict)
+
+    @staticmethod
+    def _save_state(state_path: str, total: int, segments: List[List[int]]) -> None:
+        with open(state_path, 'w', encoding='utf-8') as f:
+            json.dump({'total': total, 'segments': segments}, f)
+
+    @staticmethod
+    def _load_state(state_path: str, tmpfilename: str, total: int) -> Optional[List[List[int]]]:
+        try:
+            with open(state_path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+            if saved['total'] == total and os.path.getsize(tmpfilename) == total:
+                return saved['segments']
+        except (OSError, ValueError, KeyError):
+            pass
+        return None
+
+class AdaptiveChunker:
+    """
+    Размер диапазона для одного задания. После каждого диапазона измеряется
+    скорость: пока она держится около лучшей, диапазон увеличивается; если
+    падает вдвое, уменьшается. Размер, на котором соединение пришлось
+    переоткрыть, становится потолком; после REPROBE_AFTER удачных диапазонов
+    потолок снимается и больший размер пробуется снова. Лучший по скорости
+    размер запоминается для сервиса (ChunkSizeStore).
+    """
+
+    GROW_RATIO = 0.8        # скорость не ниже этой доли лучшей — диапазон увеличивается
+    SHRINK_RATIO = 0.5      # скорость ниже этой доли лучшей — диапазон уменьшается
+    REPROBE_AFTER = 8
+
+    def __init__(self, initial: int, minimum: int, maximum: int) -> None:
+        self.minimum = minimum
+        self.maximum = maximum
+        self.size = min(max(initial, minimum), maximum)
+        self.ceiling = maximum
+        self.good_chunks = 0
+        self.best_rate = 0.0
+        self.best_size = self.size
+
+    def record(self, size: int, seconds: float) -> None:
+        """Учитывает загруженный диапазон и выбирает размер следующего."""
+        rate = size / max(seconds, 1e-3)
+        if rate > self.best_rate:
+            self.best_rate, self.best_size = rate, self.size
+        if rate >= self.best_rate * self.GROW_RATIO:
+            self.good_chunks += 1
+            if self.good_chunks >= self.REPROBE_AFTER:
+                self.ceiling, self.good_chunks = self.maximum, 0
+            if self.size * 2 < self.ceiling:
+                self.size = min(self.size * 2, self.maximum)
+        elif rate < self.best_rate * self.SHRINK_RATIO:
+            self.good_chunks = 0
+            self.size = max(self.size // 2, self.minimum)
+
+    def collapsed(self, rate: float) -> bool:
+        """Скорость внутри диапазона упала настолько, что соединение стоит переоткрыть."""
+        return self.best_rate > 0 and rate < self.best_rate * config.ADAPTIVE_CHUNK_COLLAPSE_RATIO
+
+    def on_collapse(self) -> None:
+        self.ceiling, self.good_chunks = self.size, 0
+        self.size = max(self.size // 2, self.minimum)
+
+class ChunkSizeStore:
+    """Подобранные размеры диапазонов по сервисам, сохраняются между запусками."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._sizes: Optional[Dict[str, int]] = None
+
+    def _load(self) -> Dict[str, int]:
+        if self._sizes is None:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self._sizes = {service: int(size) for service, size in json.load(f).items()}
+            except (OSError, ValueError, AttributeError):
+                self._sizes = {}
+        return self._sizes
+
+    def get(self, service: str) -> Optional[int]:
+        with self._lock:
+            return self._load().get(service)
+
+    def learn(self, service: str, size: int) -> None:
+        """Сглаживает новое значение с прежним (среднее геометрическое) и сохраняет."""
+        with self._lock:
+            sizes = self._load()
+            previous = sizes.get(service)
+            sizes[service] = int(math.sqrt(previous * size)) if previous else size
+            try:
+                temp_path = self.path + '.tmp'
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    json.dump(sizes, f)
+                os.replace(temp_path, self.path)
+            except OSError as e:
+                logger.warning(f"Не удалось сохранить размеры диапазонов: {e}")
+                return
+        logger.info(f"Размер диапазона для {service}: {sizes[service]} байт")
+
+chunk_sizes = ChunkSizeStore(config.CHUNK_SIZES_FILE)
+
+class AdaptiveChunkHttpFD(RangeHttpFD):
+    """
+    Загрузка прогрессивного файла последовательными диапазонами адаптивного
+    размера (параметр adaptive_chunks). Помогает против серверов, которые
+    замедляют длинное чтение одного диапазона; если скорость внутри диапазона
+    резко падает, соединение закрывается и диапазон продолжается по новому.
+    Загрузка продолжается с размера имеющегося временного файла.
+    """
+
+    BLOCK_SIZE = 64 * 1024
+    RATE_WINDOW = 1.0       # секунд, за которые измеряется скорость внутри диапазона
+    PROGRESS_INTERVAL = 0.5
+
+    def real_download(self, filename: str, info_dict: Dict[str, Any]) -> bool:
+        options: Dict[str, Any] = self.params.get('adaptive_chunks') or {}
+        service = options.get('service', 'default')
+        headers = HTTPHeaderDict({'Accept-Encoding': 'identity'}, info_dict.get('http_headers'))
+        total = self._probe_size(info_dict['url'], headers)
+        if not total:
+            logger.info(f"Загрузка диапазонами недоступна (размер: {total}), используется HttpFD")
+            return super().real_download(filename, info_dict)
+
+        tmpfilename = self.temp_name(filename)
+        downloaded = os.path.getsize(tmpfilename) if os.path.isfile(tmpfilename) else 0
+        if downloaded > total or not self.params.get('continuedl', True):
+            downloaded = 0
+        chunker = AdaptiveChunker(chunk_sizes.get(service) or config.ADAPTIVE_CHUNK_INITIAL,
+                                  config.ADAPTIVE_CHUNK_MIN, config.ADAPTIVE_CHUNK_MAX)
+        self.report_destination(filename)
+        logger.info(f"Загрузка диапазонами: {total} байт, начальный диапазон {chunker.size} байт"
+                    + (f", продолжение с {downloaded}" if downloaded else ""))
+        retries = int(self.params.get('retries', 10))
+        started, last_progress, attempt, reopened = time.time(), 0.0, 0, 0
+        with open(tmpfilename, 'r+b' if downloaded else 'wb') as f:
+            f.truncate(downloaded)
+            f.seek(downloaded)
+            while downloaded < total:
+                end = min(downloaded + chunker.size, total) - 1
+                request = YDLRequest(info_dict['url'], headers={**headers, 'Range': f'bytes={downloaded}-{end}'})
+                chunk_start, chunk_bytes = time.monotonic(), 0
+                window_start, window_bytes = chunk_start, 0
+                try:
+                    with self.ydl.urlopen(request) as response:
+                        if response.status != 206:
+                            raise DownloadError(f"Сервер перестал поддерживать Range (HTTP {response.status})")
+                        while downloaded <= end:
+                            block = response.read(min(self.BLOCK_SIZE, end - downloaded + 1))
+                            if not block:
+                                raise TransportError("Соединение закрыто до окончания диапазона")
+                            f.write(block)
+                            downloaded += len(block)
+                            chunk_bytes += len(block)
+                            window_bytes += len(block)
+                            now = time.monotonic()
+                            if now - window_start >= self.RATE_WINDOW:
+                                rate = window_bytes / (now - window_start)
+                                if downloaded <= end and chunker.collapsed(rate):
+                                    chunker.on_collapse()
+                                    reopened += 1
+                                    logger.info(f"Скорость упала до {rate:.0f} Б/с, соединение переоткрыто, "
+                                                f"диапазон {chunker.size} байт")
+                                    break
+                                window_start, window_bytes = now, 0
+                            if time.time() - last_progress >= self.PROGRESS_INTERVAL:
+                                last_progress = time.time()
+                                self._report_progress(downloaded, total, started, tmpfilename, info_dict)
+                        else:
+                            chunker.record(chunk_bytes, time.monotonic() - chunk_start)
+                    attempt = 0
+                except (TransportError, YDLHTTPError) as e:
+                    attempt += 1
+                    scope = CancelScope.current()
+                    cancelled = scope is not None and scope.event.is_set()
+                    if attempt > retries or cancelled:
+                        raise
+                    logger.warning(f"Ошибка диапазона {downloaded}-{end}: {e}. Повтор {attempt}/{retries}")
+                    f.flush()
+                    if scope is not None:
+                        scope.event.wait(min(2 ** attempt, 10))
+                    else:
+                        time.sleep(min(2 ** attempt, 10))
+
+        chunk_sizes.learn(service, chunker.best_size)
+        logger.info(f"Загрузка диапазонами завершена: лучшая скорость {chunker.best_rate:.0f} Б/с "
+                    f"при диапазоне {chunker.best_size} байт, переоткрытий соединения: {reopened}")
+        self.try_rename(tmpfilename, filename)
+        self._hook_progress({
+            'downloaded_bytes': total,
+            'total_bytes': total,
+            'filename': filename,
+            'status': 'finished',
+            'elapsed': time.time() - started,
+        }, info_dict)
+        return True
+
+    def _report_progress(self, downloaded: int, total: int, started: float, tmpfilename: str,
+                         info_dict: Dict[str, Any]) -> None:
+        elapsed = time.time() - started
+        speed = downloaded / elapsed if elapsed > 0 else None
+        self._hook_progress({
+            'status': 'downloading',
+            'downloaded_bytes': downloaded,
+            'total_bytes': total,
+            'tmpfilename': tmpfilename,
+            'filename': self.undo_temp_name(tmpfilename),
+            'elapsed': elapsed,
+            'speed': speed,
+            'eta': (total - downloaded) / speed if speed else None,
+        }, info_dict)
+
+class StreamingMergeFD(FFmpegFD):
+    """
+    FFmpegFD для потокового объединения: ffmpeg пишет ход работы (-progress)
+    в файл рядом с результатом, отдельный поток раз в POLL_INTERVAL секунд
+    передаёт записанные байты и прошедшее время в progress-хуки. Обычный
+    FFmpegFD сообщает о ходе загрузки только по её завершении.
+    """
+
+    POLL_INTERVAL = 1.0
+
+    @classmethod
+    def get_basename(cls):
+        # Имя определяет ключ external_downloader_args и сообщения yt-dlp
+        return FFmpegFD.get_basename()
+
+    def _call_downloader(self, tmpfilename, info_dict):
+        progress_path = tmpfilename + '.progress'
+        downloader_args = dict(self.params.get('external_downloader_args') or {})
+        downloader_args['ffmpeg_o'] = [*downloader_args.get('ffmpeg_o', []), '-progress', progress_path]
+        self.params = {**self.params, 'external_downloader_args': downloader_args}
+        stop = threading.Event()
+        watcher = threading.Thread(target=self._watch_progress, args=(progress_path, tmpfilename, info_dict, stop),
+                                   daemon=True)
+        watcher.start()
+        try:
+            return super()._call_downloader(tmpfilename, info_dict)
+        finally:
+            stop.set()
+            watcher.join()
+            with contextlib.suppress(OSError):
+                os.remove(progress_path)
+
+    @staticmethod
+    def _read_progress(path: str) -> Dict[str, str]:
+        """Последние значения из файла -progress (читается только его конец)."""
+        try:
+            with open(path, 'rb') as f:
+                f.seek(0, os.SEEK_END)
+                f.seek(max(f.tell() - 4096, 0))
+                lines = f.read().decode('utf-8', 'replace').splitlines()
+        except OSError:
+            return {}
+        return dict(line.split('=', 1) for line in lines if '=' in line)
+
+    def _watch_progress(self, progress_path: str, tmpfilename: str, info_dict: Dict[str, Any],
+                        stop: threading.Event) -> None:
+        started = time.monotonic()
+        total = sum(fmt.get('filesize') or fmt.get('filesize_approx') or 0
+                    for fmt in info_dict.get('requested_formats') or []) or None
+        while not stop.wait(self.POLL_INTERVAL):
+            values = self._read_progress(progress_path)
+            try:
+                downloaded = int(values['total_size'])
+            except (KeyError, ValueError):
+                continue
+            elapsed = time.monotonic() - started
+            speed = downloaded / elapsed if elapsed else None
+            status = {
+                'status': 'downloading',
+                'filename': self.undo_temp_name(tmpfilename),
+                'tmpfilename': tmpfilename,
+                'downloaded_bytes': downloaded,
+                'total_bytes_estimate': total,
+                'elapsed': elapsed,
+                'speed': speed,
+                'eta': (total - downloaded) / speed if total and speed and total > downloaded else None,
+            }
+            try:
+                self._hook_progress(status, info_dict)
+            except Exception:
+                # Хук сообщает об отмене исключением; ffmpeg завершается средствами отмены загрузки
+                return
+
+class VideoDownloaderYDL(yt_dlp.YoutubeDL):
+    """
+    YoutubeDL с поддержкой заранее загруженного набора cookies, сегментированной
+    загрузки прогрессивных файлов (параметр segmented_download), загрузки
+    диапазонами адаптивного размера (параметр adaptive_chunks) и потокового
+    объединения видео и аудио (параметр streaming_merge).
+    """
+
+    def __init__(self, params: Optional[Dict[str, Any]] = None,
+                 cookiejar: Optional[YoutubeDLCookieJar] = None) -> None:
+        if cookiejar is not None:
+            # cookiejar у YoutubeDL — cached_property; подставляем готовый набор,
+            # чтобы yt-dlp не расшифровывал базу браузера повторно
+            self.__dict__['cookiejar'] = cookiejar
+        super().__init__(params)
+        self._stream_merging = False
+        # Загрузчик, заданный до подмены на ffmpeg, — для загрузки потоков по отдельности
+        self._external_downloader = None
+
+    def process_info(self, info_dict):
+        """
+        С streaming_merge видео и аудио передаются одному процессу ffmpeg, который
+        сразу пишет итоговый файл, без промежуточных файлов потоков и отдельного
+        объединения. Если ffmpeg не справился (формат, сервер), потоки загружаются
+        обычным способом и объединяются внутри того же шага загрузки (_stream_merge),
+        поэтому остальная обработка (хуки, субтитры, архив) выполняется один раз.
+        """
+        if (not self.params.get('streaming_merge') or not info_dict.get('requested_formats')
+                or info_dict.get('section_start') or info_dict.get('section_end')
+                or not FFmpegFD.can_merge_formats(info_dict, self.params)):
+            return super().process_info(info_dict)
+
+        self._stream_merging = True
+        self._external_downloader = self.params.get('external_downloader')
+        try:
+            # yt-dlp выбирает объединение средствами ffmpeg по параметрам экземпляра,
+            # поэтому загрузчик подменяется только на время этого вызова
+            with self._params_override(external_downloader={'default': 'ffmpeg'}):
+                return super().process_info(info_dict)
+        finally:
+            self._stream_merging = False
+
+    @contextlib.contextmanager
+    def _params_override(self, **values):
+        """Временно заменяет параметры; прежние значения (или их отсутствие) восстанавливаются."""
+        saved = {key: self.params[key] for key in values if key in self.params}
+        self.params.update(values)
+        try:
+            yield
+        finally:
+            for key in values:
+                if key in saved:
+                    self.params[key] = saved[key]
+                else:
+                    self.params.pop(key, None)
+
+    def dl(self, name, info, subtitle=False, test=False):
+        if self._stream_merging and info.get('requested_formats'):
+            return self._stream_merge(name, info)
+        options: Optional[Dict[str, Any]] = self.params.get('segmented_download')
+        adaptive = self.params.get('adaptive_chunks')
+        if (not (options or adaptive) or test or subtitle or name == '-' or not info.get('url')
+                or info.get('requested_formats') or determine_protocol(info) not in ('http', 'https')
+                or info.get('section_start') or info.get('section_end')):
+            return super().dl(name, info, subtitle, test)
+
+        if not options:
+            fd = AdaptiveChunkHttpFD(self, self.params)
+        elif options.get('backend') == 'aria2c' and Aria2cFD.available():
+            connections = int(options.get('connections', 4))
+            params = dict(self.params)
+            params['external_downloader_args'] = {'aria2c': [
+                f'--split={connections}', f'--max-connection-per-server={connections}'
+            ]}
+            fd = Aria2cFD(self, params)
+        else:
+            fd = SegmentedHttpFD(self, self.params)
+        for ph in self._progress_hooks:
+            fd.add_progress_hook(ph)
+        logger.info(f"Загрузчик {fd.FD_NAME} для {info.get('format_id')}")
+        new_info = self._copy_infodict(info)
+        if new_info.get('http_headers') is None:
+            new_info['http_headers'] = self._calc_headers(new_info)
+        return fd.download(name, new_info, subtitle)
+
+    def _stream_merge(self, name: str, info: Dict[str, Any]) -> Tuple[bool, bool]:
+        logger.info(f"Потоковое объединение форматов {info.get('format_id')} в {name}")
+        params = {key: value for key, value in self.params.items() if key != 'external_downloader'}
+        fd = StreamingMergeFD(self, params)
+        for ph in self._progress_hooks:
+            fd.add_progress_hook(ph)
+        new_info = self._copy_infodict(info)
+        if new_info.get('http_headers') is None:
+            new_info['http_headers'] = self._calc_headers(new_info)
+        try:
+            success, real_download = fd.download(name, new_info)
+        except (YDLDownloadError, OSError) as e:
+            logger.warning(f"Ошибка потокового объединения: {e}")
+            success, real_download = False, False
+        if success:
+            return success, real_download
+        for path in (name, name + '.part'):
+            if os.path.exists(path):
+                os.remove(path)
+        scope = CancelScope.current()
+        if scope is not None and scope.event.is_set():
+            return False, False
+        logger.warning(f"Потоковое объединение не удалось, загрузка потоков в отдельные файлы: "
+                       f"{info.get('format_id')}")
+        return self._download_and_merge(name, info)
+
+    def _download_and_merge(self, name: str, info: Dict[str, Any]) -> Tuple[bool, bool]:
+        """Загружает потоки в отдельные файлы (как yt-dlp) и объединяет их в name."""
+        requested_formats = [dict(fmt) for fmt in info['requested_formats']]
+        with self._params_override(external_downloader=self._external_downloader):
+            for fmt in requested_formats:
+                new_info = dict(info)
+                del new_info['requested_formats']
+                new_info.update(fmt)
+                fmt['filepath'] = prepend_extension(f"{os.path.splitext(name)[0]}.{new_info['ext']}",
+                                                    f"f{fmt['format_id']}", new_info['ext'])
+                success, _ = self.dl(fmt['filepath'], new_info)
+                if not success:
+                    return False, True
+        downloaded = [fmt['filepath'] for fmt in requested_formats]
+        try:
+            FFmpegMergerPP(self).run({**info, 'requested_formats': requested_formats,
+                                      'filepath': name, '__files_to_merge': downloaded})
+        except PostProcessingError as e:
+            self.report_error(f"Postprocessing: {e}")
+            return False, True
+        if not self.params.get('keepvideo'):
+            for filename in downloaded:
+                with contextlib.suppress(OSError):
+                    os.remove(filename)
+        return True, True
+
+def summarize_formats(formats: List[Dict[str, Any]]) -> Tuple[List[str], Dict[str, int], Dict[str, Dict[str, Any]]]:
+    """
+    Сводка по форматам для выбора разрешения: разрешения по убыванию, оценки
+    размеров (по разрешению и для 'audio') и сведения о лучшем потоке каждого
+    разрешения: частота кадров, кодек и примерный размер.
+    """
+    heights: Set[int] = {fmt['height'] for fmt in formats if fmt.get('height') and fmt.get('vcodec') != 'none'}
+    sorted_resolutions: List[str] = [f"{height}p" for height in sorted(heights, reverse=True)] or [config.DEFAULT_RESOLUTION]
+    # Оценки размеров нужны очереди для политики "сначала короткие"
+    sizes: Dict[str, int] = {}
+    details: Dict[str, Dict[str, Any]] = {}
+    for height in sorted(heights, reverse=True):
+        resolution = f"{height}p"
+        size = estimate_download_size(formats, DownloadMode.VIDEO.value, resolution)
+        if size:
+            sizes[resolution] = size
+        best = max((fmt for fmt in formats if fmt.get('height') == height and fmt.get('vcodec') != 'none'),
+                   key=lambda fmt: (fmt.get('fps') or 0, fmt.get('tbr') or 0))
+        details[resolution] = {
+            'fps': best.get('fps'),
+            'vcodec': (best.get('vcodec') or '').split('.')[0] or None,
+            'size': size,
+        }
+    audio_size = estimate_download_size(formats, DownloadMode.AUDIO.value)
+    if audio_size:
+        sizes[DownloadMode.AUDIO.value] = audio_size
+    return sorted_resolutions, sizes, details
+
+def describe_resolution(resolution: str, details: Optional[Dict[str, Any]]) -> str:
+    """Строка вида "1080p · 60 fps · avc1 · ~350 МБ" для подсказки."""
+    parts = [resolution]
+    if details:
+        if details.get('fps'):
+            parts.append(f"{details['fps']:g} fps")
+        if details.get('vcodec'):
+            parts.append(details['vcodec'])
+        if details.get('size'):
+            parts.append(f"~{details['size'] / (1024 * 1024):.0f} МБ")
+    return " · ".join(parts)
+
+class ResolutionCache:
+    def __init__(self, ttl: int = 3600):  # TTL в секундах
+        self.cache: Dict[str, Tuple[List[str], Dict[str, int], Dict[str, Dict[str, Any]], float]] = {}
+        self.ttl = ttl
+        
+    def get(self, url: str) -> Optional[Tuple[List[str], Dict[str, int], Dict[str, Dict[str, Any]]]]:
+        """Возвращает (разрешения, оценки размеров, сведения о форматах) или None, если записи нет или она устарела."""
+        if url in self.cache:
+            resolutions, sizes, details, timestamp = self.cache[url]
+            if time.time() - timestamp < self.ttl:
+                return resolutions, sizes, details
+            del self.cache[url]
+        return None
+        
+    def set(self, url: str, resolutions: List[str], sizes: Optional[Dict[str, int]] = None,
+            details: Optional[Dict[str, Dict[str, Any]]] = None) -> None:
+        self.cache[url] = (resolutions, sizes or {}, details or {}, time.time())
+
+class ResolutionWorker(QThread):
+    resolutions_found = pyqtSignal(list)
+    sizes_found = pyqtSignal(dict)
+    details_found = pyqtSignal(dict)
+    error_occurred = pyqtSignal(str)
+
+    def __init__(self, url: str, fast: bool = config.PROBE_FAST) -> None:
+        super().__init__()
+        self.url: str = url
+        # Быстрый запрос: только сведения о форматах, по профилю сервиса из config.PROBE_PROFILES
+        self.fast = fast
+
+    @staticmethod
+    def probe_options(service: str, fast: bool) -> Dict[str, Any]:
+        ydl_opts: Dict[str, Any] = {'quiet': True, 'no_warnings': True, 'noplaylist': True}
+        if fast:
+            ydl_opts.update({
+                'writesubtitles': False,
+                'writeautomaticsub': False,
+                'getcomments': False,
+                'check_formats': False,
+            })
+            ydl_opts.update(copy.deepcopy(config.PROBE_PROFILES.get(service, {})))
+        return ydl_opts
+
+    def extract_formats(self, fast: bool) -> List[Dict[str, Any]]:
+        started = time.monotonic()
+        service = VideoURL.get_service_name(self.url)
+        with VideoDownloaderYDL(self.probe_options(service, fast), cookiejar=cookie_cache.get_jar()) as ydl:
+            info: Dict[str, Any] = ydl.extract_info(self.url, download=False)
+        formats: List[Dict[str, Any]] = info.get('formats') or []
+        logger.info(f"Запрос форматов ({'быстрый' if fast else 'полный'}, {service}): {len(formats)} форматов "
+                    f"за {time.monotonic() - started:.2f} с")
+        return formats
+
+    def run(self) -> None:
+        with job_profiler.profile('probe', self.url):
+            self.probe()
+
+    def probe(self) -> None:
+        try:
+            logger.info(f"Получение доступных разрешений для: {self.url}")
+            formats: List[Dict[str, Any]] = []
+            if self.fast:
+                try:
+                    formats = self.extract_formats(fast=True)
+                except Exception as e:
+                    logger.warning(f"Быстрый запрос форматов не удался, полное извлечение: {e}")
+            if not any(fmt.get('height') for fmt in formats):
+                # Профиль мог отсечь все видеоформаты (например, только HLS) — повторяем полностью
+                formats = self.extract_formats(fast=False)
+            sorted_resolutions, sizes, details = summarize_formats(formats)
+            logger.info(f"Найдены разрешения: {sorted_resolutions}")
+            self.sizes_found.emit(sizes)
+            self.details_found.emit(details)
+            self.resolutions_found.emit(sorted_resolutions)
+        except Exception as e:
+            logger.exception(f"Ошибка при получении разрешений: {self.url}")
+            if "HTTP Error 403" in str(e):
+                cookie_cache.invalidate()
+            user_friendly_error = "Не удалось получить доступные разрешения. Проверьте URL и подключение к интернету."
+            self.error_occurred.emit(user_friendly_error)
+
+class MetadataRunnable(QRunnable):
+    """Заранее получает метаданные элемента очереди (форматы, размеры, название)."""
+
+    class Signals(QObject):
+        metadata_ready = pyqtSignal(int, dict)
+        metadata_failed = pyqtSignal(int, str)
+
+    def __init__(self, item_id: int, url: str) -> None:
+        super().__init__()
+        self.item_id = item_id
+        self.url = url
+        self.signals = self.Signals()
+
+    def run(self) -> None:
+        try:
+            started = time.monotonic()
+            ydl_opts: Dict[str, Any] = {'quiet': True, 'no_warnings': True}
+            with VideoDownloaderYDL(ydl_opts, cookiejar=cookie_cache.get_jar()) as ydl:
+                # Без обработки: выбор формата выполнится при загрузке через process_ie_result
+                info: Dict[str, Any] = ydl.extract_info(self.url, download=False, process=False)
+            logger.info(f"Метаданные получены за {time.monotonic() - started:.2f} с: {self.url}")
+            self.signals.metadata_ready.emit(self.item_id, info)
+        except Exception as e:
+            logger.warning(f"Не удалось заранее получить метаданные {self.url}: {e}")
+            self.signals.metadata_failed.emit(self.item_id, str(e))
+
+@lru_cache(maxsize=4096)
+def canonical_video_id(url: str) -> str:
+    """
+    Ключ видео без сетевых запросов: извлекатель yt-dlp и ID из URL, поэтому
+    разные формы ссылки на одно видео (youtu.be, watch?v=, shorts) дают один
+    ключ. Для нераспознанных ссылок — хэш URL.
+    """
+    for extractor in yt_dlp.extractor.gen_extractor_classes():
+        if extractor.ie_key() == 'Generic' or not extractor.suitable(url):
+            continue
+        try:
+            video_id = extractor.get_temp_id(url)
+        except Exception:
+            video_id = None
+        if video_id:
+            return re.sub(r'[^\w.-]', '_', f"{extractor.ie_key()}_{video_id}")
+        break
+    return 'url_' + hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+class PreviewCache:
+    """
+    Превью элементов очереди (название и уменьшенная обложка): LRU в памяти на
+    memory_items записей и файлы в directory (<ключ>.json и <ключ>.png), ключ —
+    канонический ID видео. Число файлов на диске учитывается при сохранении;
+    когда оно превышает disk_items на десятую часть, самые старые удаляются.
+    """
+
+    def __init__(self, directory: str, memory_items: int, disk_items: int) -> None:
+        self.directory = directory
+        self.memory_items = memory_items
+        self.disk_items = disk_items
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, Tuple[str, Optional[QImage]]]" = OrderedDict()
+        self._keys: Dict[str, str] = {}
+        # Число превью на диске (None — ещё не подсчитано) и идёт ли очистка
+        self._disk_count: Optional[int] = None
+        self._pruning = False
+
+    def key_for(self, url: str) -> str:
+        with self._lock:
+            key = self._keys.get(url)
+        if key is None:
+            key = canonical_video_id(url)
+            with self._lock:
+                self._keys[url] = key
+        return key
+
+    def peek(self, url: str) -> Optional[Tuple[str, Optional[QImage]]]:
+        """Превью из памяти без обращения к диску (для потока интерфейса)."""
+        with self._lock:
+            key = self._keys.get(url)
+            if key is None or key not in self._memory:
+                return None
+            self._memory.move_to_end(key)
+            return self._memory[key]
+
+    def _remember(self, key: str, preview: Tuple[str, Optional[QImage]]) -> None:
+        with self._lock:
+            self._memory[key] = preview
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+
+    def load(self, key: str) -> Optional[Tuple[str, Optional[QImage]]]:
+        """Превью из памяти или с диска."""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+        base = os.path.join(self.directory, key)
+        try:
+            with open(base + '.json', 'r', encoding='utf-8') as f:
+                title = json.load(f).get('title') or ""
+        except (OSError, ValueError, AttributeError):
+            return None
+        image = QImage(base + '.png') if os.path.exists(base + '.png') else None
+        preview = (title, image if image is not None and not image.isNull() else None)
+        self._remember(key, preview)
+        return preview
+
+    def store(self, key: str, title: str, image: Optional[QImage]) -> None:
+        self._remember(key, (title, image))
+        base = os.path.join(self.directory, key)
+        added = not os.path.exists(base + '.json')
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            if image is not None:
+                image.save(base + '.png', 'PNG')
+            with open(base + '.json.tmp', 'w', encoding='utf-8') as f:
+                json.dump({'title': title}, f, ensure_ascii=False)
+            os.replace(base + '.json.tmp', base + '.json')
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить превью {key}: {e}")
+            added = False
+        with self._lock:
+            if added and self._disk_count is not None:
+                self._disk_count += 1
+            # Запас в десятую часть, чтобы не сортировать каталог при каждом сохранении
+            due = (self._disk_count is None or self._disk_count > self.disk_items + max(1, self.disk_items // 10))
+            if not due or self._pruning:
+                return
+            self._pruning = True
+        try:
+            self.prune()
+        finally:
+            with self._lock:
+                self._pruning = False
+
+    def prune(self) -> None:
+        """Удаляет самые старые превью сверх disk_items."""
+        entries = sorted(glob.glob(os.path.join(self.directory, '*.json')), key=os.path.getmtime, reverse=True)
+        for path in entries[self.disk_items:]:
+            for stale in (path, path[:-len('.json')] + '.png'):
+                with contextlib.suppress(OSError):
+                    os.remove(stale)
+        with self._lock:
+            self._disk_count = min(len(entries), self.disk_items)
+
+class PreviewRunnable(QRunnable):
+    """
+    Получает название и обложку элемента очереди: из кэша, из уже полученных
+    метаданных или быстрым извлечением. Обложка декодируется и уменьшается
+    в этом же фоновом потоке (QImage), интерфейсу передаётся готовое изображение.
+    """
+
+    class Signals(QObject):
+        preview_ready = pyqtSignal(str, str, object)
+        preview_failed = pyqtSignal(str)
+
+    def __init__(self, url: str, cache: PreviewCache, info: Optional[Dict[str, Any]] = None) -> None:
+        super().__init__()
+        self.url = url
+        self.cache = cache
+        self.info = info
+        self.signals = self.Signals()
+
+    def run(self) -> None:
+        try:
+            key = self.cache.key_for(self.url)
+            preview = self.cache.load(key)
+            if preview is None:
+                preview = self.fetch()
+                self.cache.store(key, *preview)
+            self.signals.preview_ready.emit(self.url, *preview)
+        except Exception as e:
+            logger.warning(f"Не удалось получить превью {self.url}: {e}")
+            self.signals.preview_failed.emit(self.url)
+
+    def fetch(self) -> Tuple[str, Optional[QImage]]:
+        started = time.monotonic()
+        service = VideoURL.get_service_name(self.url)
+        with VideoDownloaderYDL(ResolutionWorker.probe_options(service, True),
+                                cookiejar=cookie_cache.get_jar()) as ydl:
+            info = self.info
+            if not info or not (info.get('title') or info.get('thumbnails')):
+                info = ydl.extract_info(self.url, download=False, process=False)
+            image = None
+            thumbnail_url = self.pick_thumbnail(info)
+            if thumbnail_url:
+                with ydl.urlopen(thumbnail_url) as response:
+                    image = QImage.fromData(response.read())
+        if image is not None and not image.isNull():
+            width, height = config.PREVIEW_SIZE
+            image = image.scaled(width, height, Qt.AspectRatioMode.KeepAspectRatio,
+                                 Qt.TransformationMode.SmoothTransformation)
+        else:
+            image = None
+        logger.info(f"Превью получено за {time.monotonic() - started:.2f} с: {self.url}")
+        return info.get('title') or "", image
+
+    @staticmethod
+    def pick_thumbnail(info: Dict[str, Any]) -> Optional[str]:
+        """Наименьшая обложка не уже двойной ширины превью, иначе самая крупная."""
+        thumbnails = [thumb for thumb in info.get('thumbnails') or [] if thumb.get('url')]
+        if not thumbnails:
+            return info.get('thumbnail')
+        sized = sorted((thumb for thumb in thumbnails if thumb.get('width')), key=lambda thumb: thumb['width'])
+        for thumb in sized:
+            if thumb['width'] >= config.PREVIEW_SIZE[0] * 2:
+                return thumb['url']
+        return (sized or thumbnails)[-1]['url']
+
+class EgressPool:
+    """
+    Пул исходящих адресов из config.EGRESS_POOL: прокси ("socks5://host:port",
+    "http://host:port") и локальные адреса ("source:192.168.1.10"). Загрузки
+    распределяются по наименее загруженному адресу или закрепляются за сервисом
+    (EGRESS_POLICY = 'sticky'). Адрес, ответивший ограничением скорости или не
+    прошедший проверку доступности, временно исключается из пула.
+    """
+
+    def __init__(self, addresses: List[str], policy: str = 'least_loaded') -> None:
+        self.policy = policy
+        self._lock = threading.Lock()
+        self._endpoints: Dict[str, Dict[str, Any]] = {
+            address: {'active': 0, 'excluded_until': 0.0, 'reason': None} for address in dict.fromkeys(addresses)
+        }
+        self._sticky: Dict[str, str] = {}
+        self._health_thread: Optional[threading.Thread] = None
+
+    def __bool__(self) -> bool:
+        return bool(self._endpoints)
+
+    def _available(self, now: float) -> List[str]:
+        return [address for address, state in self._endpoints.items() if state['excluded_until'] <= now]
+
+    def acquire(self, service: str) -> Optional[str]:
+        """Выбирает адрес для загрузки; None — прямое подключение (пул пуст или все адреса исключены)."""
+        if not self._endpoints:
+            return None
+        self.start_health_checks()
+        with self._lock:
+            available = self._available(time.time())
+            if not available:
+                logger.warning("Все адреса пула исключены, используется прямое подключение")
+                return None
+            address = self._sticky.get(service) if self.policy == 'sticky' else None
+            if address not in available:
+                address = min(available, key=lambda candidate: self._endpoints[candidate]['active'])
+                if self.policy == 'sticky':
+                    self._sticky[service] = address
+            self._endpoints[address]['active'] += 1
+        logger.info(f"Исходящий адрес для {service}: {address}")
+        return address
+
+    def release(self, address: Optional[str], error: str = "") -> None:
+        """Освобождает адрес; при признаке ограничения скорости в error исключает его."""
+        if address is None or address not in self._endpoints:
+            return
+        with self._lock:
+            self._endpoints[address]['active'] = max(self._endpoints[address]['active'] - 1, 0)
+        if error and any(marker.lower() in error.lower() for marker in config.EGRESS_THROTTLE_MARKERS):
+            self.exclude(address, "ограничение скорости", config.EGRESS_EXCLUDE_SECONDS)
+
+    def exclude(self, address: str, reason: str, seconds: float) -> None:
+        with self._lock:
+            state = self._endpoints[address]
+            state['excluded_until'] = time.time() + seconds
+            state['reason'] = reason
+            for service in [service for service, sticky in self._sticky.items() if sticky == address]:
+                del self._sticky[service]
+        logger.warning(f"Адрес {address} исключён из пула на {seconds:.0f} с: {reason}")
+
+    @staticmethod
+    def ydl_options(address: Optional[str]) -> Dict[str, Any]:
+        if address is None:
+            return {}
+        if address.startswith('source:'):
+            return {'source_address': address[len('source:'):]}
+        return {'proxy': address}
+
+    def check(self, address: str) -> bool:
+        """Проверяет доступность адреса запросом к EGRESS_HEALTH_URL."""
+        params = {'quiet': True, 'no_warnings': True, 'socket_timeout': 10, **self.ydl_options(address)}
+        try:
+            with VideoDownloaderYDL(params) as ydl:
+                ydl.urlopen(YDLRequest(config.EGRESS_HEALTH_URL, method='HEAD')).close()
+            return True
+        except (TransportError, YDLHTTPError, OSError) as e:
+            logger.warning(f"Проверка адреса {address} не пройдена: {e}")
+            return False
+
+    def run_health_checks(self) -> None:
+        """Проверяет адреса; исключённые за ограничение скорости проверяются после окончания срока."""
+        now = time.time()
+        with self._lock:
+            addresses = [address for address, state in self._endpoints.items()
+                         if state['excluded_until'] <= now or state['reason'] == "не отвечает"]
+        for address in addresses:
+            if self.check(address):
+                with self._lock:
+                    state = self._endpoints[address]
+                    if state['reason'] == "не отвечает":
+                        state['excluded_until'], state['reason'] = 0.0, None
+                        logger.info(f"Адрес {address} снова доступен")
+            else:
+                self.exclude(address, "не отвечает", config.EGRESS_HEALTH_INTERVAL)
+
+    def start_health_checks(self) -> None:
+        with self._lock:
+            if self._health_thread is not None or not config.EGRESS_HEALTH_INTERVAL:
+                return
+            self._health_thread = threading.Thread(target=self._health_loop, name='egress-health', daemon=True)
+        self._health_thread.start()
+
+    def _health_loop(self) -> None:
+        while True:
+            self.run_health_checks()
+            time.sleep(config.EGRESS_HEALTH_INTERVAL)
+
+egress_pool = EgressPool(config.EGRESS_POOL, config.EGRESS_POLICY)
 
-            # Если URL содержит домен известного сервиса, но не соответствует паттерну
-            service = cls.get_service_name(url)
-            if service != 'Неизвестный сервис':
-                raise URLValidationError(f"Неверный формат URL для {service}. Проверьте правильность ссылки.")
+class YDLErrorCollector:
+    """Логгер для yt-dlp: запоминает ошибки, которые ignoreerrors не превращает в исключения."""
 
-            return False, "Неподдерживаемый видеосервис или неверный формат URL"
-        except URLValidationError as e:
-            return False, str(e)
+    def __init__(self) -> None:
+        self.errors: List[str] = []
 
-class DownloadMode(Enum):
-    VIDEO = "video"
-    AUDIO = "audio"
+    def debug(self, msg: str) -> None:
+        pass
 
-class ResolutionWorker(QThread):
-    resolutions_found = pyqtSignal(list)
-    error_occurred = pyqtSignal(str)
+    def info(self, msg: str) -> None:
+        pass
 
-    def __init__(self, url: str) -> None:
-        super().__init__()
-        self.url: str = url
+    def warning(self, msg: str) -> None:
+        logger.debug(msg)
 
-    def run(self) -> None:
-        try:
-            logger.info(f"Получение доступных разрешений для: {self.url}")
-            ydl_opts: Dict[str, Any] = {'quiet': True, 'no_warnings': True}
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info: Dict[str, Any] = ydl.extract_info(self.url, download=False)
-                formats: List[Dict[str, Any]] = info.get('formats', [])
-                # Собираем разрешения из доступных форматов
-                resolutions: Set[str] = {f"{fmt['height']}p" for fmt in formats
-                                          if fmt.get('height') and fmt.get('vcodec') != 'none'}
-                if not resolutions:
-                    resolutions = {'720p'}
-                # Сортировка разрешений по убыванию
-                sorted_resolutions: List[str] = sorted(list(resolutions),
-                                                       key=lambda x: int(x.replace('p', '')),
-                                                       reverse=True)
-            logger.info(f"Найдены разрешения: {sorted_resolutions}")
-            self.resolutions_found.emit(sorted_resolutions)
-        except Exception as e:
-            logger.exception(f"Ошибка при получении разрешений: {self.url}")
-            user_friendly_error = "Не удалось получить доступные разрешения. Проверьте URL и подключение к интернету."
-            self.error_occurred.emit(user_friendly_error)
+    def error(self, msg: str) -> None:
+        self.errors.append(msg)
 
 # Реализация QRunnable для работы с QThreadPool
 class DownloadRunnable(QRunnable):
@@ -187,43 +2045,111 @@ class DownloadRunnable(QRunnable):
         finished = pyqtSignal(bool, str, str)
         
     def __init__(self, url: str, mode: str, resolution: Optional[str] = None,
-                 output_dir: str = 'downloads') -> None:
+                 output_dir: str = 'downloads', info: Optional[Dict[str, Any]] = None,
+                 clip: Optional[Tuple[Optional[float], Optional[float]]] = None, exact_cut: bool = False) -> None:
         super().__init__()
         self.url = url
         self.mode = mode
         self.resolution = resolution
         self.output_dir = output_dir
+        # Заранее полученные (необработанные) метаданные, если есть
+        self.info = info
+        # Фрагмент (начало, конец) в секундах; exact_cut — точная обрезка с перекодированием
+        self.clip = clip
+        self.exact_cut = exact_cut
+        # Исходящий адрес из пула (прокси или локальный адрес); None — прямое подключение
+        self.egress: Optional[str] = None
+        self.ydl_log = YDLErrorCollector()
         self.signals = self.Signals()
-        self.cancel_event = threading.Event()
+        # Отмена прерывает сетевые операции и процессы ffmpeg этой загрузки
+        self.cancel_scope = CancelScope()
+        self.cancel_event = self.cancel_scope.event
+        self.cancel_requested_at: Optional[float] = None
         self.downloaded_filename = None
+        # Итоговый файл и ожидаемые параметры (длительность, дорожки) для проверки
+        self.output_path: Optional[str] = None
+        self.expected_media: Dict[str, Any] = {}
+        # Получено байт по всем файлам загрузки (для подбора числа одновременных загрузок)
+        self.bytes_transferred = 0
+        self._file_progress: Dict[str, int] = {}
+        # Файлы, которые создаёт эта загрузка: временные удаляются при отмене или
+        # ошибке, результаты (форматы до объединения, итоговый файл) — только при отмене
+        self.job_files: Set[str] = set()
+        self.job_outputs: Set[str] = set()
+        # Идентификатор элемента очереди, к которому относится загрузка
+        self.item_id: Optional[int] = None
+        self.phases = PhaseTimer('extract')
         
         os.makedirs(output_dir, exist_ok=True)
         
     def run(self) -> None:
-        try:
-            logger.info(f"Начало загрузки (QRunnable): {self.url}")
-            if self.mode == 'video':
-                success = self.download_video()
-            else:
-                success = self.download_audio()
+        with job_profiler.profile(self.mode, self.url) as self.phases:
+            self.execute()
 
-            if success:
-                logger.info(f"Загрузка завершена успешно: {self.url}")
-                self.signals.finished.emit(True, "Загрузка завершена", self.downloaded_filename or "")
-            else:
-                logger.info(f"Загрузка отменена: {self.url}")
-                self.signals.finished.emit(False, "Загрузка отменена", "")
-        except Exception as e:
-            logger.exception(f"Ошибка загрузки: {self.url}")
-            error_message = self.get_user_friendly_error_message(str(e))
-            self.signals.finished.emit(False, error_message, "")
+    def execute(self) -> None:
+        success, message = False, "Загрузка отменена"
+        with self.cancel_scope.bind():
+            try:
+                logger.info(f"Начало загрузки (QRunnable): {self.url}")
+                try:
+                    success = self.download()
+                except Exception as e:
+                    if "HTTP Error 403" not in str(e) or not cookie_cache.enabled or self.cancel_event.is_set():
+                        raise
+                    # Cookies могли устареть: извлекаем их заново и повторяем один раз
+                    logger.warning(f"Ответ 403 при загрузке {self.url}, обновление cookies и повтор")
+                    cookie_cache.invalidate()
+                    success = self.download()
+
+                if success:
+                    logger.info(f"Загрузка завершена успешно: {self.url}")
+                    message = "Загрузка завершена"
+                else:
+                    logger.info(f"Загрузка отменена: {self.url}")
+            except Exception as e:
+                if self.cancel_event.is_set():
+                    # Ошибки закрытых сокетов и завершённого ffmpeg — следствие отмены
+                    logger.info(f"Загрузка отменена: {self.url} ({e})")
+                else:
+                    logger.exception(f"Ошибка загрузки: {self.url}")
+                    message = self.get_user_friendly_error_message(str(e))
+
+        if not success:
+            self.remove_job_files(include_outputs=self.cancel_event.is_set())
+        if self.cancel_requested_at is not None:
+            logger.info(f"Поток загрузки освобождён через {time.monotonic() - self.cancel_requested_at:.2f} с "
+                        f"после отмены: {self.url}")
+        self.signals.finished.emit(success, message, (self.downloaded_filename or "") if success else "")
             
+    def download(self) -> bool:
+        download_mode = self.download_video if self.mode == 'video' else self.download_audio
+        if self.info is None:
+            return download_mode()
+        try:
+            return download_mode()
+        except Exception:
+            if self.cancel_event.is_set():
+                raise
+            # Ссылки из заранее полученных метаданных могли устареть
+            logger.warning(f"Загрузка по сохранённым метаданным не удалась, повторное извлечение: {self.url}")
+            self.info = None
+            return download_mode()
+
+    def _run_ydl(self, ydl: yt_dlp.YoutubeDL) -> None:
+        """Загружает по сохранённым метаданным или с извлечением по URL."""
+        if self.info is not None:
+            ydl.process_ie_result(self.info, download=True)
+        else:
+            ydl.download([self.url])
+
     def get_user_friendly_error_message(self, error: str) -> str:
         """Преобразует технические сообщения об ошибках в понятные для пользователя"""
         if "HTTP Error 404" in error:
             return "Ошибка: Видео не найдено (404). Возможно, оно было удалено или является приватным."
         elif "HTTP Error 403" in error:
             return "Ошибка: Доступ запрещен (403). Видео может быть недоступно в вашем регионе."
+        elif "HTTP Error 429" in error or "Too Many Requests" in error:
+            return "Ошибка: Слишком много запросов (429). Сервис ограничил скорость, попробуйте позже."
         elif "Sign in to confirm your age" in error or "age-restricted" in error:
             return "Ошибка: Видео имеет возрастные ограничения и требует авторизации."
         elif "SSL" in error or "подключени" in error.lower() or "connect" in error.lower():
@@ -239,60 +2165,104 @@ class DownloadRunnable(QRunnable):
                 raise Exception("Не указано разрешение для видео")
             resolution_number: str = self.resolution.replace('p', '')
             service: str = VideoURL.get_service_name(self.url)
+            profile = service_profiles.get(service)
             logger.info(f"Загрузка видео с {service} в разрешении {resolution_number}p")
 
             ydl_opts: Dict[str, Any] = {
                 'format': f'bestvideo[height<={resolution_number}]+bestaudio/best[height<={resolution_number}]',
                 'merge_output_format': 'mp4',
-                'outtmpl': os.path.join(self.output_dir, '%(title)s_%(resolution)s.%(ext)s'),
+                'outtmpl': os.path.join(self.output_dir, f'%(title)s_%(resolution)s{self.clip_suffix()}.%(ext)s'),
                 'progress_hooks': [self.progress_hook],
+                'postprocessor_hooks': [self.postprocessor_hook],
+                'logger': self.ydl_log,
                 'postprocessors': [{
                     'key': 'FFmpegVideoConvertor',
                     'preferedformat': 'mp4',
-                }],
-                'socket_timeout': 30,
-                'retries': 10,
-                'fragment_retries': 10,
-                'retry_sleep': 3,
+                }] if profile['postprocess'] == 'convert' else [],
                 'ignoreerrors': True,
                 'no_warnings': True,
                 'quiet': True,
             }
+            ydl_opts.update(ServiceProfiles.ydl_options(service, profile))
+            ydl_opts.update(self.clip_options())
+            ydl_opts.update(EgressPool.ydl_options(self.egress))
 
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            with VideoDownloaderYDL(ydl_opts, cookiejar=cookie_cache.get_jar()) as ydl:
                 ydl.params['resolution'] = self.resolution
-                ydl.download([self.url])
+                self._run_ydl(ydl)
+            # С ignoreerrors отмена и ошибки загрузки не приводят к исключению
+            if self.cancel_event.is_set():
+                return False
+            if self.ydl_log.errors and self.downloaded_filename is None:
+                raise Exception(self.ydl_log.errors[-1])
             return True
 
-        except Exception as e:
-            logger.exception(f"Ошибка загрузки видео")
+        except Exception:
+            if not self.cancel_event.is_set():
+                logger.exception("Ошибка загрузки видео")
             raise
             
+    def clip_options(self) -> Dict[str, Any]:
+        """
+        Параметры загрузки фрагмента: yt-dlp получает только нужные фрагменты
+        или диапазоны байтов. По умолчанию обрезка по ключевым кадрам без
+        перекодирования, с exact_cut — точная обрезка с перекодированием.
+        """
+        if not self.clip:
+            return {}
+        start, end = self.clip
+        return {
+            'download_ranges': download_range_func(None, [(start or 0, end if end is not None else math.inf)]),
+            'force_keyframes_at_cuts': self.exact_cut,
+        }
+
+    def clip_suffix(self) -> str:
+        """Суффикс имени файла фрагмента, чтобы он не совпадал с полной версией."""
+        return f"_{format_clip(self.clip, '-').replace(':', '.')}" if self.clip else ""
+
     def download_audio(self) -> bool:
         try:
+            service = VideoURL.get_service_name(self.url)
+            profile = service_profiles.get(service)
             ydl_opts: Dict[str, Any] = {
                 'format': 'bestaudio/best',
-                'outtmpl': os.path.join(self.output_dir, '%(title)s_audio.%(ext)s'),
+                'outtmpl': os.path.join(self.output_dir, f'%(title)s_audio{self.clip_suffix()}.%(ext)s'),
                 'progress_hooks': [self.progress_hook],
+                'postprocessor_hooks': [self.postprocessor_hook],
+                'logger': self.ydl_log,
                 'postprocessors': [{
                     'key': 'FFmpegExtractAudio',
-                    'preferredcodec': 'mp3',
+                    'preferredcodec': 'mp3' if profile['postprocess'] == 'convert' else 'best',
                     'preferredquality': '192',
                 }],
             }
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                ydl.download([self.url])
-            return True
+            ydl_opts.update(ServiceProfiles.ydl_options(service, profile))
+            ydl_opts.update(self.clip_options())
+            ydl_opts.update(EgressPool.ydl_options(self.egress))
+            with VideoDownloaderYDL(ydl_opts, cookiejar=cookie_cache.get_jar()) as ydl:
+                self._run_ydl(ydl)
+            return not self.cancel_event.is_set()
 
-        except Exception as e:
-            logger.exception(f"Ошибка загрузки аудио")
+        except Exception:
+            if not self.cancel_event.is_set():
+                logger.exception("Ошибка загрузки аудио")
             raise
             
     def progress_hook(self, d: Dict[str, Any]) -> None:
         if self.cancel_event.is_set():
             raise Exception("Загрузка отменена пользователем")
 
+        if d.get('downloaded_bytes'):
+            # Ключ — итоговое имя: в сообщении 'finished' tmpfilename нет, иначе байты файла учитывались бы дважды
+            name = d.get('filename') or d.get('tmpfilename') or ''
+            self.bytes_transferred += max(d['downloaded_bytes'] - self._file_progress.get(name, 0), 0)
+            self._file_progress[name] = d['downloaded_bytes']
         if d.get('status') == 'downloading':
+            self.phases.mark('download')
+            if d.get('tmpfilename'):
+                self.job_files.add(d['tmpfilename'])
+            if d.get('filename'):
+                self.job_outputs.add(d['filename'])
             try:
                 downloaded: float = d.get('downloaded_bytes', 0)
                 total: float = d.get('total_bytes', 0) or d.get('total_bytes_estimate', 0)
@@ -302,16 +2272,304 @@ class DownloadRunnable(QRunnable):
                 else:
                     # Если размер неизвестен, отправляем неопределенный прогресс
                     self.signals.progress.emit("Загрузка...", -1)
-            except Exception as e:
+            except Exception:
                 logger.exception("Ошибка в progress_hook")
         elif d.get('status') == 'finished':
             self.downloaded_filename = os.path.basename(d.get('filename', ''))
+            self.record_output(d.get('info_dict') or {}, d.get('filename'))
             self.signals.progress.emit("Обработка файла...", 100)
             
+    def postprocessor_hook(self, d: Dict[str, Any]) -> None:
+        if self.cancel_event.is_set():
+            raise Exception("Загрузка отменена пользователем")
+        # Фаза по имени постпроцессора: Merger, VideoConvertor, ExtractAudio, ...
+        postprocessor = d.get('postprocessor')
+        if d.get('status') == 'finished':
+            self.phases.mark('other')
+            info = d.get('info_dict') or {}
+            self.record_output(info, info.get('filepath'))
+        elif postprocessor == 'Merger':
+            self.phases.mark('merge')
+        elif postprocessor in ('VideoConvertor', 'ExtractAudio'):
+            self.phases.mark('convert')
+        else:
+            self.phases.mark('other')
+        if d.get('status') == 'started':
+            filepath = d.get('info_dict', {}).get('filepath')
+            if filepath:
+                # Временный файл ffmpeg и ещё не созданный результат объединения
+                self.job_files.add(prepend_extension(filepath, 'temp'))
+                if not os.path.exists(filepath):
+                    self.job_outputs.add(filepath)
+
+    def record_output(self, info: Dict[str, Any], path: Optional[str]) -> None:
+        """Запоминает путь к результату и ожидаемые длительность и дорожки."""
+        if path:
+            self.output_path = os.path.abspath(path)
+        formats = info.get('requested_formats') or [info]
+        has_audio = any(fmt.get('acodec') not in (None, 'none') for fmt in formats)
+        duration = info.get('duration')
+        if duration and self.clip:
+            start, end = self.clip
+            duration = min(end if end is not None else duration, duration) - (start or 0)
+        self.expected_media = {
+            'duration': duration,
+            'video': self.mode == 'video',
+            # Если кодек аудио неизвестен, наличие дорожки не проверяется
+            'audio': self.mode == 'audio' or has_audio,
+        }
+
+    def output_details(self) -> Dict[str, Any]:
+        return {'path': self.output_path, 'expected': self.expected_media}
+
+    def remove_job_files(self, include_outputs: bool = False) -> None:
+        """Удаляет части и служебные файлы этой загрузки, не трогая файлы других загрузок."""
+        paths = self.job_files | self.job_outputs if include_outputs else self.job_files
+        for path in paths:
+            candidates = [path, path + '.ytdl', path + '.segments'] + glob.glob(glob.escape(path) + '-Frag*')
+            for candidate in candidates:
+                if os.path.isfile(candidate):
+                    try:
+                        os.remove(candidate)
+                        logger.info(f"Удалён временный файл: {candidate}")
+                    except OSError as e:
+                        logger.error(f"Ошибка при удалении файла {candidate}: {e}")
+        self.job_files -= paths
+        self.job_outputs -= paths
+
     def cancel(self) -> None:
-        self.cancel_event.set()
+        if self.cancel_requested_at is None:
+            self.cancel_requested_at = time.monotonic()
+        self.cancel_scope.cancel()
         logger.info(f"Запрошена отмена загрузки: {self.url}")
 
+def execute_farm_job(job: Dict[str, Any], report, cancel_event: threading.Event,
+                     output_dir: str = 'downloads', on_transferred=None, on_output=None) -> Tuple[bool, str, str]:
+    """
+    Выполняет задание из общего хранилища в текущем потоке обработчика.
+    Прогресс передаётся в report, полученные байты — в on_transferred, путь
+    к результату и ожидаемые параметры файла — в on_output; установка
+    cancel_event отменяет загрузку.
+    """
+    clip = (job.get('clip_start'), job.get('clip_end'))
+    runnable = DownloadRunnable(job['url'], job['mode'], job.get('resolution'), output_dir, job.get('info'),
+                                clip if clip != (None, None) else None, bool(job.get('exact_cut')))
+    # Процессы загрузки получают адрес от основного процесса, остальные обработчики берут его сами
+    own_egress = 'egress' not in job
+    runnable.egress = egress_pool.acquire(VideoURL.get_service_name(job['url'])) if own_egress else job['egress']
+    result: Dict[str, Any] = {'success': False, 'message': "Загрузка прервана", 'filename': ""}
+
+    def on_finished(success: bool, message: str, filename: str) -> None:
+        result.update(success=success, message=message, filename=filename)
+
+    # Прямое соединение: у обработчика нет цикла событий Qt
+    runnable.signals.progress.connect(report, Qt.ConnectionType.DirectConnection)
+    runnable.signals.finished.connect(on_finished, Qt.ConnectionType.DirectConnection)
+
+    worker = threading.Thread(target=runnable.run, name=f"job-{job['id']}", daemon=True)
+    worker.start()
+    transferred = 0
+    while worker.is_alive():
+        worker.join(0.5)
+        if cancel_event.is_set() and not runnable.cancel_event.is_set():
+            runnable.cancel()
+        if on_transferred is not None and runnable.bytes_transferred != transferred:
+            transferred = runnable.bytes_transferred
+            on_transferred(transferred)
+    if own_egress:
+        egress_pool.release(runnable.egress, "" if result['success'] else result['message'])
+    if on_output is not None:
+        on_output(runnable.output_details())
+    return result['success'], result['message'], result['filename']
+
+def download_process_main(conn, cancel_event) -> None:
+    """
+    Цикл дочернего процесса загрузки. Получает задания по conn, выполняет их
+    по одному и отправляет обратно прогресс и результат.
+    """
+    cookie_settings = None
+    while True:
+        try:
+            task = conn.recv()
+        except (EOFError, OSError):
+            break
+        if task is None:
+            break
+        if task['cookies'] != cookie_settings:
+            cookie_settings = task['cookies']
+            cookie_cache.configure(*cookie_settings)
+        job_profiler.set_enabled(task['profile'])
+        cancel_event.clear()
+
+        def report(status: str, percent: float, task_id: int = task['id']) -> None:
+            conn.send(('progress', task_id, status, percent))
+
+        def on_transferred(total: int, task_id: int = task['id']) -> None:
+            conn.send(('transferred', task_id, total))
+
+        def on_output(details: Dict[str, Any], task_id: int = task['id']) -> None:
+            conn.send(('output', task_id, details))
+
+        success, message, filename = execute_farm_job(task, report, cancel_event, task['output_dir'],
+                                                      on_transferred, on_output)
+        conn.send(('finished', task['id'], success, message, filename))
+
+class ProcessDownloadPool:
+    """
+    Выполняет DownloadRunnable в дочерних процессах, чтобы извлечение yt-dlp не
+    конкурировало за GIL с потоком интерфейса. Процессы запускаются через spawn
+    (работает и в сборке PyInstaller), аварийно завершившиеся перезапускаются.
+    Сигналы runnable испускаются так же, как при выполнении в QThreadPool.
+    """
+
+    class Worker:
+        def __init__(self, context) -> None:
+            self.conn, child_conn = context.Pipe()
+            self.cancel_event = context.Event()
+            self.process = context.Process(target=download_process_main, args=(child_conn, self.cancel_event),
+                                           name='download-worker', daemon=True)
+            self.process.start()
+            child_conn.close()
+            self.runnable: Optional[DownloadRunnable] = None
+
+    def __init__(self, size: int) -> None:
+        self.size = max(1, size)
+        self._context = multiprocessing.get_context('spawn')
+        self._lock = threading.Lock()
+        self._workers: List[ProcessDownloadPool.Worker] = []
+        self._pending: List[DownloadRunnable] = []
+        self._stop = threading.Event()
+        self._monitor = threading.Thread(target=self._monitor_loop, name='download-process-monitor', daemon=True)
+        self._monitor.start()
+
+    def start(self, runnable: DownloadRunnable) -> None:
+        with self._lock:
+            self._pending.append(runnable)
+            self._dispatch()
+
+    def active_count(self) -> int:
+        with self._lock:
+            return sum(1 for worker in self._workers if worker.runnable is not None) + len(self._pending)
+
+    def shutdown(self) -> None:
+        self._stop.set()
+        with self._lock:
+            for worker in self._workers:
+                if worker.runnable is not None:
+                    worker.cancel_event.set()
+                try:
+                    worker.conn.send(None)
+                except OSError:
+                    pass
+        self._monitor.join(2)
+
+    def _dispatch(self) -> None:
+        """Передаёт ожидающие задания свободным процессам. Вызывается под self._lock."""
+        while self._pending:
+            worker = next((w for w in self._workers if w.runnable is None), None)
+            if worker is None:
+                if len(self._workers) >= self.size:
+                    return
+                worker = self.Worker(self._context)
+                self._workers.append(worker)
+                logger.info(f"Запущен процесс загрузки {worker.process.pid}")
+            runnable = self._pending.pop(0)
+            if runnable.cancel_event.is_set():
+                runnable.signals.finished.emit(False, "Загрузка отменена", "")
+                continue
+            task = {
+                'id': runnable.item_id, 'url': runnable.url, 'mode': runnable.mode,
+                'resolution': runnable.resolution, 'output_dir': runnable.output_dir, 'info': runnable.info,
+                'clip_start': runnable.clip[0] if runnable.clip else None,
+                'clip_end': runnable.clip[1] if runnable.clip else None, 'exact_cut': runnable.exact_cut,
+                'egress': runnable.egress,
+                'cookies': (cookie_cache.browser, cookie_cache.cookie_file, cookie_cache.persist_path),
+                'profile': job_profiler.enabled,
+            }
+            try:
+                worker.conn.send(task)
+            except (TypeError, AttributeError, pickle.PicklingError):
+                # Метаданные не сериализуются — дочерний процесс извлечёт их заново
+                task['info'] = None
+                worker.conn.send(task)
+            worker.runnable = runnable
+
+    def _monitor_loop(self) -> None:
+        while not self._stop.is_set():
+            with self._lock:
+                workers = list(self._workers)
+                for worker in workers:
+                    # Отмена из интерфейса передаётся процессу, выполняющему задание
+                    if worker.runnable is not None and worker.runnable.cancel_event.is_set():
+                        worker.cancel_event.set()
+            waitables = [worker.conn for worker in workers] + [worker.process.sentinel for worker in workers]
+            if not waitables:
+                self._stop.wait(0.2)
+                continue
+            ready = wait_connections(waitables, timeout=0.2)
+            for worker in workers:
+                if worker.conn in ready:
+                    try:
+                        while worker.conn.poll():
+                            self._handle_message(worker, worker.conn.recv())
+                    except (EOFError, OSError):
+                        pass
+                if worker.process.sentinel in ready or not worker.process.is_alive():
+                    self._restart(worker)
+
+    def _handle_message(self, worker: 'ProcessDownloadPool.Worker', message: Tuple) -> None:
+        kind, _task_id, *payload = message
+        runnable = worker.runnable
+        if runnable is None:
+            return
+        if kind == 'progress':
+            runnable.signals.progress.emit(*payload)
+        elif kind == 'transferred':
+            runnable.bytes_transferred = payload[0]
+        elif kind == 'output':
+            runnable.output_path, runnable.expected_media = payload[0]['path'], payload[0]['expected']
+        elif kind == 'finished':
+            with self._lock:
+                worker.runnable = None
+                self._dispatch()
+            runnable.signals.finished.emit(*payload)
+
+    def _restart(self, worker: 'ProcessDownloadPool.Worker') -> None:
+        worker.process.join(1)
+        with self._lock:
+            if worker not in self._workers:
+                return
+            self._workers.remove(worker)
+            runnable = worker.runnable
+            worker.conn.close()
+            if not self._stop.is_set():
+                logger.error(f"Процесс загрузки {worker.process.pid} завершился с кодом {worker.process.exitcode}, "
+                             f"запуск нового процесса")
+                self._workers.append(self.Worker(self._context))
+                self._dispatch()
+        if runnable is not None:
+            runnable.signals.finished.emit(False, "Процесс загрузки аварийно завершился", "")
+
+class JobStatusPoller(QRunnable):
+    """Опрашивает общее хранилище о состоянии отправленных заданий вне потока GUI."""
+
+    class Signals(QObject):
+        jobs_updated = pyqtSignal(list)
+        error_occurred = pyqtSignal(str)
+
+    def __init__(self, store, job_ids: List[int]) -> None:
+        super().__init__()
+        self.store = store
+        self.job_ids = job_ids
+        self.signals = self.Signals()
+
+    def run(self) -> None:
+        try:
+            self.signals.jobs_updated.emit(self.store.list_jobs(ids=self.job_ids))
+        except JobStoreError as e:
+            logger.warning(f"Не удалось получить состояние заданий: {e}")
+            self.signals.error_occurred.emit(str(e))
+
 # Функция для загрузки изображений для многократного использования
 def load_image(image_name: str, size: Tuple[int, int] = (100, 100)) -> Tuple[bool, Optional[QPixmap], str]:
     """
@@ -340,7 +2598,7 @@ def load_image(image_name: str, size: Tuple[int, int] = (100, 100)) -> Tuple[boo
                     return True, scaled_pixmap, image_path
                 else:
                     logger.warning(f"Изображение не удалось загрузить (пустой pixmap): {image_path}")
-            except Exception as e:
+            except Exception:
                 logger.exception(f"Ошибка при загрузке изображения {image_path}")
     
     logger.warning(f"Изображение {image_name} не найдено ни с одним из поддерживаемых расширений")
@@ -371,7 +2629,7 @@ def load_app_logo(size: Tuple[int, int] = (80, 80), for_app_icon: bool = False)
                 return True, scaled_pixmap, image_path
             else:
                 logger.warning(f"Логотип не удалось загрузить (пустой pixmap): {image_path}")
-        except Exception as e:
+        except Exception:
             logger.exception(f"Ошибка при загрузке логотипа: {image_path}")
     else:
         logger.warning(f"Файл логотипа не найден: {image_path}")
@@ -386,81 +2644,604 @@ class URLValidationError(VideoDownloaderError):
     """Ошибка валидации URL"""
     pass
 
-class DownloadError(VideoDownloaderError):
-    """Ошибка загрузки"""
-    pass
+class DownloadError(VideoDownloaderError):
+    """Ошибка загрузки"""
+    pass
+
+class ThemeManager:
+    @staticmethod
+    def get_dark_theme() -> str:
+        return """
+            QMainWindow { 
+                background-color: #2b2b2b;
+                color: #ffffff;
+            }
+            QFrame { 
+                background-color: #333333;
+                border-radius: 10px;
+                padding: 20px;
+            }
+            QPushButton {
+                background-color: #0d47a1;
+                color: white;
+                border: none;
+                padding: 8px 16px;
+                border-radius: 4px;
+            }
+            QPushButton:hover { 
+                background-color: #1565c0;
+            }
+        """
+
+    @staticmethod
+    def get_light_theme() -> str:
+        return """
+            QMainWindow { 
+                background-color: rgb(208, 203, 223);
+            }
+            QFrame { 
+                background-color: rgb(245, 242, 231);
+                border-radius: 10px;
+                padding: 20px;
+            }
+            QPushButton {
+                background-color: #2196F3;
+                color: white;
+                border: none;
+                padding: 8px 16px;
+                border-radius: 4px;
+            }
+            QPushButton:hover { 
+                background-color: #1976D2;
+            }
+            QLineEdit {
+                padding: 8px;
+                border: 1px solid #ddd;
+                border-radius: 4px;
+            }
+            QProgressBar {
+                border: 1px solid #ddd;
+                border-radius: 4px;
+                text-align: center;
+            }
+            QProgressBar::chunk { background-color: #4CAF50; }
+        """
+
+class OutputPlacement(Enum):
+    """Выбор папки для загрузки среди config.OUTPUT_DIRS."""
+    MOST_FREE = "most_free"
+    ROUND_ROBIN = "round_robin"
+    SERVICE = "service"
+
+class OutputPlacer:
+    """
+    Размещает загрузки по нескольким корневым папкам и резервирует под каждую
+    место (оценённый размер плюс запас на объединение/конвертацию). Если
+    загрузка нигде не помещается, place() возвращает None — её откладывают.
+    """
+
+    def __init__(self, roots: List[str], policy: OutputPlacement = OutputPlacement.MOST_FREE,
+                 by_service: Optional[Dict[str, str]] = None) -> None:
+        self.roots = list(dict.fromkeys(roots)) or [config.OUTPUT_DIR]
+        self.policy = policy
+        self.by_service = dict(by_service or {})
+        for root in self.roots + list(self.by_service.values()):
+            os.makedirs(root, exist_ok=True)
+        self._next_root = 0
+        # id элемента -> (папка, элемент, размер загрузки, запас на обработку)
+        self._reservations: Dict[int, Tuple[str, Dict[str, Any], int, int]] = {}
+
+    @staticmethod
+    def required_bytes(item: Dict[str, Any]) -> Tuple[int, int]:
+        """Место под загрузку и под временный файл объединения/конвертации."""
+        size = item.get('estimated_size') or config.UNKNOWN_SIZE_RESERVE
+        return int(size), int(size * config.MERGE_HEADROOM)
+
+    def reserved_bytes(self, root: str) -> int:
+        """Ещё не записанная часть резервов на том же томе, что и root."""
+        device = os.stat(root).st_dev
+        reserved = 0
+        for reserved_root, item, download_bytes, headroom in self._reservations.values():
+            if os.stat(reserved_root).st_dev != device:
+                continue
+            # Уже загруженная часть учтена в свободном месте диска
+            written = max(item.get('progress', 0.0), 0.0) / 100
+            reserved += int(download_bytes * (1 - written)) + headroom
+        return reserved
+
+    def available_bytes(self, root: str) -> int:
+        try:
+            free = shutil.disk_usage(root).free
+        except OSError as e:
+            logger.error(f"Не удалось определить свободное место в {root}: {e}")
+            return 0
+        return free - self.reserved_bytes(root) - config.MIN_FREE_SPACE
+
+    def candidates(self, item: Dict[str, Any]) -> List[str]:
+        """Папки в порядке предпочтения согласно политике."""
+        if self.policy == OutputPlacement.SERVICE and item.get('service') in self.by_service:
+            # Папка сервиса задана явно — другие не используем
+            return [self.by_service[item['service']]]
+        if self.policy == OutputPlacement.ROUND_ROBIN:
+            start = self._next_root % len(self.roots)
+            return self.roots[start:] + self.roots[:start]
+        return sorted(self.roots, key=self.available_bytes, reverse=True)
+
+    def place(self, item: Dict[str, Any]) -> Optional[str]:
+        """Выбирает папку и резервирует место; None, если загрузка сейчас нигде не помещается."""
+        download_bytes, headroom = self.required_bytes(item)
+        for root in self.candidates(item):
+            if self.available_bytes(root) >= download_bytes + headroom:
+                if root in self.roots:
+                    self._next_root = self.roots.index(root) + 1
+                self._reservations[item['id']] = (root, item, download_bytes, headroom)
+                logger.info(f"Загрузка {item['id']} размещена в {root}, "
+                            f"зарезервировано {(download_bytes + headroom) / (1024 * 1024):.0f} МБ")
+                return root
+        return None
+
+    def release(self, item_id: int) -> None:
+        self._reservations.pop(item_id, None)
+
+    @classmethod
+    def from_config(cls) -> 'OutputPlacer':
+        try:
+            policy = OutputPlacement(config.OUTPUT_PLACEMENT)
+        except ValueError:
+            logger.warning(f"Неизвестная политика размещения: {config.OUTPUT_PLACEMENT}, используется most_free")
+            policy = OutputPlacement.MOST_FREE
+        return cls(config.OUTPUT_DIRS or [config.OUTPUT_DIR], policy, config.OUTPUT_DIR_BY_SERVICE)
+
+def probe_media(path: str) -> Optional[Dict[str, Any]]:
+    """
+    Длительность файла и дорожек по ffprobe; None, если файл не читается.
+    Если ffprobe не запустился или вернул не JSON, исключение передаётся дальше.
+    """
+    stdout, _, returncode = YDLPopen.run(
+        ['ffprobe', '-v', 'error', '-show_entries', 'format=duration:stream=codec_type,duration',
+         '-of', 'json', path],
+        text=True, encoding='utf-8', errors='replace', stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        timeout=config.VERIFY_TIMEOUT)
+    if returncode != 0:
+        return None
+    data = json.loads(stdout)
+    streams: Dict[str, Optional[float]] = {}
+    for stream in data.get('streams') or []:
+        kind = stream.get('codec_type')
+        if kind in ('video', 'audio') and kind not in streams:
+            duration = stream.get('duration')
+            streams[kind] = float(duration) if duration not in (None, 'N/A') else None
+    duration = (data.get('format') or {}).get('duration')
+    return {'duration': float(duration) if duration not in (None, 'N/A') else None, 'streams': streams}
+
+def find_decode_errors(path: str) -> str:
+    """
+    Ошибки чтения файла по ffmpeg: без VERIFY_FULL_DECODE — только разбор
+    контейнера и пакетов (быстро), с ним — полное декодирование.
+    """
+    command = ['ffmpeg', '-nostdin', '-v', 'error', '-i', path, '-map', '0']
+    if not config.VERIFY_FULL_DECODE:
+        command += ['-c', 'copy']
+    _, stderr, _ = YDLPopen.run(command + ['-f', 'null', '-'], text=True, encoding='utf-8', errors='replace',
+                                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=config.VERIFY_TIMEOUT)
+    return stderr.strip()
+
+def verify_media(path: str, expected: Dict[str, Any]) -> List[Tuple[str, str]]:
+    """
+    Проверяет файл: читается ли он, есть ли нужные дорожки, не короче ли
+    ожидаемого он и каждая дорожка, нет ли ошибок при чтении. Возвращает список
+    проблем (вид, описание); вид — 'unreadable', 'decode' или имя дорожки
+    ('video', 'audio'), которую можно перезагрузить отдельно.
+    """
+    if not os.path.isfile(path):
+        return [('unreadable', "файл не найден")]
+    media = probe_media(path)
+    if media is None:
+        return [('unreadable', "файл не читается ffprobe")]
+    problems: List[Tuple[str, str]] = []
+    duration = expected.get('duration')
+    minimum = duration - max(config.VERIFY_DURATION_TOLERANCE, duration * 0.02) if duration else None
+    for kind in ('video', 'audio'):
+        if not expected.get(kind):
+            continue
+        if kind not in media['streams']:
+            problems.append((kind, f"нет дорожки {kind}"))
+            continue
+        stream_duration = media['streams'][kind] or media['duration']
+        if minimum is not None and stream_duration is not None and stream_duration < minimum:
+            problems.append((kind, f"дорожка {kind} короче ожидаемого: {stream_duration:.1f} из {duration:.1f} с"))
+    errors = find_decode_errors(path)
+    if errors:
+        problems.append(('decode', errors.splitlines()[0][:200]))
+    return problems
+
+def repair_stream(url: str, path: str, kind: str, resolution: Optional[str]) -> bool:
+    """
+    Перезагружает только повреждённую дорожку (kind — 'video' или 'audio') и
+    заново объединяет её с исправной дорожкой файла без перекодирования.
+    """
+    base = os.path.splitext(path)[0]
+    height = (resolution or config.DEFAULT_RESOLUTION).replace('p', '')
+    ydl_opts: Dict[str, Any] = {
+        'format': 'bestaudio/best' if kind == 'audio' else f'bestvideo[height<={height}]/bestvideo',
+        'outtmpl': f'{base}.repair-{kind}.%(ext)s',
+        'quiet': True,
+        'no_warnings': True,
+        'overwrites': True,
+    }
+    service = VideoURL.get_service_name(url)
+    ydl_opts.update(ServiceProfiles.ydl_options(service, service_profiles.get(service)))
+    fetched, repaired = None, prepend_extension(path, 'repaired')
+    try:
+        with VideoDownloaderYDL(ydl_opts, cookiejar=cookie_cache.get_jar()) as ydl:
+            info = ydl.extract_info(url, download=True)
+            downloads = (info or {}).get('requested_downloads') or []
+            fetched = downloads[0].get('filepath') if downloads else None
+        if not fetched or not os.path.isfile(fetched):
+            return False
+        keep = 'a' if kind == 'video' else 'v'
+        _, stderr, returncode = YDLPopen.run(
+            ['ffmpeg', '-nostdin', '-y', '-v', 'error', '-i', path, '-i', fetched,
+             '-map', f'0:{keep}:0', '-map', f'1:{kind[0]}:0', '-c', 'copy', repaired],
+            text=True, encoding='utf-8', errors='replace', stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+            timeout=config.VERIFY_TIMEOUT)
+        if returncode != 0:
+            logger.warning(f"Не удалось объединить перезагруженную дорожку {kind}: {stderr.strip()[:200]}")
+            return False
+        os.replace(repaired, path)
+        return True
+    except Exception as e:
+        logger.warning(f"Не удалось перезагрузить дорожку {kind} для {url}: {e}")
+        return False
+    finally:
+        for leftover in (fetched, repaired):
+            if leftover and os.path.isfile(leftover):
+                with contextlib.suppress(OSError):
+                    os.remove(leftover)
+
+class VerifyRunnable(QRunnable):
+    """
+    Проверка загруженного файла в отдельном пуле. Если повреждена только одна
+    дорожка объединённого видео, перезагружается только она; иначе результат
+    'failed' — загрузку нужно повторить полностью.
+    """
+
+    class Signals(QObject):
+        # id элемента, результат ('ok', 'repaired', 'failed' или 'unverified' — проверка
+        # не выполнена), описание
+        verified = pyqtSignal(int, str, str)
+
+    def __init__(self, item_id: int, item: Dict[str, Any], path: str, expected: Dict[str, Any]) -> None:
+        super().__init__()
+        self.item_id = item_id
+        self.item = item
+        self.path = path
+        self.expected = expected
+        self.signals = self.Signals()
+
+    def run(self) -> None:
+        try:
+            status, detail = self.verify()
+        except Exception as e:
+            logger.exception(f"Ошибка проверки {self.path}")
+            status, detail = 'unverified', f"проверка не выполнена: {e}"
+        self.signals.verified.emit(self.item_id, status, detail)
+
+    def verify(self) -> Tuple[str, str]:
+        started = time.monotonic()
+        problems = verify_media(self.path, self.expected)
+        logger.info(f"Проверка {self.path} за {time.monotonic() - started:.2f} с: "
+                    f"{'; '.join(detail for _, detail in problems) or 'без ошибок'}")
+        if not problems:
+            return 'ok', ""
+        detail = '; '.join(detail for _, detail in problems)
+        kinds = {kind for kind, _ in problems}
+        # Отдельная дорожка перезагружается только у объединённого видео без обрезки
+        if (len(kinds) == 1 and kinds <= {'video', 'audio'} and self.item['mode'] == 'video'
+                and not self.item.get('clip') and self.expected.get('video') and self.expected.get('audio')):
+            kind = kinds.pop()
+            logger.warning(f"Перезагрузка дорожки {kind}: {self.path} ({detail})")
+            if repair_stream(self.item['url'], self.path, kind, self.item.get('resolution')) \
+                    and not verify_media(self.path, self.expected):
+                return 'repaired', f"{detail}; перезагружена дорожка {kind}"
+        return 'failed', detail
+
+def classify_failure(message: str) -> str:
+    """
+    Класс ошибки загрузки по сообщению: 'throttle' — ограничение скорости,
+    'network' — сетевая ошибка, 'cancelled', 'crash' — сбой процесса загрузки,
+    'other' — остальные (видео недоступно, ошибка обработки и т. п.).
+    """
+    lowered = message.lower()
+    if any(marker.lower() in lowered for marker in config.EGRESS_THROTTLE_MARKERS):
+        return 'throttle'
+    if message == "Загрузка отменена":
+        return 'cancelled'
+    if "аварийно завершился" in message:
+        return 'crash'
+    if any(marker in lowered for marker in ("подключени", "timed out", "timeout", "connection", "ssl")):
+        return 'network'
+    return 'other'
+
+class ConcurrencyController:
+    """
+    Подбор числа одновременных загрузок для каждого сервиса (AIMD). Раз в
+    интервал: если слоты сервиса заняты, ошибок не было и скорость не упала,
+    предел растёт на единицу; при ошибках ограничения скорости или сети и при
+    падении общей скорости сервиса ниже AIMD_COLLAPSE_RATIO от средней —
+    уменьшается в AIMD_DECREASE раз, не чаще раза за интервал. Границы —
+    AIMD_MIN_CONCURRENCY и AIMD_MAX_CONCURRENCY (или max_concurrent профиля).
+    """
+
+    def __init__(self, initial: int, minimum: int, maximum: int, interval: float) -> None:
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.interval = interval
+        self._states: Dict[str, Dict[str, Any]] = {}
+
+    def _state(self, service: str) -> Dict[str, Any]:
+        if service not in self._states:
+            self._states[service] = {
+                'limit': float(min(max(self.initial, self.minimum), self._maximum(service))),
+                'bytes': None, 'checked_at': None, 'rate': 0.0, 'average_rate': None,
+                'errors': 0, 'decreased_at': 0.0,
+            }
+        return self._states[service]
+
+    def _maximum(self, service: str) -> int:
+        cap = service_profiles.get(service)['max_concurrent']
+        return min(self.maximum, cap) if cap is not None else self.maximum
+
+    def limit(self, service: str) -> int:
+        """Текущий предел одновременных загрузок сервиса."""
+        return min(int(self._state(service)['limit']), self._maximum(service))
+
+    def _decrease(self, service: str, state: Dict[str, Any], reason: str) -> None:
+        now = time.monotonic()
+        if now - state['decreased_at'] < self.interval:
+            return
+        previous = int(state['limit'])
+        state['limit'] = max(state['limit'] * config.AIMD_DECREASE, float(self.minimum))
+        state['decreased_at'] = now
+        logger.warning(f"Одновременных загрузок {service}: {previous} -> {int(state['limit'])} ({reason})")
+
+    def on_finished(self, service: str, success: bool, message: str) -> None:
+        """Учитывает завершение загрузки; ошибки перегрузки сразу уменьшают предел."""
+        if success:
+            return
+        failure = classify_failure(message)
+        if failure in ('throttle', 'network'):
+            state = self._state(service)
+            state['errors'] += 1
+            self._decrease(service, state, f"ошибка: {failure}")
+
+    def tick(self, service: str, total_bytes: int, active: int) -> bool:
+        """
+        Пересчитывает предел по байтам, полученным с прошлого вызова.
+        Возвращает True, если предел вырос.
+        """
+        state = self._state(service)
+        now = time.monotonic()
+        if state['checked_at'] is None:
+            state['bytes'], state['checked_at'] = total_bytes, now
+            return False
+        elapsed = now - state['checked_at']
+        if elapsed < self.interval:
+            return False
+        rate = max(total_bytes - state['bytes'], 0) / elapsed
+        errors = state['errors']
+        average = state['average_rate']
+        state.update(bytes=total_bytes, checked_at=now, rate=rate, errors=0)
+        state['average_rate'] = rate if average is None else 0.7 * average + 0.3 * rate
+        if errors or active == 0:
+            return False
+        if average and rate < average * config.AIMD_COLLAPSE_RATIO:
+            self._decrease(service, state, f"скорость упала до {rate / 1024 / 1024:.2f} МБ/с "
+                                           f"при средней {average / 1024 / 1024:.2f} МБ/с")
+            return False
+        if active < int(state['limit']) or state['limit'] >= self._maximum(service):
+            return False
+        previous = int(state['limit'])
+        state['limit'] = min(state['limit'] + 1, float(self._maximum(service)))
+        logger.info(f"Одновременных загрузок {service}: {previous} -> {int(state['limit'])} "
+                    f"(скорость {rate / 1024 / 1024:.2f} МБ/с, ошибок нет)")
+        return True
+
+    def metrics(self) -> Dict[str, Dict[str, Any]]:
+        """Предел, последняя и средняя скорость (байт/с) по сервисам."""
+        return {service: {'limit': self.limit(service), 'rate': state['rate'], 'average_rate': state['average_rate']}
+                for service, state in self._states.items()}
+
+def format_bytes(size: Optional[float]) -> str:
+    if size is None:
+        return "—"
+    for unit in ("Б", "КБ", "МБ", "ГБ"):
+        if size < 1024 or unit == "ГБ":
+            return f"{size:.0f} {unit}" if unit == "Б" else f"{size:.1f} {unit}"
+        size /= 1024
+    return ""
+
+class RunHistory:
+    """
+    Итоги одного запуска очереди. В памяти хранятся только счётчики и смещения
+    каждой INDEX_STEP-й записи; записи по каждой загрузке дописываются в файл
+    JSON Lines в каталоге directory, из него читаются страницы сводки и
+    выгружаются отчёты JSON/CSV.
+    """
+
+    INDEX_STEP = 100
+    FIELDS = ('finished_at', 'status', 'url', 'service', 'mode', 'path', 'bytes', 'duration', 'throughput',
+              'failure_class', 'error')
+    # Состояния записей: загрузка ('done', 'failed') и итог проверки файла
+    # ('repaired', 'corrupt', 'redownload' — файл удалён и загружается заново,
+    # 'unverified' — проверку выполнить не удалось)
+    STATUS_TITLES = {'done': "✓", 'failed': "✗", 'repaired': "🔧", 'corrupt': "⚠", 'redownload': "↻",
+                     'unverified': "?"}
+
+    def __init__(self, directory: str, keep: int = 20) -> None:
+        self.directory = directory
+        self.keep = keep
+        self.path: Optional[str] = None
+        self.count = 0
+        self.statuses: Counter = Counter()
+        self.failure_classes: Counter = Counter()
+        self.total_bytes = 0
+        self.total_duration = 0.0
+        self._offsets: List[int] = []
+        self._size = 0
+        self._file = None
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _open(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        self.path = os.path.join(self.directory, f"run_{datetime.now():%Y%m%d_%H%M%S}_{os.getpid()}.jsonl")
+        self._file = open(self.path, 'ab')
+        self._prune()
+
+    def _prune(self) -> None:
+        runs = sorted(glob.glob(os.path.join(self.directory, 'run_*.jsonl')), key=os.path.getmtime)
+        for path in runs[:-self.keep]:
+            if os.path.abspath(path) != os.path.abspath(self.path):
+                with contextlib.suppress(OSError):
+                    os.remove(path)
+
+    def record(self, status: str, item: Dict[str, Any], path: Optional[str] = None,
+               bytes_transferred: Optional[int] = None, duration: Optional[float] = None, error: str = "") -> None:
+        """Дописывает запись о загрузке в файл и обновляет счётчики."""
+        if self._file is None:
+            self._open()
+        failure_class = classify_failure(error) if status == 'failed' else ""
+        entry = {
+            'finished_at': datetime.now().isoformat(timespec='seconds'),
+            'status': status,
+            'url': item['url'],
+            'service': item.get('service'),
+            'mode': item.get('mode'),
+            'path': path,
+            'bytes': bytes_transferred,
+            'duration': round(duration, 2) if duration is not None else None,
+            'throughput': round(bytes_transferred / duration) if bytes_transferred and duration else None,
+            'failure_class': failure_class,
+            'error': error,
+        }
+        if self.count % self.INDEX_STEP == 0:
+            self._offsets.append(self._size)
+        line = json.dumps(entry, ensure_ascii=False).encode('utf-8') + b'\n'
+        self._file.write(line)
+        self._file.flush()
+        self._size += len(line)
+        self.count += 1
+        self.statuses[status] += 1
+        if status == 'redownload':
+            # Загрузка будет выполнена заново и попадёт в итоги ещё раз
+            self.statuses['done'] -= 1
+        if failure_class:
+            self.failure_classes[failure_class] += 1
+        if status in ('done', 'failed'):
+            self.total_bytes += bytes_transferred or 0
+            self.total_duration += duration or 0.0
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def entries(self, start: int = 0, count: Optional[int] = None):
+        """Записи с номера start (не больше count) в порядке добавления."""
+        if not self.path or start >= self.count:
+            return
+        if self._file is not None:
+            self._file.flush()
+        remaining = self.count - start if count is None else min(count, self.count - start)
+        with open(self.path, 'rb') as f:
+            f.seek(self._offsets[start // self.INDEX_STEP])
+            for _ in range(start % self.INDEX_STEP):
+                f.readline()
+            for _ in range(remaining):
+                yield json.loads(f.readline())
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            'items': self.count,
+            'statuses': dict(self.statuses),
+            'failure_classes': dict(self.failure_classes),
+            'bytes': self.total_bytes,
+            'duration': round(self.total_duration, 2),
+            'throughput': round(self.total_bytes / self.total_duration) if self.total_duration else None,
+        }
 
-class ThemeManager:
-    @staticmethod
-    def get_dark_theme() -> str:
-        return """
-            QMainWindow { 
-                background-color: #2b2b2b;
-                color: #ffffff;
-            }
-            QFrame { 
-                background-color: #333333;
-                border-radius: 10px;
-                padding: 20px;
-            }
-            QPushButton {
-                background-color: #0d47a1;
-                color: white;
-                border: none;
-                padding: 8px 16px;
-                border-radius: 4px;
-            }
-            QPushButton:hover { 
-                background-color: #1565c0;
-            }
-        """
+    def summary_text(self) -> str:
+        if not self.count:
+            return ""
+        text = f"Успешно: {self.statuses['done']}, не удалось: {self.statuses['failed']}"
+        if self.failure_classes:
+            text += " (" + ", ".join(f"{name}: {number}" for name, number in self.failure_classes.most_common()) + ")"
+        text += f"\nПолучено: {format_bytes(self.total_bytes)}"
+        if self.total_duration:
+            text += f", средняя скорость загрузки: {format_bytes(self.total_bytes / self.total_duration)}/с"
+        checked = (self.statuses['repaired'] + self.statuses['corrupt'] + self.statuses['redownload']
+                   + self.statuses['unverified'])
+        if checked:
+            text += (f"\nПроверка файлов: исправлено — {self.statuses['repaired']}, "
+                     f"повреждено — {self.statuses['corrupt']}, загружено заново — {self.statuses['redownload']}, "
+                     f"не проверено — {self.statuses['unverified']}")
+        return text
 
-    @staticmethod
-    def get_light_theme() -> str:
-        return """
-            QMainWindow { 
-                background-color: rgb(208, 203, 223);
-            }
-            QFrame { 
-                background-color: rgb(245, 242, 231);
-                border-radius: 10px;
-                padding: 20px;
-            }
-            QPushButton {
-                background-color: #2196F3;
-                color: white;
-                border: none;
-                padding: 8px 16px;
-                border-radius: 4px;
-            }
-            QPushButton:hover { 
-                background-color: #1976D2;
-            }
-            QLineEdit {
-                padding: 8px;
-                border: 1px solid #ddd;
-                border-radius: 4px;
-            }
-            QProgressBar {
-                border: 1px solid #ddd;
-                border-radius: 4px;
-                text-align: center;
-            }
-            QProgressBar::chunk { background-color: #4CAF50; }
-        """
+    def export(self, path: str) -> None:
+        """Выгружает записи в JSON или CSV (по расширению path)."""
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8', newline='') as f:
+            if path.lower().endswith('.csv'):
+                writer = csv.DictWriter(f, fieldnames=self.FIELDS)
+                writer.writeheader()
+                for entry in self.entries():
+                    writer.writerow(entry)
+            else:
+                # Записи пишутся по одной, без сборки всего отчёта в памяти
+                f.write('{"summary": ' + json.dumps(self.summary(), ensure_ascii=False) + ', "items": [')
+                for index, entry in enumerate(self.entries()):
+                    f.write((',\n' if index else '\n') + json.dumps(entry, ensure_ascii=False))
+                f.write('\n]}\n')
+        os.replace(temp_path, path)
 
 class DownloadManager:
     """Класс для управления загрузками видео и аудио."""
     
-    def __init__(self, output_dir: str = 'downloads'):
+    def __init__(self, output_dir: str = config.OUTPUT_DIR,
+                 max_concurrent: int = config.MAX_CONCURRENT_DOWNLOADS,
+                 placer: Optional[OutputPlacer] = None):
         self.output_dir = output_dir
-        self.download_queue: List[Dict[str, Any]] = []
-        self.current_download: Optional[DownloadRunnable] = None
-        self.successful_downloads: List[tuple] = []
-        self.failed_downloads: List[tuple] = []
+        self.placer = placer or OutputPlacer([output_dir])
+        # С AIMD max_concurrent — начальный предел каждого сервиса, общий предел — AIMD_MAX_TOTAL
+        self.concurrency: Optional[ConcurrencyController] = None
+        if config.AIMD_ENABLED:
+            self.concurrency = ConcurrencyController(max_concurrent, config.AIMD_MIN_CONCURRENCY,
+                                                     config.AIMD_MAX_CONCURRENCY, config.AIMD_INTERVAL)
+            max_concurrent = max(max_concurrent, config.AIMD_MAX_TOTAL)
+        self.max_concurrent = max_concurrent
+        # Байты завершённых загрузок по сервисам (для расчёта скорости)
+        self.service_bytes: Counter = Counter()
+        self.download_queue = DownloadQueue()
+        # Выполняемые загрузки: id элемента -> (элемент, задача)
+        self.active_downloads: Dict[int, Tuple[Dict[str, Any], DownloadRunnable]] = {}
+        # Итоги текущего запуска очереди (подробности — в файле logs/runs/run_*.jsonl)
+        self.run_history = RunHistory(os.path.join(log_dir, 'runs'), config.RUN_HISTORY_KEEP)
+        # Проверка файлов: ожидающие запуска и выполняемые
+        self.verification_queue: List[Tuple[int, Dict[str, Any], str, Dict[str, Any]]] = []
+        self.pending_verifications: Dict[int, Dict[str, Any]] = {}
+        # Общее хранилище заданий (сервер заданий или база SQLite), если настроено
+        self.job_store = None
+        self.remote_jobs: Dict[int, Dict[str, Any]] = {}
         os.makedirs(output_dir, exist_ok=True)
 
-    def add_to_queue(self, url: str, mode: str, resolution: Optional[str] = None) -> bool:
+    def add_to_queue(self, url: str, mode: str, resolution: Optional[str] = None,
+                     priority: int = DownloadPriority.NORMAL.value,
+                     estimated_size: Optional[int] = None,
+                     clip: Optional[Tuple[Optional[float], Optional[float]]] = None,
+                     exact_cut: bool = False) -> bool:
         """Добавляет новую загрузку в очередь."""
         is_valid, error_message = VideoURL.is_valid(url)
         if not is_valid:
@@ -468,116 +3249,484 @@ class DownloadManager:
             return False
 
         service: str = VideoURL.get_service_name(url)
-        self.download_queue.append({
+        self.download_queue.push({
             'url': url,
             'mode': mode,
             'resolution': resolution,
-            'service': service
+            'service': service,
+            'priority': priority,
+            'estimated_size': estimated_size,
+            'clip': clip,
+            'exact_cut': exact_cut
         })
-        logger.info(f"Добавлено в очередь: {url}, сервис: {service}, режим: {mode}")
+        logger.info(f"Добавлено в очередь: {url}, сервис: {service}, режим: {mode}, "
+                    f"приоритет: {priority}, оценка размера: {estimated_size}, фрагмент: {clip}")
         return True
 
+    def has_queued_work(self) -> bool:
+        """Есть ли ещё загрузки: в очереди или выполняемые."""
+        return bool(self.download_queue) or bool(self.active_downloads) or bool(self.remote_jobs)
+
+    def has_pending_verifications(self) -> bool:
+        return bool(self.pending_verifications) or bool(self.verification_queue)
+
+    def has_pending(self) -> bool:
+        """Не завершён ли запуск: остались загрузки или проверки файлов."""
+        return self.has_queued_work() or self.has_pending_verifications()
+
+    def has_free_slot(self) -> bool:
+        return len(self.active_downloads) < self.max_concurrent
+
+    def submit_queue_to_job_store(self) -> int:
+        """Передаёт все элементы очереди в общее хранилище заданий."""
+        submitted = 0
+        while True:
+            item = self.download_queue.pop()
+            if item is None:
+                break
+            try:
+                clip = item.get('clip') or (None, None)
+                job_id = self.job_store.submit(item['url'], item['mode'], item['resolution'],
+                                               item['service'], item['priority'],
+                                               clip[0], clip[1], item.get('exact_cut', False))
+            except JobStoreError:
+                self.download_queue.push(item)
+                raise
+            item['remote_id'] = job_id
+            item['progress'] = 0.0
+            item['status_text'] = "В общей очереди"
+            self.remote_jobs[job_id] = item
+            submitted += 1
+        logger.info(f"В общее хранилище отправлено заданий: {submitted}")
+        return submitted
+
+    def on_remote_jobs_updated(self, jobs_state: List[Dict[str, Any]]) -> None:
+        """Обновляет состояние отправленных заданий по данным хранилища."""
+        for job in jobs_state:
+            item = self.remote_jobs.get(job['id'])
+            if item is None:
+                continue
+            item['progress'] = job['progress']
+            item['status_text'] = job.get('status_text') or job['status']
+            if job['status'] not in FINAL_STATUSES:
+                continue
+            del self.remote_jobs[job['id']]
+            if job['status'] == STATUS_DONE:
+                self.run_history.record('done', item, job.get('filename'))
+            else:
+                self.run_history.record('failed', item, error=job.get('error') or "Ошибка обработчика")
+
+    def set_queue_policy(self, policy: QueuePolicy) -> None:
+        self.download_queue.set_policy(policy)
+        logger.info(f"Политика очереди: {policy.value}")
+
+    def prefetch_candidates(self, depth: int = config.PREFETCH_DEPTH) -> List[Dict[str, Any]]:
+        """Следующие элементы очереди, для которых нужно (заново) получить метаданные."""
+        now = time.time()
+        return [item for item in self.download_queue.peek(depth)
+                if not item.get('prefetching')
+                and (item.get('info') is None or now - item['info_fetched_at'] > config.METADATA_TTL)]
+
+    def on_metadata_ready(self, item_id: int, info: Dict[str, Any]) -> None:
+        """Сохраняет метаданные элемента и уточняет оценку его размера."""
+        item = self.download_queue.get(item_id)
+        if item is None:
+            # Элемент уже запущен или удалён
+            return
+        item['prefetching'] = False
+        item['info'] = info
+        item['info_fetched_at'] = time.time()
+        item['title'] = info.get('title')
+        estimated_size = estimate_download_size(info.get('formats') or [], item['mode'], item['resolution'])
+        duration = info.get('duration')
+        if estimated_size and item.get('clip') and duration:
+            # Для фрагмента — пропорционально его длительности
+            start, end = item['clip']
+            clip_duration = min(end if end is not None else duration, duration) - (start or 0)
+            estimated_size = max(int(estimated_size * max(clip_duration, 0) / duration), 1)
+        if estimated_size and estimated_size != item.get('estimated_size'):
+            self.download_queue.update_estimate(item_id, estimated_size)
+
+    def on_metadata_failed(self, item_id: int) -> None:
+        item = self.download_queue.get(item_id)
+        if item is not None:
+            item['prefetching'] = False
+            # Повторно не запрашиваем: метаданные будут получены при загрузке
+            item['info_fetched_at'] = time.time()
+            item['info'] = {}
+
     def start_downloads(self) -> None:
         """Запускает процесс загрузки."""
         if not self.download_queue:
             logger.info("Очередь загрузок пуста")
             return
         
-        if self.current_download is None:
+        if self.has_free_slot():
             logger.info("Запуск очереди загрузок")
             self.process_queue()
 
-    def process_queue(self) -> None:
-        """Обрабатывает следующий элемент в очереди."""
+    def process_queue(self) -> Optional[DownloadRunnable]:
+        """
+        Извлекает из очереди следующий элемент, для которого хватает места на
+        диске, и создаёт для него загрузку. Не поместившиеся элементы остаются
+        в очереди с пометкой deferred до освобождения места.
+        """
+        if not self.has_free_slot():
+            return None
         if not self.download_queue:
             logger.info("Очередь загрузок завершена")
-            return
+            return None
+        download, output_dir = None, None
+        active_by_service = Counter(item['service'] for item, _ in self.active_downloads.values())
+        # Сервисы, у которых заняты все слоты, pop() пропускает, не просматривая их элементы
+        saturated = {service for service, count in active_by_service.items()
+                     if count >= self.service_limit(service)}
+        while True:
+            item = self.download_queue.pop(exclude=saturated)
+            if item is None:
+                break
+            output_dir = self.placer.place(item)
+            if output_dir is not None:
+                download = item
+                break
+            # Отложенный элемент больше не проверяется до restore_deferred()
+            if not item.get('deferred'):
+                logger.warning(f"Недостаточно места для загрузки {item['url']}, загрузка отложена")
+            self.download_queue.defer(item)
+        if download is None:
+            return None
+        download['deferred'] = False
 
-        download = self.download_queue[0]
-        logger.info(f"Начало загрузки: {download['url']}, режим: {download['mode']}")
+        info = download.pop('info', None) or None
+        if info is not None and time.time() - download['info_fetched_at'] > config.METADATA_TTL:
+            info = None
+        logger.info(f"Начало загрузки: {download['url']}, режим: {download['mode']}, "
+                    f"метаданные получены заранее: {info is not None}")
 
         download_runnable = DownloadRunnable(
             download['url'],
             download['mode'],
             download['resolution'],
-            self.output_dir
+            output_dir,
+            info,
+            download.get('clip'),
+            download.get('exact_cut', False)
         )
-        # Устанавливаем текущую загрузку до возврата объекта
-        self.current_download = download_runnable
-        logger.info("Установлена текущая загрузка")
+        download_runnable.item_id = download['id']
+        download_runnable.egress = egress_pool.acquire(download['service'])
+        download['progress'] = 0.0
+        download['started_at'] = time.monotonic()
+        self.active_downloads[download['id']] = (download, download_runnable)
+        logger.info(f"Активных загрузок: {len(self.active_downloads)}")
         return download_runnable
 
-    def cancel_current_download(self) -> None:
-        """Отменяет текущую загрузку."""
-        if self.current_download:
-            logger.info("Отмена текущей загрузки...")
-            self.current_download.cancel()
+    def retry_deferred(self) -> int:
+        """Возвращает отложенные из-за нехватки места элементы в очередь."""
+        return self.download_queue.restore_deferred()
+
+    def service_limit(self, service: str) -> int:
+        """Сколько загрузок сервиса можно выполнять одновременно."""
+        if self.concurrency is not None:
+            return self.concurrency.limit(service)
+        cap = service_profiles.get(service)['max_concurrent']
+        return cap if cap is not None else self.max_concurrent
+
+    def tune_concurrency(self) -> bool:
+        """Пересчитывает пределы сервисов; True, если какой-то предел вырос."""
+        if self.concurrency is None:
+            return False
+        active_by_service = Counter(item['service'] for item, _ in self.active_downloads.values())
+        transferred = Counter(self.service_bytes)
+        for item, runnable in self.active_downloads.values():
+            transferred[item['service']] += runnable.bytes_transferred
+        grown = False
+        for service in set(active_by_service) | self.download_queue.services():
+            grown = self.concurrency.tick(service, transferred[service], active_by_service[service]) or grown
+        return grown
+
+    def cancel_download(self, item_id: int) -> bool:
+        """
+        Отменяет выполняемую загрузку и сразу освобождает её слот.
+        Поток загрузки завершается в фоне, его сигнал finished игнорируется.
+        """
+        item, runnable = self.active_downloads.pop(item_id, (None, None))
+        if item is None:
+            return False
+        self.placer.release(item_id)
+        egress_pool.release(runnable.egress)
+        self.service_bytes[item['service']] += runnable.bytes_transferred
+        logger.info(f"Отмена загрузки {item_id}...")
+        runnable.cancel()
+        self.run_history.record('failed', item, runnable.output_path, runnable.bytes_transferred,
+                                time.monotonic() - item['started_at'], "Загрузка отменена")
+        return True
 
-    def on_download_finished(self, success: bool, message: str, filename: str) -> None:
-        """Обработчик завершения загрузки."""
+    def cancel_all_downloads(self) -> bool:
+        """Отменяет все выполняемые загрузки."""
+        cancelled = [self.cancel_download(item_id) for item_id in list(self.active_downloads)]
+        return any(cancelled)
+
+    def on_download_finished(self, item_id: int, success: bool, message: str, filename: str) -> bool:
+        """Обработчик завершения загрузки. Возвращает False для уже отменённых загрузок."""
+        item, runnable = self.active_downloads.pop(item_id, (None, None))
+        if item is None:
+            return False
+        self.placer.release(item_id)
+        egress_pool.release(runnable.egress, "" if success else message)
+        self.service_bytes[item['service']] += runnable.bytes_transferred
+        if self.concurrency is not None:
+            self.concurrency.on_finished(item['service'], success, message)
+        duration = time.monotonic() - item['started_at']
         if success:
             logger.info(f"Загрузка завершена успешно: {message}")
-            if self.current_download and filename:
-                self.successful_downloads.append((filename, self.current_download.url))
+            self.run_history.record('done', item, runnable.output_path or filename or None,
+                                    runnable.bytes_transferred, duration)
+            if config.VERIFY_DOWNLOADS and runnable.output_path and shutil.which('ffprobe') and shutil.which('ffmpeg'):
+                self.verification_queue.append((item_id, item, runnable.output_path, runnable.expected_media))
         else:
             logger.error(f"Ошибка загрузки: {message}")
-            if self.current_download:
-                self.failed_downloads.append((self.current_download.url, message))
+            self.run_history.record('failed', item, runnable.output_path, runnable.bytes_transferred,
+                                    duration, message)
+        return True
 
-        if self.download_queue:
-            self.download_queue.pop(0)
+    def take_verifications(self) -> List[Tuple[int, Dict[str, Any], str, Dict[str, Any]]]:
+        """Забирает готовые к проверке файлы и помечает их как проверяемые."""
+        jobs, self.verification_queue = self.verification_queue, []
+        for item_id, item, _, _ in jobs:
+            self.pending_verifications[item_id] = item
+        return jobs
 
-        self.current_download = None
+    def on_verified(self, item_id: int, status: str, detail: str, path: str) -> bool:
+        """
+        Учитывает результат проверки. Повреждённый файл удаляется, и загрузка
+        ставится в очередь заново (до VERIFY_MAX_REDOWNLOADS раз). Возвращает
+        True, если элемент снова в очереди.
+        """
+        item = self.pending_verifications.pop(item_id, None)
+        if item is None:
+            return False
+        if status == 'repaired':
+            self.run_history.record('repaired', item, path, error=detail)
+        elif status == 'unverified':
+            logger.warning(f"Файл не проверен: {path} ({detail})")
+            self.run_history.record('unverified', item, path, error=detail)
+        if status != 'failed':
+            return False
+        if item.get('redownloads', 0) >= config.VERIFY_MAX_REDOWNLOADS:
+            logger.error(f"Файл повреждён: {path} ({detail})")
+            self.run_history.record('corrupt', item, path, error=detail)
+            return False
+        logger.warning(f"Файл повреждён, повторная загрузка: {path} ({detail})")
+        with contextlib.suppress(OSError):
+            os.remove(path)
+        self.run_history.record('redownload', item, path, error=detail)
+        self.download_queue.push({
+            'url': item['url'],
+            'mode': item['mode'],
+            'resolution': item['resolution'],
+            'service': item['service'],
+            'priority': DownloadPriority.HIGH.value,
+            'estimated_size': item.get('estimated_size'),
+            'clip': item.get('clip'),
+            'exact_cut': item.get('exact_cut', False),
+            'title': item.get('title'),
+            'redownloads': item.get('redownloads', 0) + 1,
+        })
+        return True
 
     def clear_queue(self) -> None:
         """Очищает очередь загрузок."""
         self.download_queue.clear()
         logger.info("Очередь загрузок очищена")
 
-    def remove_from_queue(self, index: int) -> None:
-        """Удаляет элемент из очереди по индексу."""
-        if 0 <= index < len(self.download_queue):
-            del self.download_queue[index]
-            logger.info(f"Элемент {index} удален из очереди")
+    def remove_from_queue(self, item_id: int) -> None:
+        """Удаляет элемент из очереди по идентификатору."""
+        if self.download_queue.remove(item_id):
+            logger.info(f"Элемент {item_id} удален из очереди")
+
+    def move_in_queue(self, item_id: int, new_index: int) -> None:
+        """Перемещает элемент очереди на новую позицию."""
+        self.download_queue.move(item_id, new_index)
+        logger.info(f"Элемент {item_id} перемещён на позицию {new_index}")
 
     def get_download_summary(self) -> str:
-        """Возвращает сводку о загрузках."""
-        if not self.successful_downloads and not self.failed_downloads:
-            return ""
+        """Возвращает краткую сводку о загрузках текущего запуска."""
+        return self.run_history.summary_text()
 
-        message = "Результаты загрузки:\n\n"
-        if self.successful_downloads:
-            message += "Успешно загружены:\n"
-            for filename, url in self.successful_downloads:
-                # Определяем правильное расширение на основе имени файла
-                if '_audio' in filename:
-                    # Для аудио всегда будет mp3
-                    display_filename = filename.replace('.webm', '.mp3').replace('.m4a', '.mp3')
-                else:
-                    # Для видео всегда будет mp4
-                    display_filename = filename.replace('.webm', '.mp4').replace('.mkv', '.mp4')
-                message += f"✓ {display_filename}\n"
-        if self.failed_downloads:
-            message += "\nНе удалось загрузить:\n"
-            for url, error in self.failed_downloads:
-                short_url = url if len(url) <= 50 else url[:50] + "..."
-                message += f"✗ {short_url}\n   Причина: {error}\n"
-        return message
-
-    def cleanup_temp_files(self) -> None:
-        """Очищает временные файлы в папке загрузок."""
+    def finish_run(self) -> RunHistory:
+        """Завершает запуск: возвращает его итоги и начинает новые."""
+        history, self.run_history = self.run_history, RunHistory(os.path.join(log_dir, 'runs'),
+                                                                 config.RUN_HISTORY_KEEP)
+        history.close()
+        return history
+
+class RunSummaryDialog(QDialog):
+    """Постраничная сводка запуска очереди с выгрузкой отчёта в JSON/CSV."""
+
+    COLUMNS = ("", "Файл / URL", "Время", "Размер", "Скорость", "Причина")
+
+    def __init__(self, history: RunHistory, parent: Optional[QWidget] = None) -> None:
+        super().__init__(parent)
+        self.history = history
+        self.page = 0
+        self.pages = max(1, math.ceil(len(history) / config.SUMMARY_PAGE_SIZE))
+        self.setWindowTitle("Загрузка завершена")
+        self.resize(760, 480)
+
+        layout = QVBoxLayout(self)
+        summary_label = QLabel(history.summary_text())
+        summary_label.setTextInteractionFlags(Qt.TextInteractionFlag.TextSelectableByMouse)
+        layout.addWidget(summary_label)
+
+        self.table = QTableWidget(0, len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.table.verticalHeader().setVisible(False)
+        header = self.table.horizontalHeader()
+        header.setSectionResizeMode(QHeaderView.ResizeMode.ResizeToContents)
+        header.setSectionResizeMode(1, QHeaderView.ResizeMode.Stretch)
+        layout.addWidget(self.table)
+
+        buttons = QHBoxLayout()
+        self.prev_button = QPushButton("◀")
+        self.prev_button.clicked.connect(lambda: self.show_page(self.page - 1))
+        self.next_button = QPushButton("▶")
+        self.next_button.clicked.connect(lambda: self.show_page(self.page + 1))
+        self.page_label = QLabel()
+        export_button = QPushButton("Экспорт...")
+        export_button.clicked.connect(self.export)
+        close_button = QPushButton("Закрыть")
+        close_button.clicked.connect(self.close)
+        for widget in (self.prev_button, self.page_label, self.next_button):
+            buttons.addWidget(widget)
+        buttons.addStretch()
+        buttons.addWidget(export_button)
+        buttons.addWidget(close_button)
+        layout.addLayout(buttons)
+        self.show_page(0)
+
+    def show_page(self, page: int) -> None:
+        self.page = max(0, min(page, self.pages - 1))
+        entries = list(self.history.entries(self.page * config.SUMMARY_PAGE_SIZE, config.SUMMARY_PAGE_SIZE))
+        self.table.setRowCount(len(entries))
+        for row, entry in enumerate(entries):
+            duration = entry['duration']
+            throughput = entry['throughput']
+            cells = (
+                RunHistory.STATUS_TITLES.get(entry['status'], entry['status']),
+                os.path.basename(entry['path']) if entry['path'] else entry['url'],
+                f"{duration:.1f} с" if duration is not None else "—",
+                format_bytes(entry['bytes']) if entry['bytes'] else "—",
+                f"{format_bytes(throughput)}/с" if throughput else "—",
+                entry['error'],
+            )
+            for column, text in enumerate(cells):
+                cell = QTableWidgetItem(text)
+                cell.setToolTip(entry['url'] if column == 1 else text)
+                self.table.setItem(row, column, cell)
+        self.page_label.setText(f"Страница {self.page + 1} из {self.pages}")
+        self.prev_button.setEnabled(self.page > 0)
+        self.next_button.setEnabled(self.page < self.pages - 1)
+
+    def export(self) -> None:
+        default_name = os.path.splitext(os.path.basename(self.history.path or 'run'))[0] + '.json'
+        path, _ = QFileDialog.getSaveFileName(self, "Экспорт отчёта", default_name, "JSON (*.json);;CSV (*.csv)")
+        if not path:
+            return
         try:
-            if os.path.exists(self.output_dir):
-                for file in os.listdir(self.output_dir):
-                    if file.endswith(('.part', '.ytdl')):
-                        full_path = os.path.join(self.output_dir, file)
-                        try:
-                            os.remove(full_path)
-                            logger.info(f"Удалён временный файл: {full_path}")
-                        except Exception as e:
-                            logger.error(f"Ошибка при удалении файла {full_path}: {e}")
-        except Exception as e:
-            logger.error(f"Ошибка при очистке временных файлов: {e}")
+            self.history.export(path)
+        except OSError as e:
+            QMessageBox.warning(self, "Ошибка", f"Не удалось сохранить отчёт: {e}")
+
+class EventLoopMonitor(QObject):
+    """
+    Измеряет задержку цикла событий GUI: таймер срабатывает каждые interval_ms,
+    опоздание попадает в гистограмму. Сторожевой поток замечает, что таймер
+    не срабатывал дольше stall_ms, и записывает в лог стек потока GUI —
+    то место, которое его заблокировало. Гистограмма периодически выводится в лог.
+    """
+
+    # Верхние границы корзин гистограммы, мс
+    BUCKETS_MS = (5, 16, 33, 50, 100, 250, 500, 1000, 2000, 5000)
+
+    def __init__(self, interval_ms: int = 100, stall_ms: int = 500, report_interval: int = 300,
+                 parent: Optional[QObject] = None) -> None:
+        super().__init__(parent)
+        self.interval = interval_ms / 1000
+        self.stall = stall_ms / 1000
+        self.report_interval = report_interval
+        self.counts: List[int] = [0] * (len(self.BUCKETS_MS) + 1)
+        self.max_lag = 0.0
+        self.stalls = 0
+        self._gui_thread_id = threading.get_ident()
+        self._last_tick = time.monotonic()
+        self._last_report = self._last_tick
+        self._stop = threading.Event()
+        self._timer = QTimer(self)
+        self._timer.setTimerType(Qt.TimerType.PreciseTimer)
+        self._timer.setInterval(interval_ms)
+        self._timer.timeout.connect(self._on_tick)
+        self._watchdog = threading.Thread(target=self._watch, name='gui-watchdog', daemon=True)
+
+    def start(self) -> None:
+        self._last_tick = time.monotonic()
+        self._timer.start()
+        self._watchdog.start()
+        logger.info(f"Мониторинг цикла событий: интервал {self.interval * 1000:.0f} мс, "
+                    f"порог зависания {self.stall * 1000:.0f} мс")
+
+    def stop(self) -> None:
+        self._timer.stop()
+        self._stop.set()
+        self.log_histogram()
+
+    def _on_tick(self) -> None:
+        now = time.monotonic()
+        lag = max(now - self._last_tick - self.interval, 0.0)
+        self._last_tick = now
+        self.counts[bisect.bisect_left(self.BUCKETS_MS, lag * 1000)] += 1
+        self.max_lag = max(self.max_lag, lag)
+        if now - self._last_report >= self.report_interval:
+            self._last_report = now
+            self.log_histogram()
+
+    def _watch(self) -> None:
+        reported_tick = None
+        while not self._stop.wait(self.interval / 2):
+            last_tick = self._last_tick
+            blocked = time.monotonic() - last_tick
+            if blocked < self.stall or last_tick == reported_tick:
+                continue
+            # Один стек на каждое зависание
+            reported_tick = last_tick
+            self.stalls += 1
+            frame = sys._current_frames().get(self._gui_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else "стек недоступен\n"
+            logger.warning(f"Поток GUI не отвечает {blocked * 1000:.0f} мс, стек:\n{stack.rstrip()}")
+
+    def percentile(self, fraction: float) -> Optional[int]:
+        """Верхняя граница корзины, в которую попадает заданная доля замеров (мс)."""
+        total = sum(self.counts)
+        if not total:
+            return None
+        threshold = fraction * total
+        running = 0
+        for index, count in enumerate(self.counts):
+            running += count
+            if running >= threshold:
+                return self.BUCKETS_MS[index] if index < len(self.BUCKETS_MS) else None
+        return None
+
+    def log_histogram(self) -> None:
+        total = sum(self.counts)
+        if not total:
+            return
+        labels = [f"≤{bound}" for bound in self.BUCKETS_MS] + [f">{self.BUCKETS_MS[-1]}"]
+        histogram = ", ".join(f"{label}: {count}" for label, count in zip(labels, self.counts) if count)
+        p50, p99 = self.percentile(0.5), self.percentile(0.99)
+        logger.info(f"Задержка цикла событий, мс ({total} замеров): {histogram}; "
+                    f"p50 ≤{p50 if p50 is not None else '∞'}, p99 ≤{p99 if p99 is not None else '∞'}, "
+                    f"максимум {self.max_lag * 1000:.0f}; зависаний: {self.stalls}")
 
 class VideoDownloaderUI(QMainWindow):
     def __init__(self) -> None:
@@ -591,6 +3740,27 @@ class VideoDownloaderUI(QMainWindow):
         # Инициализация пула потоков
         self.thread_pool = QThreadPool()
         logger.info(f"Максимальное количество потоков: {self.thread_pool.maxThreadCount()}")
+        # Отдельный небольшой пул для заранее получаемых метаданных
+        self.prefetch_pool = QThreadPool()
+        self.prefetch_pool.setMaxThreadCount(config.PREFETCH_WORKERS)
+        # Проверка загруженных файлов
+        self.verify_pool = QThreadPool()
+        self.verify_pool.setMaxThreadCount(config.VERIFY_WORKERS)
+        # Превью (название и обложка) элементов очереди
+        self.preview_pool = QThreadPool()
+        self.preview_pool.setMaxThreadCount(config.PREVIEW_WORKERS)
+        self.preview_cache = PreviewCache(config.PREVIEW_CACHE_DIR, config.PREVIEW_MEMORY_ITEMS,
+                                          config.PREVIEW_DISK_ITEMS)
+        self.preview_pending: Set[str] = set()
+        self.preview_failed: Set[str] = set()
+        # Строки списка очереди по URL: (номер, строка, элемент, активна ли)
+        self.preview_rows: Dict[str, List[Tuple[int, QListWidgetItem, Dict[str, Any], bool]]] = {}
+        # Строки без превью: номер строки списка -> элемент; превью запрашиваются
+        # только для видимых строк и PREVIEW_LOOKAHEAD следующих
+        self.preview_missing: Dict[int, Dict[str, Any]] = {}
+        # Пул дочерних процессов загрузки создаётся при первом использовании
+        self.process_pool: Optional[ProcessDownloadPool] = None
+        self.queue_rows: Dict[int, Tuple[int, QListWidgetItem]] = {}
         
         central_widget: QWidget = QWidget()
         self.setCentralWidget(central_widget)
@@ -647,6 +3817,33 @@ class VideoDownloaderUI(QMainWindow):
         self.resolution_layout.addWidget(self.resolution_combo)
         self.resolution_layout.addWidget(refresh_button)
 
+        # Выбор приоритета
+        priority_layout: QHBoxLayout = QHBoxLayout()
+        self.priority_combo: QComboBox = QComboBox()
+        for priority in DownloadPriority:
+            self.priority_combo.addItem(priority.label, priority.value)
+        self.priority_combo.setCurrentIndex(self.priority_combo.findData(DownloadPriority.NORMAL.value))
+        priority_layout.addWidget(QLabel("Приоритет:"))
+        priority_layout.addWidget(self.priority_combo)
+        priority_layout.addStretch()
+
+        # Фрагмент: загружается только указанный отрезок
+        clip_layout: QHBoxLayout = QHBoxLayout()
+        self.clip_start_input: QLineEdit = QLineEdit()
+        self.clip_end_input: QLineEdit = QLineEdit()
+        for clip_input in (self.clip_start_input, self.clip_end_input):
+            clip_input.setPlaceholderText("ч:мм:сс")
+            clip_input.setMaximumWidth(90)
+        self.exact_cut_checkbox: QCheckBox = QCheckBox("Точная обрезка")
+        self.exact_cut_checkbox.setToolTip("Перекодировать края фрагмента. Без этого обрезка идёт по "
+                                           "ближайшим ключевым кадрам без перекодирования (быстрее)")
+        clip_layout.addWidget(QLabel("Фрагмент с:"))
+        clip_layout.addWidget(self.clip_start_input)
+        clip_layout.addWidget(QLabel("по:"))
+        clip_layout.addWidget(self.clip_end_input)
+        clip_layout.addWidget(self.exact_cut_checkbox)
+        clip_layout.addStretch()
+
         # Прогресс загрузки
         self.progress_bar: QProgressBar = QProgressBar()
         self.status_label: QLabel = QLabel("Ожидание...")
@@ -675,10 +3872,21 @@ class VideoDownloaderUI(QMainWindow):
         queue_buttons_layout.addWidget(clear_queue_button)
         queue_buttons_layout.addWidget(remove_selected_button)
 
+        # Политика очереди: короткие загрузки первыми
+        self.shortest_first_checkbox: QCheckBox = QCheckBox("Сначала короткие (по размеру)")
+        self.shortest_first_checkbox.setToolTip(
+            "Загружать сначала элементы с меньшим оценённым размером, чтобы сократить среднее время ожидания"
+        )
+
         # Очередь загрузок
         self.queue_list: QListWidget = QListWidget()
         self.queue_list.setMinimumWidth(300)
         self.queue_list.setMinimumHeight(400)
+        self.queue_list.setIconSize(QSize(*config.PREVIEW_SIZE))
+        self.queue_list.verticalScrollBar().valueChanged.connect(self.request_visible_previews)
+        # Перетаскивание элементов для ручного изменения порядка
+        self.queue_list.setDragDropMode(QAbstractItemView.DragDropMode.InternalMove)
+        self.queue_list.model().rowsMoved.connect(self.on_queue_rows_moved)
         queue_label: QLabel = QLabel("Очередь загрузок")
         queue_label.setFont(QFont("Arial", 12, QFont.Weight.Bold))
 
@@ -744,6 +3952,8 @@ class VideoDownloaderUI(QMainWindow):
         left_layout.addLayout(url_layout)
         left_layout.addLayout(mode_layout)
         left_layout.addLayout(self.resolution_layout)
+        left_layout.addLayout(priority_layout)
+        left_layout.addLayout(clip_layout)
         left_layout.addWidget(self.progress_bar)
         left_layout.addWidget(self.status_label)
         left_layout.addLayout(buttons_layout)
@@ -753,6 +3963,7 @@ class VideoDownloaderUI(QMainWindow):
         # Сборка правой панели
         right_layout.addWidget(queue_label)
         right_layout.addWidget(self.queue_list)
+        right_layout.addWidget(self.shortest_first_checkbox)
         right_layout.addLayout(queue_buttons_layout)
 
         # Добавляем панели в основной layout
@@ -763,8 +3974,40 @@ class VideoDownloaderUI(QMainWindow):
         self.setStyleSheet(ThemeManager.get_light_theme())
 
         # Инициализация переменных
-        self.download_manager = DownloadManager()
+        self.download_manager = DownloadManager(config.OUTPUT_DIR, placer=OutputPlacer.from_config())
+        # Каждой загрузке — свой поток, сколько бы слотов ни разрешил подбор AIMD
+        self.thread_pool.setMaxThreadCount(max(self.thread_pool.maxThreadCount(),
+                                               self.download_manager.max_concurrent))
         self.settings: Dict[str, Any] = self.load_settings()
+        # Запись settings.json откладывается, чтобы серия изменений дала одну запись
+        self.settings_timer = QTimer(self)
+        self.settings_timer.setSingleShot(True)
+        self.settings_timer.setInterval(config.SETTINGS_SAVE_DELAY_MS)
+        self.settings_timer.timeout.connect(self.write_settings)
+        self.setup_job_store()
+        # Оценки размеров из последнего запроса разрешений (для политики SJF)
+        self.probed_url: str = ""
+        self.probed_sizes: Dict[str, int] = {}
+        # Запросы разрешений: отложенный запуск при вводе, кэш и выполняемые запросы
+        self.resolution_cache = ResolutionCache(config.RESOLUTION_CACHE_TTL)
+        self.probe_url: str = ""
+        self.probe_workers: Dict[str, ResolutionWorker] = {}
+        self.probe_sizes: Dict[str, Dict[str, int]] = {}
+        self.probe_details: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self.pending_probe_url: Optional[str] = None
+        self.probe_timer = QTimer(self)
+        self.probe_timer.setSingleShot(True)
+        self.probe_timer.setInterval(config.PROBE_DEBOUNCE_MS)
+        self.probe_timer.timeout.connect(self.on_probe_timer)
+        # Повторная попытка запустить отложенные из-за нехватки места загрузки
+        self.space_retry_timer = QTimer(self)
+        self.space_retry_timer.setSingleShot(True)
+        self.space_retry_timer.setInterval(config.SPACE_RETRY_INTERVAL * 1000)
+        self.space_retry_timer.timeout.connect(self.retry_deferred_downloads)
+        # Подбор числа одновременных загрузок по скорости и ошибкам сервисов
+        self.concurrency_timer = QTimer(self)
+        self.concurrency_timer.setInterval(int(config.AIMD_INTERVAL * 1000))
+        self.concurrency_timer.timeout.connect(self.on_concurrency_timer)
 
         # Подключение сигналов
         paste_button.clicked.connect(self.paste_url)
@@ -773,6 +4016,8 @@ class VideoDownloaderUI(QMainWindow):
         refresh_button.clicked.connect(self.update_resolutions)
         start_button.clicked.connect(self.start_downloads)
         self.video_radio.toggled.connect(self.on_mode_changed)
+        self.url_input.textEdited.connect(self.on_url_edited)
+        self.shortest_first_checkbox.toggled.connect(self.on_queue_policy_changed)
 
         # Горячие клавиши
         QShortcut(QKeySequence("Ctrl+V"), self).activated.connect(self.paste_url)
@@ -781,6 +4026,7 @@ class VideoDownloaderUI(QMainWindow):
 
         # Применяем настройки из файла
         self.apply_settings()
+        self.setup_menu()
 
     def setup_app_icon(self) -> None:
         """Устанавливает иконку приложения."""
@@ -792,6 +4038,100 @@ class VideoDownloaderUI(QMainWindow):
         else:
             logger.warning("Файл логотипа для иконки приложения не найден")
 
+    def setup_menu(self) -> None:
+        """Создаёт меню настроек."""
+        settings_menu = self.menuBar().addMenu("Настройки")
+
+        cookies_menu = settings_menu.addMenu("Cookies из браузера")
+        cookies_group = QActionGroup(self)
+        cookies_group.setExclusive(True)
+        current_browser = self.settings.get("cookies_from_browser")
+        for browser in [None] + sorted(SUPPORTED_BROWSERS):
+            action = QAction(browser.capitalize() if browser else "Не использовать", self)
+            action.setCheckable(True)
+            action.setChecked(browser == current_browser)
+            action.triggered.connect(lambda _checked, name=browser: self.on_cookies_browser_changed(name))
+            cookies_group.addAction(action)
+            cookies_menu.addAction(action)
+
+        process_action = QAction("Загрузка в отдельных процессах", self)
+        process_action.setCheckable(True)
+        process_action.setChecked(bool(self.settings.get("process_isolation", config.PROCESS_ISOLATION)))
+        process_action.toggled.connect(self.on_process_isolation_toggled)
+        settings_menu.addAction(process_action)
+
+        profile_action = QAction("Профилирование загрузок", self)
+        profile_action.setCheckable(True)
+        profile_action.setChecked(job_profiler.enabled)
+        profile_action.toggled.connect(job_profiler.set_enabled)
+        settings_menu.addAction(profile_action)
+
+    def on_cookies_browser_changed(self, browser: Optional[str]) -> None:
+        self.settings["cookies_from_browser"] = browser
+        self.configure_cookies()
+        self.save_settings()
+
+    def on_process_isolation_toggled(self, enabled: bool) -> None:
+        # Уже запущенные загрузки продолжаются там, где начались
+        self.settings["process_isolation"] = enabled
+        self.save_settings()
+        logger.info(f"Загрузка в отдельных процессах: {'включена' if enabled else 'выключена'}")
+
+    def closeEvent(self, event) -> None:
+        if self.settings_timer.isActive():
+            self.write_settings()
+        if self.process_pool is not None:
+            self.download_manager.cancel_all_downloads()
+            self.process_pool.shutdown()
+        super().closeEvent(event)
+
+    def configure_cookies(self) -> None:
+        cookie_cache.configure(
+            self.settings.get("cookies_from_browser"),
+            self.settings.get("cookies_file"),
+            self.settings.get("cookies_cache_file")
+        )
+
+    def setup_job_store(self) -> None:
+        """Подключает общее хранилище заданий, если оно указано в настройках."""
+        location: Optional[str] = self.settings.get("job_server")
+        self.job_poll_timer = QTimer(self)
+        self.job_poll_timer.setInterval(2000)
+        self.job_poll_timer.timeout.connect(self.poll_remote_jobs)
+        self.job_poll_in_flight = False
+        if not location:
+            return
+        try:
+            self.download_manager.job_store = open_job_store(location, self.settings.get("job_server_token"))
+            logger.info(f"Загрузки выполняются через общее хранилище заданий: {location}")
+        except Exception as e:
+            logger.error(f"Не удалось подключить хранилище заданий {location}: {e}")
+
+    def poll_remote_jobs(self) -> None:
+        if self.job_poll_in_flight or not self.download_manager.remote_jobs:
+            return
+        self.job_poll_in_flight = True
+        poller = JobStatusPoller(self.download_manager.job_store, list(self.download_manager.remote_jobs))
+        poller.signals.jobs_updated.connect(self.on_remote_jobs_updated)
+        poller.signals.error_occurred.connect(self.on_remote_jobs_error)
+        self.thread_pool.start(poller)
+
+    def on_remote_jobs_updated(self, jobs_state: List[Dict[str, Any]]) -> None:
+        self.job_poll_in_flight = False
+        self.download_manager.on_remote_jobs_updated(jobs_state)
+        self.update_queue_display()
+        remaining = len(self.download_manager.remote_jobs)
+        self.status_label.setText(f"Общая очередь: выполняется заданий — {remaining}")
+        if not remaining:
+            self.job_poll_timer.stop()
+            self.show_download_summary()
+            self.set_controls_enabled(True)
+
+    def on_remote_jobs_error(self, error_msg: str) -> None:
+        self.job_poll_in_flight = False
+        self.status_label.setText(f"Сервер заданий недоступен: {error_msg}")
+        self.status_label.setStyleSheet("color: red;")
+
     def load_settings(self) -> Dict[str, Any]:
         try:
             if os.path.exists('settings.json'):
@@ -801,16 +4141,28 @@ class VideoDownloaderUI(QMainWindow):
                     return settings
         except Exception as e:
             logger.error(f"Ошибка загрузки настроек: {e}")
-        return {"download_mode": "video", "last_resolution": "720p"}
+        return {"download_mode": "video", "last_resolution": config.DEFAULT_RESOLUTION,
+                "queue_policy": QueuePolicy.FIFO.value}
 
     def save_settings(self) -> None:
+        """Обновляет настройки из состояния окна; запись в файл выполняется с задержкой."""
+        self.settings.update({
+            "download_mode": "video" if self.video_radio.isChecked() else "audio",
+            "last_resolution": self.resolution_combo.currentText(),
+            "queue_policy": self.download_manager.download_queue.policy.value
+        })
+        self.settings_timer.start()
+
+    def write_settings(self) -> None:
+        """Записывает settings.json через временный файл, чтобы сбой не оставил его обрезанным."""
+        self.settings_timer.stop()
+        temp_path = 'settings.json.tmp'
         try:
-            settings = {
-                "download_mode": "video" if self.video_radio.isChecked() else "audio",
-                "last_resolution": self.resolution_combo.currentText()
-            }
-            with open('settings.json', 'w', encoding='utf-8') as f:
-                json.dump(settings, f)
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.settings, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, 'settings.json')
             logger.info("Настройки сохранены")
         except Exception as e:
             logger.error(f"Ошибка сохранения настроек: {e}")
@@ -824,6 +4176,9 @@ class VideoDownloaderUI(QMainWindow):
             self.audio_radio.setChecked(True)
         else:
             self.video_radio.setChecked(True)
+        if self.settings.get("queue_policy") == QueuePolicy.SHORTEST_FIRST.value:
+            self.shortest_first_checkbox.setChecked(True)
+        self.configure_cookies()
         # Если режим видео и есть сохранённое разрешение, устанавливаем его (после получения доступных разрешений)
         # Здесь можно добавить дополнительную логику для установки разрешения
 
@@ -841,31 +4196,95 @@ class VideoDownloaderUI(QMainWindow):
         logger.info(f"URL вставлен из буфера обмена: {url}")
 
         if self.video_radio.isChecked():
-            self.update_resolutions()
+            # Запрашиваем сразу, не дожидаясь таймера ввода
+            self.probe_timer.stop()
+            self.request_probe(url)
+
+    def on_url_edited(self, _text: str) -> None:
+        """Перезапускает отложенный запрос разрешений при вводе URL."""
+        self.probe_timer.start()
+
+    def on_probe_timer(self) -> None:
+        url: str = self.url_input.text().strip()
+        if self.video_radio.isChecked() and VideoURL.is_valid(url)[0]:
+            self.request_probe(url)
 
     def update_resolutions(self) -> None:
         """
         Получает доступные разрешения в отдельном потоке для повышения отзывчивости UI.
+        Кнопка "Обновить" игнорирует кэш.
         """
         url: str = self.url_input.text().strip()
         if not url or not url.startswith(('http://', 'https://')):
             return
+        self.request_probe(url, force=True)
+
+    def request_probe(self, url: str, force: bool = False) -> None:
+        """
+        Запрашивает разрешения для url. Результаты для устаревших URL
+        игнорируются, одинаковые одновременные запросы объединяются, а число
+        одновременных запросов ограничено config.MAX_CONCURRENT_PROBES.
+        """
+        if not force:
+            cached = self.resolution_cache.get(url)
+            if cached is not None:
+                self.probe_url = url
+                self.apply_probe_result(url, *cached)
+                return
+            if url == self.probe_url and url in self.probe_workers:
+                return
 
+        self.probe_url = url
         self.resolution_combo.clear()
         self.resolution_combo.addItem("Получение разрешений...")
         self.resolution_combo.setEnabled(False)
         self.status_label.setText("Получение доступных разрешений...")
         self.status_label.setStyleSheet("color: #2196F3;")
-        QApplication.processEvents()
 
-        self.resolution_worker = ResolutionWorker(url)
-        self.resolution_worker.resolutions_found.connect(self.on_resolutions_found)
-        self.resolution_worker.error_occurred.connect(self.on_resolutions_error)
-        self.resolution_worker.start()
+        if url in self.probe_workers:
+            # Такой запрос уже выполняется — дождёмся его результата
+            return
+        if len(self.probe_workers) >= config.MAX_CONCURRENT_PROBES:
+            # Откладываем только последний запрошенный URL, предыдущие отложенные не нужны
+            self.pending_probe_url = url
+            logger.info(f"Запрос разрешений отложен (лимит {config.MAX_CONCURRENT_PROBES}): {url}")
+            return
+        self.start_probe(url)
+
+    def start_probe(self, url: str) -> None:
+        worker = ResolutionWorker(url)
+        worker.sizes_found.connect(lambda sizes, probed_url=url: self.probe_sizes.update({probed_url: sizes}))
+        worker.details_found.connect(
+            lambda details, probed_url=url: self.probe_details.update({probed_url: details})
+        )
+        worker.resolutions_found.connect(
+            lambda resolutions, probed_url=url: self.on_resolutions_found(probed_url, resolutions)
+        )
+        worker.error_occurred.connect(lambda error_msg, probed_url=url: self.on_resolutions_error(probed_url, error_msg))
+        worker.finished.connect(lambda probed_url=url: self.on_probe_finished(probed_url))
+        self.probe_workers[url] = worker
+        worker.start()
 
-    def on_resolutions_found(self, sorted_resolutions: List[str]) -> None:
+    def on_probe_finished(self, url: str) -> None:
+        worker = self.probe_workers.pop(url, None)
+        if worker is not None:
+            worker.deleteLater()
+        if self.pending_probe_url and len(self.probe_workers) < config.MAX_CONCURRENT_PROBES:
+            pending, self.pending_probe_url = self.pending_probe_url, None
+            # Отложенный URL мог устареть, пока ждал своей очереди
+            if pending == self.probe_url and pending not in self.probe_workers:
+                self.start_probe(pending)
+
+    def apply_probe_result(self, url: str, sorted_resolutions: List[str], sizes: Dict[str, int],
+                           details: Dict[str, Dict[str, Any]]) -> None:
+        self.probed_url = url
+        self.probed_sizes = sizes
         self.resolution_combo.clear()
         self.resolution_combo.addItems(sorted_resolutions)
+        # Частота кадров, кодек и размер — в подсказке к каждому разрешению
+        for index, resolution in enumerate(sorted_resolutions):
+            self.resolution_combo.setItemData(index, describe_resolution(resolution, details.get(resolution)),
+                                              Qt.ItemDataRole.ToolTipRole)
         self.resolution_combo.setEnabled(True)
         self.status_label.setText("Разрешения обновлены")
         self.status_label.setStyleSheet("color: green;")
@@ -875,9 +4294,20 @@ class VideoDownloaderUI(QMainWindow):
             index = sorted_resolutions.index(last_resolution)
             self.resolution_combo.setCurrentIndex(index)
 
-    def on_resolutions_error(self, error_msg: str) -> None:
+    def on_resolutions_found(self, url: str, sorted_resolutions: List[str]) -> None:
+        sizes = self.probe_sizes.pop(url, {})
+        details = self.probe_details.pop(url, {})
+        self.resolution_cache.set(url, sorted_resolutions, sizes, details)
+        if url != self.probe_url:
+            logger.info(f"Результат устаревшего запроса разрешений проигнорирован: {url}")
+            return
+        self.apply_probe_result(url, sorted_resolutions, sizes, details)
+
+    def on_resolutions_error(self, url: str, error_msg: str) -> None:
+        if url != self.probe_url:
+            return
         self.resolution_combo.clear()
-        self.resolution_combo.addItem("720p")
+        self.resolution_combo.addItem(config.DEFAULT_RESOLUTION)
         self.resolution_combo.setEnabled(True)
         self.status_label.setText(f"Ошибка: {error_msg}")
         self.status_label.setStyleSheet("color: red;")
@@ -886,77 +4316,293 @@ class VideoDownloaderUI(QMainWindow):
         url: str = self.url_input.text().strip()
         mode: str = "video" if self.video_radio.isChecked() else "audio"
         resolution: Optional[str] = self.resolution_combo.currentText() if mode == "video" else None
+        priority: int = self.priority_combo.currentData()
+        estimated_size: Optional[int] = None
+        if url == self.probed_url:
+            estimated_size = self.probed_sizes.get(resolution if mode == "video" else mode)
+        try:
+            clip = parse_clip_range(self.clip_start_input.text(), self.clip_end_input.text())
+        except ValueError as e:
+            QMessageBox.warning(self, "Ошибка", f"Фрагмент: {e}")
+            return
 
-        if self.download_manager.add_to_queue(url, mode, resolution):
+        if self.download_manager.add_to_queue(url, mode, resolution, priority, estimated_size,
+                                              clip, self.exact_cut_checkbox.isChecked()):
             self.update_queue_display()
             self.url_input.clear()
+            self.clip_start_input.clear()
+            self.clip_end_input.clear()
             self.save_settings()
+            self.schedule_prefetch()
         else:
             QMessageBox.warning(self, "Ошибка", "Некорректный URL")
 
+    def queue_item_text(self, index: int, item: Dict[str, Any], is_active: bool) -> str:
+        mode_text = f"видео ({item['resolution']})" if item['mode'] == "video" else "аудио"
+        if item.get('clip'):
+            mode_text += f" ✂ {format_clip(item['clip'])}"
+        prefix = " "
+        if item.get('remote_id') is not None:
+            prefix = f"☁ {item['progress']:.0f}%"
+        elif is_active:
+            prefix = f"⌛ {item['progress']:.0f}%" if item.get('progress', -1) >= 0 else "⌛"
+        elif item.get('deferred'):
+            # Отложено: не хватает места ни в одной из папок загрузок
+            prefix = "⏸"
+        priority_text = "" if item['priority'] == DownloadPriority.NORMAL.value \
+            else f" [{DownloadPriority(item['priority']).label}]"
+        size_text = f" ~{item['estimated_size'] / (1024 * 1024):.0f} МБ" if item.get('estimated_size') else ""
+        # Название из заранее полученных метаданных показываем вместо URL
+        name = item.get('title') or item['url']
+        return (f"{prefix} {index}. [{item.get('service', 'Неизвестный сервис')}] {name} - "
+                f"{mode_text}{size_text}{priority_text}")
+
     def update_queue_display(self) -> None:
         self.queue_list.clear()
-        for i, item in enumerate(self.download_manager.download_queue, 1):
-            mode_text = f"видео ({item['resolution']})" if item['mode'] == "video" else "аудио"
-            # Проверяем, является ли текущий элемент активной загрузкой
-            is_current = (
-                self.download_manager.current_download is not None and
-                i == 1  # Первый элемент в очереди всегда является текущей загрузкой
-            )
-            prefix = "⌛" if is_current else " "
-            self.queue_list.addItem(
-                f"{prefix} {i}. [{item.get('service', 'Неизвестный сервис')}] {item['url']} - {mode_text}"
-            )
+        self.queue_rows: Dict[int, Tuple[int, QListWidgetItem]] = {}
+        self.preview_rows = {}
+        self.preview_missing = {}
+        rows: List[Tuple[Dict[str, Any], bool]] = []
+        rows.extend((item, True) for item, _ in self.download_manager.active_downloads.values())
+        rows.extend((item, False) for item in self.download_manager.download_queue)
+        rows.extend((item, False) for item in self.download_manager.remote_jobs.values())
+
+        for i, (item, is_active) in enumerate(rows, 1):
+            preview = self.preview_cache.peek(item['url'])
+            if preview is not None and preview[0] and not item.get('title'):
+                item['title'] = preview[0]
+            list_item = QListWidgetItem(self.queue_item_text(i, item, is_active))
+            if preview is not None and preview[1] is not None:
+                list_item.setIcon(QIcon(QPixmap.fromImage(preview[1])))
+            elif preview is None:
+                self.preview_rows.setdefault(item['url'], []).append((i, list_item, item, is_active))
+                self.preview_missing[i - 1] = item
+            list_item.setData(Qt.ItemDataRole.UserRole, item['id'])
+            list_item.setToolTip(item['url'])
+            if is_active or item.get('remote_id') is not None:
+                # Активную загрузку нельзя перетаскивать или удалять из очереди
+                list_item.setFlags(list_item.flags() & ~Qt.ItemFlag.ItemIsDragEnabled)
+            self.queue_list.addItem(list_item)
+            if is_active:
+                self.queue_rows[item['id']] = (i, list_item)
+        self.request_visible_previews()
+
+    def request_visible_previews(self) -> None:
+        """Запрашивает превью видимых строк очереди и PREVIEW_LOOKAHEAD следующих."""
+        if not self.preview_missing:
+            return
+        count = self.queue_list.count()
+        first = max(self.queue_list.indexAt(QPoint(0, 0)).row(), 0)
+        last = self.queue_list.indexAt(QPoint(0, self.queue_list.viewport().height() - 1)).row()
+        if last < 0:
+            last = count - 1
+        for row in range(first, min(last + config.PREVIEW_LOOKAHEAD, count - 1) + 1):
+            item = self.preview_missing.get(row)
+            if item is not None:
+                self.request_preview(item)
+
+    def request_preview(self, item: Dict[str, Any]) -> None:
+        url = item['url']
+        if url in self.preview_pending or url in self.preview_failed:
+            return
+        self.preview_pending.add(url)
+        runnable = PreviewRunnable(url, self.preview_cache, item.get('info'))
+        runnable.signals.preview_ready.connect(self.on_preview_ready)
+        runnable.signals.preview_failed.connect(self.on_preview_failed)
+        self.preview_pool.start(runnable)
+
+    def on_preview_ready(self, url: str, title: str, image: Optional[QImage]) -> None:
+        # Обновляем только строки этого URL, не перестраивая список
+        self.preview_pending.discard(url)
+        icon = QIcon(QPixmap.fromImage(image)) if image is not None else None
+        for index, list_item, item, is_active in self.preview_rows.pop(url, []):
+            if title and not item.get('title'):
+                item['title'] = title
+            list_item.setText(self.queue_item_text(index, item, is_active))
+            if icon is not None:
+                list_item.setIcon(icon)
+
+    def on_preview_failed(self, url: str) -> None:
+        # Повторно в этом сеансе не запрашиваем
+        self.preview_pending.discard(url)
+        self.preview_failed.add(url)
+
+    def on_queue_rows_moved(self, _parent, start: int, _end: int, _destination, row: int) -> None:
+        """Переносит ручную перестановку из списка в очередь загрузок."""
+        new_row = row if row < start else row - 1
+        moved = self.queue_list.item(new_row)
+        if moved is None:
+            return
+        offset = len(self.download_manager.active_downloads)
+        self.download_manager.move_in_queue(moved.data(Qt.ItemDataRole.UserRole), max(0, new_row - offset))
+        # Отложенное обновление: нельзя очищать список внутри обработки перетаскивания
+        QTimer.singleShot(0, self.update_queue_display)
+        self.schedule_prefetch()
+
+    def on_queue_policy_changed(self, shortest_first: bool) -> None:
+        policy = QueuePolicy.SHORTEST_FIRST if shortest_first else QueuePolicy.FIFO
+        self.download_manager.set_queue_policy(policy)
+        self.update_queue_display()
+        self.save_settings()
+        self.schedule_prefetch()
+
+    def schedule_prefetch(self) -> None:
+        """Запускает получение метаданных для ближайших элементов очереди."""
+        if self.download_manager.job_store is not None:
+            return
+        for item in self.download_manager.prefetch_candidates():
+            item['prefetching'] = True
+            runnable = MetadataRunnable(item['id'], item['url'])
+            runnable.signals.metadata_ready.connect(self.on_metadata_ready)
+            runnable.signals.metadata_failed.connect(self.on_metadata_failed)
+            self.prefetch_pool.start(runnable)
+
+    def on_metadata_ready(self, item_id: int, info: Dict[str, Any]) -> None:
+        self.download_manager.on_metadata_ready(item_id, info)
+        self.update_queue_display()
+        # Порядок SJF мог измениться — проверяем, кто теперь среди ближайших
+        self.schedule_prefetch()
+
+    def on_metadata_failed(self, item_id: int, _error: str) -> None:
+        self.download_manager.on_metadata_failed(item_id)
 
     def start_downloads(self) -> None:
         if not self.download_manager.download_queue:
-            QMessageBox.information(self, "Информация", "Очередь загрузок пуста")
+            if not self.download_manager.active_downloads:
+                QMessageBox.information(self, "Информация", "Очередь загрузок пуста")
             return
 
         self.set_controls_enabled(False)
-        download_runnable = self.download_manager.process_queue()
-        if download_runnable:
-            download_runnable.signals.progress.connect(self.update_progress)
-            download_runnable.signals.finished.connect(self.on_download_finished)
-            self.thread_pool.start(download_runnable)
-            # Обновляем отображение очереди сразу после запуска загрузки
+        if self.download_manager.job_store is not None:
+            try:
+                self.download_manager.submit_queue_to_job_store()
+            except JobStoreError as e:
+                QMessageBox.warning(self, "Ошибка", f"Не удалось передать задания на сервер: {e}")
+                self.set_controls_enabled(True)
             self.update_queue_display()
+            self.job_poll_timer.start()
+            return
+
+        # Заполняем все свободные слоты
+        while True:
+            download_runnable = self.download_manager.process_queue()
+            if download_runnable is None:
+                break
+            item_id = download_runnable.item_id
+            download_runnable.signals.progress.connect(
+                lambda status, percent, item_id=item_id: self.update_progress(item_id, status, percent)
+            )
+            download_runnable.signals.finished.connect(
+                lambda success, message, filename, item_id=item_id:
+                    self.on_download_finished(item_id, success, message, filename)
+            )
+            if self.settings.get("process_isolation", config.PROCESS_ISOLATION):
+                if self.process_pool is None:
+                    self.process_pool = ProcessDownloadPool(self.download_manager.max_concurrent)
+                self.process_pool.start(download_runnable)
+            else:
+                self.thread_pool.start(download_runnable)
+        if self.download_manager.concurrency is not None and self.download_manager.active_downloads:
+            if not self.concurrency_timer.isActive():
+                self.concurrency_timer.start()
+        if self.download_manager.download_queue.deferred_count():
+            # Отложенные из-за нехватки места элементы проверяются по таймеру, а не при каждом запуске
+            if not self.space_retry_timer.isActive():
+                self.space_retry_timer.start()
+            if not self.download_manager.active_downloads and not self.download_manager.download_queue.ready_count():
+                self.status_label.setText("Недостаточно места на дисках, загрузки отложены")
+                self.status_label.setStyleSheet("color: orange;")
+                self.set_controls_enabled(True)
+        # Обновляем отображение очереди сразу после запуска загрузки
+        self.update_queue_display()
+        self.schedule_prefetch()
+
+    def on_concurrency_timer(self) -> None:
+        if self.download_manager.tune_concurrency() and self.download_manager.download_queue:
+            self.start_downloads()
+
+    def retry_deferred_downloads(self) -> None:
+        if self.download_manager.retry_deferred():
+            self.start_downloads()
+
+    def update_progress(self, item_id: int, status: str, percent: float) -> None:
+        active = self.download_manager.active_downloads.get(item_id)
+        if active is None:
+            return
+        item = active[0]
+        item['progress'] = percent
+        row = self.queue_rows.get(item_id)
+        if row is not None:
+            row[1].setText(self.queue_item_text(row[0], item, True))
 
-    def update_progress(self, status: str, percent: float) -> None:
         self.status_label.setText(status)
-        if percent >= 0:
-            self.progress_bar.setValue(int(percent))
+        # Общий прогресс — среднее по активным загрузкам с известным размером
+        known = [active_item['progress'] for active_item, _ in self.download_manager.active_downloads.values()
+                 if active_item.get('progress', -1) >= 0]
+        if known:
+            self.progress_bar.setRange(0, 100)
+            self.progress_bar.setValue(int(sum(known) / len(known)))
         else:
             # Если процент отрицательный, показываем неопределенный прогресс
             self.progress_bar.setRange(0, 0)
-        # Уменьшаем частоту вызовов processEvents, чтобы не нарушать основной цикл событий
-        # Вызываем только раз в 5 обновлений
-        self.progress_update_counter = getattr(self, 'progress_update_counter', 0) + 1
-        if self.progress_update_counter % 5 == 0:
-            QApplication.processEvents()
-
-    def on_download_finished(self, success: bool, message: str, filename: str) -> None:
-        self.download_manager.on_download_finished(success, message, filename)
-        self.update_queue_display()
 
-        if not self.download_manager.download_queue:
+    def on_download_finished(self, item_id: int, success: bool, message: str, filename: str) -> None:
+        if self.download_manager.on_download_finished(item_id, success, message, filename):
+            self.start_verifications()
+            self.on_slot_released()
+
+    def start_verifications(self) -> None:
+        for item_id, item, path, expected in self.download_manager.take_verifications():
+            runnable = VerifyRunnable(item_id, item, path, expected)
+            runnable.signals.verified.connect(
+                lambda item_id, status, detail, path=path: self.on_verified(item_id, status, detail, path)
+            )
+            self.verify_pool.start(runnable)
+
+    def on_verified(self, item_id: int, status: str, detail: str, path: str) -> None:
+        if self.download_manager.on_verified(item_id, status, detail, path):
+            self.update_queue_display()
+        self.on_slot_released()
+
+    def on_slot_released(self) -> None:
+        if not self.download_manager.active_downloads:
+            self.concurrency_timer.stop()
+        if not self.download_manager.has_pending():
+            self.update_queue_display()
+            self.progress_bar.setRange(0, 100)
             self.show_download_summary()
             self.set_controls_enabled(True)
-        else:
+        elif self.download_manager.download_queue:
             self.start_downloads()
+        elif not self.download_manager.has_queued_work():
+            # Загрузки завершены, сводка будет показана после проверки файлов
+            self.status_label.setText("Проверка загруженных файлов...")
+            self.status_label.setStyleSheet("color: #2196F3;")
 
     def show_download_summary(self) -> None:
-        summary = self.download_manager.get_download_summary()
-        if summary:
-            self.download_manager.cleanup_temp_files()
-            QMessageBox.information(self, "Загрузка завершена", summary)
+        history = self.download_manager.finish_run()
+        if len(history):
+            # Немодальное окно: окно программы остаётся доступным
+            self.summary_dialog = RunSummaryDialog(history, self)
+            self.summary_dialog.show()
 
     def cancel_download(self) -> None:
-        self.download_manager.cancel_current_download()
-        self.status_label.setText("Загрузка отменяется...")
+        # Отменяем выбранную активную загрузку, а если такой нет — все активные
+        selected = self.queue_list.currentItem()
+        selected_id = selected.data(Qt.ItemDataRole.UserRole) if selected is not None else None
+        if selected_id in self.download_manager.active_downloads:
+            cancelled = self.download_manager.cancel_download(selected_id)
+        else:
+            cancelled = self.download_manager.cancel_all_downloads()
+        if not cancelled:
+            return
+        self.status_label.setText("Загрузка отменена")
         self.status_label.setStyleSheet("color: orange;")
         self.progress_bar.setValue(0)
         self.progress_bar.setRange(0, 100)
+        # Слот освобождается сразу, не дожидаясь завершения потока загрузки
+        self.update_queue_display()
+        self.on_slot_released()
 
     def clear_queue(self) -> None:
         if not self.download_manager.download_queue:
@@ -974,9 +4620,9 @@ class VideoDownloaderUI(QMainWindow):
             self.status_label.setText("Очередь очищена")
 
     def remove_selected(self) -> None:
-        current_row = self.queue_list.currentRow()
-        if current_row >= 0:
-            self.download_manager.remove_from_queue(current_row)
+        current_item = self.queue_list.currentItem()
+        if current_item is not None:
+            self.download_manager.remove_from_queue(current_item.data(Qt.ItemDataRole.UserRole))
             self.update_queue_display()
             self.status_label.setText("Элемент удален из очереди")
 
@@ -1042,6 +4688,8 @@ class VideoDownloaderUI(QMainWindow):
 
     def on_mode_changed(self) -> None:
         is_video: bool = self.video_radio.isChecked()
+        if is_video:
+            self.probe_timer.start()
         self.resolution_combo.setVisible(is_video)
         for i in range(self.resolution_layout.count()):
             widget = self.resolution_layout.itemAt(i).widget()
@@ -1066,13 +4714,171 @@ def show_error_message(title: str, message: str) -> None:
     """
     app = QApplication.instance() or QApplication(sys.argv)
     box = QMessageBox()
+    box.setWindowIcon(app.windowIcon())
     box.setIcon(QMessageBox.Icon.Critical)
     box.setWindowTitle(title)
     box.setText(message)
     box.exec()
     sys.exit(1)
 
+def parse_arguments() -> Tuple[argparse.Namespace, List[str]]:
+    """Разбирает параметры командной строки; остальные аргументы передаются Qt."""
+    parser = argparse.ArgumentParser(description="Video Downloader")
+    parser.add_argument('--job-server', metavar='HOST:PORT', nargs='?',
+                        const=f"{DEFAULT_HOST}:{DEFAULT_PORT}",
+                        help="запустить сервер общей очереди заданий")
+    parser.add_argument('--worker', metavar='URL|DB',
+                        help="запустить фоновый обработчик для сервера заданий или базы SQLite")
+    parser.add_argument('--daemon', metavar='HOST:PORT', nargs='?',
+                        const=f"{DEFAULT_HOST}:{DEFAULT_PORT}",
+                        help="запустить службу с HTTP API и встроенными обработчиками")
+    parser.add_argument('--workers', type=int, default=config.MAX_CONCURRENT_DOWNLOADS,
+                        help="число встроенных обработчиков службы")
+    parser.add_argument('--watch', metavar='DIR', help="папка, из которой служба берёт списки URL (*.txt)")
+    parser.add_argument('--db', default=DEFAULT_DB_PATH, help="файл базы заданий для --job-server и --daemon")
+    parser.add_argument('--token', help="общий ключ доступа к серверу заданий")
+    parser.add_argument('--output-dir', default=config.OUTPUT_DIR, help="папка для загрузок обработчика")
+    parser.add_argument('--cookies-from-browser', metavar='BROWSER[:PROFILE]',
+                        help="брать cookies из браузера (chrome, firefox, edge, ...)")
+    parser.add_argument('--cookies', metavar='FILE', help="файл cookies в формате Netscape")
+    parser.add_argument('--download', metavar='URL', help="загрузить одно видео без окна программы")
+    parser.add_argument('--audio', action='store_true', help="для --download: только аудио (MP3)")
+    parser.add_argument('--resolution', default=config.DEFAULT_RESOLUTION, help="для --download: разрешение видео")
+    parser.add_argument('--start', metavar='[Ч:]ММ:СС', help="начало фрагмента для --download")
+    parser.add_argument('--end', metavar='[Ч:]ММ:СС', help="конец фрагмента для --download")
+    parser.add_argument('--exact-cut', action='store_true',
+                        help="точная обрезка фрагмента с перекодированием (по умолчанию — по ключевым кадрам)")
+    parser.add_argument('--profile', action='store_true',
+                        help="профилировать задачи (cProfile, tracemalloc, время фаз) в logs/profiles")
+    return parser.parse_known_args()
+
+def run_job_server(args: argparse.Namespace) -> None:
+    host, _, port = args.job_server.rpartition(':')
+    server = JobServer(JobStore(args.db), host or DEFAULT_HOST, int(port), args.token)
+    try:
+        server.serve()
+    except KeyboardInterrupt:
+        logger.info("Сервер заданий остановлен")
+    finally:
+        server.server_close()
+
+def warm_up_yt_dlp() -> None:
+    """Заранее инициализирует экстракторы поддерживаемых сервисов."""
+    started = time.monotonic()
+    with VideoDownloaderYDL({'quiet': True, 'no_warnings': True}) as ydl:
+        for ie_key in ('Youtube', 'VK', 'Rutube', 'Odnoklassniki', 'MailRu'):
+            try:
+                ydl.get_info_extractor(ie_key)
+            except Exception as e:
+                logger.warning(f"Экстрактор {ie_key} недоступен: {e}")
+    logger.info(f"yt-dlp инициализирован за {time.monotonic() - started:.2f} с")
+
+def run_daemon(args: argparse.Namespace) -> None:
+    """
+    Служба: сервер заданий с HTTP API (POST /jobs, GET /jobs/{id},
+    POST /jobs/{id}/cancel, GET /events) и встроенными обработчиками,
+    которым не нужно заново импортировать yt-dlp для каждого запуска.
+    """
+    if not check_ffmpeg():
+        logger.warning("ffmpeg/ffprobe не найдены: объединение и конвертация будут недоступны")
+    cookie_cache.configure(args.cookies_from_browser, args.cookies)
+    warm_up_yt_dlp()
+
+    store = JobStore(args.db)
+    host, _, port = args.daemon.rpartition(':')
+    server = JobServer(store, host or DEFAULT_HOST, int(port), args.token)
+    stop_event = threading.Event()
+
+    def execute(job: Dict[str, Any], report, cancel_event: threading.Event) -> Tuple[bool, str, str]:
+        return execute_farm_job(job, report, cancel_event, args.output_dir)
+
+    threads = [
+        threading.Thread(
+            target=run_worker, name=f"daemon-worker-{i}", daemon=True,
+            args=(store, execute, f"{default_worker_id()}-{i}"),
+            kwargs={'stop_event': stop_event, 'poll_interval': 1.0, 'heartbeat_interval': 1.0}
+        )
+        for i in range(max(1, args.workers))
+    ]
+    if args.watch:
+        threads.append(threading.Thread(
+            target=watch_drop_folder, name="drop-folder", daemon=True,
+            args=(store, args.watch, stop_event),
+            kwargs={'validate': lambda url: VideoURL.is_valid(url)[0]}
+        ))
+    for thread in threads:
+        thread.start()
+    try:
+        server.serve()
+    except KeyboardInterrupt:
+        logger.info("Служба останавливается")
+    finally:
+        stop_event.set()
+        server.server_close()
+
+def run_farm_worker(args: argparse.Namespace) -> None:
+    if not check_ffmpeg():
+        logger.warning("ffmpeg/ffprobe не найдены: объединение и конвертация будут недоступны")
+    cookie_cache.configure(args.cookies_from_browser, args.cookies)
+    store = open_job_store(args.worker, args.token)
+    try:
+        run_worker(store, lambda job, report, cancel_event: execute_farm_job(
+            job, report, cancel_event, args.output_dir))
+    except KeyboardInterrupt:
+        logger.info("Обработчик остановлен")
+
+def run_single_download(args: argparse.Namespace) -> bool:
+    """Загружает один URL (--download) в текущем процессе и выводит прогресс в лог."""
+    try:
+        clip = parse_clip_range(args.start, args.end)
+    except ValueError as e:
+        logger.error(f"Некорректный фрагмент: {e}")
+        return False
+    is_valid, error_message = VideoURL.is_valid(args.download)
+    if not is_valid:
+        logger.error(f"Некорректный URL {args.download}: {error_message}")
+        return False
+    cookie_cache.configure(args.cookies_from_browser, args.cookies)
+    mode = DownloadMode.AUDIO.value if args.audio else DownloadMode.VIDEO.value
+    job = {
+        'id': 0, 'url': args.download, 'mode': mode,
+        'resolution': None if args.audio else args.resolution,
+        'clip_start': clip[0] if clip else None, 'clip_end': clip[1] if clip else None,
+        'exact_cut': args.exact_cut,
+    }
+    last_report = [0.0]
+
+    def report(status: str, _percent: float) -> None:
+        if time.monotonic() - last_report[0] >= 1:
+            last_report[0] = time.monotonic()
+            logger.info(status)
+
+    cancel_event = threading.Event()
+    try:
+        success, message, filename = execute_farm_job(job, report, cancel_event, args.output_dir)
+    except KeyboardInterrupt:
+        cancel_event.set()
+        return False
+    logger.info(f"{message}: {filename}" if success else message)
+    return success
+
 if __name__ == '__main__':
+    # Нужен для дочерних процессов загрузки в сборке PyInstaller
+    multiprocessing.freeze_support()
+    cli_args, qt_args = parse_arguments()
+    job_profiler.set_enabled(cli_args.profile)
+    if cli_args.daemon:
+        run_daemon(cli_args)
+        sys.exit(0)
+    if cli_args.job_server:
+        run_job_server(cli_args)
+        sys.exit(0)
+    if cli_args.worker:
+        run_farm_worker(cli_args)
+        sys.exit(0)
+    if cli_args.download:
+        sys.exit(0 if run_single_download(cli_args) else 1)
+
     # Проверка наличия ffmpeg и ffprobe перед запуском
     if not check_ffmpeg():
         error_message = (
@@ -1086,7 +4892,7 @@ if __name__ == '__main__':
         )
         show_error_message("Отсутствуют необходимые компоненты", error_message)
     
-    app = QApplication(sys.argv)
+    app = QApplication(sys.argv[:1] + qt_args)
     
     # Установка иконки для всего приложения
     success, pixmap, _ = load_app_logo((32, 32), True)
@@ -1097,42 +4903,13 @@ if __name__ == '__main__':
     
     window = VideoDownloaderUI()
     window.show()
+    if config.EVENT_LOOP_MONITOR:
+        event_loop_monitor = EventLoopMonitor(config.EVENT_LOOP_INTERVAL_MS, config.EVENT_LOOP_STALL_MS,
+                                              config.EVENT_LOOP_REPORT_INTERVAL)
+        app.aboutToQuit.connect(event_loop_monitor.stop)
+        event_loop_monitor.start()
     sys.exit(app.exec())
 
-class DownloadQueue:
-    def __init__(self):
-        self.queue: List[Dict[str, Any]] = []
-        self.executor = ThreadPoolExecutor(max_workers=3)
-        
-    async def process_queue(self):
-        while self.queue:
-            download = self.queue[0]
-            try:
-                await self.process_download(download)
-            except Exception as e:
-                logger.exception(f"Error processing download: {e}")
-            self.queue.pop(0)
-            
-    async def process_download(self, download: Dict[str, Any]):
-        # Асинхронная обработка загрузки
-        pass
-
-class ResolutionCache:
-    def __init__(self, ttl: int = 3600):  # TTL в секундах
-        self.cache: Dict[str, Tuple[List[str], float]] = {}
-        self.ttl = ttl
-        
-    def get(self, url: str) -> Optional[List[str]]:
-        if url in self.cache:
-            resolutions, timestamp = self.cache[url]
-            if time.time() - timestamp < self.ttl:
-                return resolutions
-            del self.cache[url]
-        return None
-        
-    def set(self, url: str, resolutions: List[str]) -> None:
-        self.cache[url] = (resolutions, time.time())
-
 class VideoServicePlugin(ABC):
     @abstractmethod
     def can_handle(self, url: str) -> bool: